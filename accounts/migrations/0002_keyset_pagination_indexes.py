@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-17 22:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('cards', '0017_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', '-created_at', 'id'], name='activity_user_created_id_idx'),
+        ),
+    ]
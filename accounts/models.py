@@ -99,6 +99,8 @@ class UserActivity(models.Model):
     class Meta:
         verbose_name_plural = 'User Activities'
         ordering = ['-created_at']
+        # Keyset pagination of a user's activity, newest first
+        indexes = [models.Index(fields=['user', '-created_at', 'id'], name='activity_user_created_id_idx')]
 
 
 @receiver(post_save, sender=User)
@@ -1,16 +1,17 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from indiacard_backend.profiling import ProfiledSerializerMixin
 from .models import UserProfile, UserCreditCard, UserPreferences, UserActivity
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name')
         read_only_fields = ('id',)
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
@@ -19,7 +20,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'user', 'created_at', 'updated_at')
 
 
-class UserCreditCardSerializer(serializers.ModelSerializer):
+class UserCreditCardSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     credit_card_details = serializers.SerializerMethodField()
     
     class Meta:
@@ -32,7 +33,7 @@ class UserCreditCardSerializer(serializers.ModelSerializer):
         return CreditCardSerializer(obj.credit_card).data
 
 
-class UserPreferencesSerializer(serializers.ModelSerializer):
+class UserPreferencesSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     preferred_banks_details = serializers.SerializerMethodField()
     
     class Meta:
@@ -45,7 +46,7 @@ class UserPreferencesSerializer(serializers.ModelSerializer):
         return BankSerializer(obj.preferred_banks.all(), many=True).data
 
 
-class UserActivitySerializer(serializers.ModelSerializer):
+class UserActivitySerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     credit_card_details = serializers.SerializerMethodField()
     
     class Meta:
@@ -6,6 +6,7 @@ from django.shortcuts import get_object_or_404
 from django_filters import rest_framework as filters
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from indiacard_backend.pagination import KeysetPagination
 from .models import UserProfile, UserCreditCard, UserPreferences, UserActivity
 from .serializers import (
     UserSerializer, UserProfileSerializer, UserCreditCardSerializer,
@@ -92,7 +93,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return UserProfile.objects.filter(user=self.request.user)
+        return UserProfile.objects.filter(user=self.request.user).select_related('user')
     
     def perform_update(self, serializer):
         instance = serializer.save()
@@ -117,7 +118,8 @@ class UserCreditCardViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return UserCreditCard.objects.filter(user=self.request.user)
+        # Card details are whole CreditCardSerializer payloads, served from the catalog snapshot
+        return UserCreditCard.objects.filter(user=self.request.user).select_related('credit_card')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -156,7 +158,7 @@ class UserPreferencesViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return UserPreferences.objects.filter(user=self.request.user)
+        return UserPreferences.objects.filter(user=self.request.user).prefetch_related('preferred_banks')
     
     def perform_update(self, serializer):
         instance = serializer.save()
@@ -175,9 +177,12 @@ class UserActivityViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['description']
     ordering_fields = ['created_at']
     ordering = ['-created_at']
+    # Activity grows without bound, so pages are keyed on (-created_at, id) rather than counted
+    pagination_class = KeysetPagination
     queryset = UserActivity.objects.all()
     serializer_class = UserActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return UserActivity.objects.filter(user=self.request.user)
+        # Card details are whole CreditCardSerializer payloads, served from the catalog snapshot
+        return UserActivity.objects.filter(user=self.request.user).select_related('credit_card')
@@ -0,0 +1,80 @@
+"""
+Purchase advisor: which of the user's cards to pay with for each purchase.
+
+Rules come from the same compiled rule index as the recommender. A rule only
+applies when the purchase meets its min_transaction_amount and has monthly cap
+left; otherwise the next, less specific rule of the hierarchy is tried, down to
+the default cashback. Rules without a cashback percent are never candidates. A rule with an explicit 0%
+excludes the purchase from cashback. Cashback is limited by the rule's
+max_cashback_per_transaction and by its monthly_cap, which is shared by all
+purchases of one request (0 or None means uncapped).
+"""
+from .utils import format_spend_label, get_rule_index, spend_match_key
+
+
+def advise_purchases(cards, purchases):
+    """
+    Ranks the given cards for each purchase (a validated spend entry) by cashback.
+    Monthly caps are drawn down in purchase order by the best card of each purchase.
+    """
+    cap_usage = {}
+    results = []
+    total_cashback = 0.0
+    for purchase_index, purchase in enumerate(purchases):
+        amount = float(purchase.get('amount') or 0)
+        key = spend_match_key(purchase)
+        options = []
+        for card in cards:
+            option = _card_option(card, key, amount, cap_usage)
+            if option is not None:
+                options.append(option)
+        # Highest cashback first; the stable sort keeps card order between ties
+        options.sort(key=lambda option: (-option[1]['cashbackAmount'], -option[1]['cashbackPercent']))
+        if options:
+            best_usage_key, best = options[0]
+            if best_usage_key is not None:
+                cap_usage[best_usage_key] = cap_usage.get(best_usage_key, 0) + best['cashbackAmount']
+            total_cashback += best['cashbackAmount']
+        results.append({
+            'purchaseIndex': purchase_index,
+            'spendLabel': format_spend_label(purchase),
+            'amount': amount,
+            'bestCardId': options[0][1]['cardId'] if options else None,
+            'options': [option for _, option in options],
+        })
+    return {'purchases': results, 'totalCashback': round(total_cashback, 2)}
+
+
+def _card_option(card, key, amount, cap_usage):
+    # Returns (monthly cap usage key or None, option) for the card's best applicable rule, or None
+    for rule in get_rule_index(card).candidates(key):
+        if amount < (rule.min_transaction_amount or 0):
+            continue
+        cashback_percent = rule.cashback_percent
+        if cashback_percent <= 0:
+            return None
+        cashback = round(amount * cashback_percent / 100, 2)
+        limits = []
+        max_per_transaction = getattr(rule, 'max_cashback_per_transaction', None)
+        if max_per_transaction:
+            limits.append(max_per_transaction)
+        usage_key = None
+        if rule.monthly_cap:
+            usage_key = (card.id, type(rule).__name__, rule.pk)
+            limits.append(max(rule.monthly_cap - cap_usage.get(usage_key, 0), 0))
+        capped = bool(limits) and min(limits) < cashback
+        if capped:
+            cashback = round(min(limits), 2)
+        if cashback <= 0:
+            # Monthly cap used up (or a zero amount)
+            continue
+        return usage_key, {
+            'cardId': card.id,
+            'cardName': card.card_name,
+            'bank': card.bank.name,
+            'cashbackPercent': cashback_percent,
+            'cashbackAmount': cashback,
+            'capped': capped,
+            'additionalConditions': getattr(rule, 'additional_conditions', None) or '',
+        }
+    return None
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cards'
+
+    def ready(self):
+        from .signals import connect_catalog_signals
+        connect_catalog_signals()
@@ -0,0 +1,81 @@
+"""
+Loads the card catalog together with every relation the recommendation engine and
+CreditCardSerializer read, so a request costs a fixed number of queries however
+many cards there are.
+"""
+from .models import CreditCard
+
+# One-to-one and foreign-key relations, joined into the main query
+CATALOG_SELECT_RELATED = (
+    'bank', 'default_cashback', 'fee_waiver', 'reward_point_conversion',
+    'fees_and_charges', 'eligibility_criteria', 'highlight', 'value_summary',
+)
+# Reverse foreign-key and many-to-many relations, one extra query each
+CATALOG_PREFETCH_RELATED = (
+    'cashback_rules', 'reward_multipliers', 'welcome_benefits', 'milestone_bonuses',
+    'card_benefits', 'filters',
+)
+# The relation each CreditCardSerializer field reads; fields not listed come from the card row
+CARD_FIELD_RELATIONS = {
+    'bank': 'bank', 'issuer': 'bank', 'highlight': 'highlight',
+    'fee_waiver': 'fee_waiver', 'reward_point_conversion': 'reward_point_conversion',
+    'default_cashback': 'default_cashback', 'fees_and_charges': 'fees_and_charges',
+    'eligibility_criteria': 'eligibility_criteria', 'cashback_rules': 'cashback_rules',
+    'reward_multipliers': 'reward_multipliers', 'welcome_benefits': 'welcome_benefits',
+    'milestone_bonuses': 'milestone_bonuses', 'card_benefits': 'card_benefits', 'filters': 'filters',
+}
+
+
+def catalog_queryset(queryset=None, relations=None):
+    """
+    Returns the given CreditCard queryset (all cards by default) with the catalog relations
+    loaded, or only those named in `relations` when it is given.
+    """
+    if queryset is None:
+        queryset = CreditCard.objects.all()
+    select_related, prefetch_related = _relation_lookups(relations)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+def catalog_lookups(path, relations=None):
+    """
+    Returns the (select_related, prefetch_related) lookups that load the card at the given
+    relation path (e.g. 'credit_card') with its catalog relations, for querysets of other models.
+    """
+    select_related, prefetch_related = _relation_lookups(relations)
+    return (
+        (path, *(f'{path}__{relation}' for relation in select_related)),
+        tuple(f'{path}__{relation}' for relation in prefetch_related),
+    )
+
+
+def card_field_relations(fields):
+    """
+    Returns the catalog relations the given CreditCardSerializer fields read. With fields
+    None the whole payload is served from the catalog snapshot (see cards.payloads), so
+    only the card rows are needed and no relation is returned.
+    """
+    if fields is None:
+        return set()
+    return {CARD_FIELD_RELATIONS[name] for name in fields if name in CARD_FIELD_RELATIONS}
+
+
+def _relation_lookups(relations):
+    if relations is None:
+        return CATALOG_SELECT_RELATED, CATALOG_PREFETCH_RELATED
+    return (
+        tuple(relation for relation in CATALOG_SELECT_RELATED if relation in relations),
+        tuple(relation for relation in CATALOG_PREFETCH_RELATED if relation in relations),
+    )
+
+
+def load_catalog():
+    """
+    Returns every card with its relations loaded, in
+    1 + len(CATALOG_PREFETCH_RELATED) queries.
+    """
+    return list(catalog_queryset())
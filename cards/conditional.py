@@ -0,0 +1,77 @@
+"""
+Conditional GET for the catalog read endpoints.
+
+Successful GET and HEAD responses carry an ETag made from the catalog version
+(see cards.snapshot.get_catalog_stamp) and a salt that changes with the response
+format, so a request whose If-None-Match still matches is answered with 304 Not
+Modified before the view runs. The request is not validated first: that is
+sound because error responses carry no ETag, and a URL that succeeded under a
+catalog version and format gives the same response again. Responses also get
+the Cache-Control directives configured for their URL name in
+settings.CATALOG_CACHE_CONTROL (CATALOG_CACHE_CONTROL_DEFAULT otherwise).
+"""
+import hashlib
+from functools import cache, wraps
+from importlib import import_module
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .snapshot import get_catalog_stamp
+
+SAFE_METHODS = ('GET', 'HEAD')
+# Modules whose code shapes the tagged responses
+FORMAT_MODULES = ('cards.serializers', 'cards.views', 'indiacard_backend.pagination', 'indiacard_backend.fastjson')
+
+
+@cache
+def etag_salt():
+    """
+    Returns settings.CATALOG_ETAG_SALT (e.g. a release id) or, when it is None, a
+    hash of the FORMAT_MODULES sources, so a deploy changing the response format
+    retires the tags clients hold.
+    """
+    salt = getattr(settings, 'CATALOG_ETAG_SALT', None)
+    if salt is None:
+        digest = hashlib.sha256()
+        for name in FORMAT_MODULES:
+            digest.update(Path(import_module(name).__file__).read_bytes())
+        salt = digest.hexdigest()[:12]
+    return salt
+
+
+def catalog_etag(request, *args, **kwargs):
+    return f'"catalog-{etag_salt()}-{get_catalog_stamp()}"'
+
+
+def cache_control_for(url_name):
+    """
+    Returns the Cache-Control directives (patch_cache_control keyword arguments) of a URL name.
+    """
+    policies = getattr(settings, 'CATALOG_CACHE_CONTROL', {})
+    return policies.get(url_name, getattr(settings, 'CATALOG_CACHE_CONTROL_DEFAULT', {}))
+
+
+def catalog_conditional(view):
+    """
+    Decorates a view (or a view class's dispatch, through method_decorator) serving catalog data.
+    Other methods than GET and HEAD are passed through untouched.
+    """
+    conditional_view = condition(etag_func=catalog_etag)(view)
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view(request, *args, **kwargs)
+        response = conditional_view(request, *args, **kwargs)
+        if response.status_code >= 400:
+            del response['ETag']
+        else:
+            url_name = request.resolver_match.url_name if request.resolver_match else None
+            patch_cache_control(response, **cache_control_for(url_name))
+            # The browsable API shares the URLs (and ETags) of the JSON responses
+            patch_vary_headers(response, ('Accept',))
+        return response
+    return wrapped
@@ -0,0 +1,159 @@
+"""
+Top-N search for card groups over a cards x spends savings matrix.
+
+Within a group every spend goes to the first card (in catalog order) with the
+highest positive saving, and a card only counts towards the group if it wins at
+least one spend. The search therefore only needs to look at "self-contributing"
+sets of cards, where every member wins a spend:
+
+* a card that cannot beat the current members on any spend never contributes,
+  so it is not branched on (it can only fill an empty slot in the group),
+* once a member stops winning spends it never wins them back, so the whole
+  subtree is dropped,
+* each branch is bounded by the sum of the members' best savings plus the best
+  marginal gains of the remaining candidates, and cut when it cannot reach the
+  current top-N.
+
+Small catalogs are searched exhaustively with itertools.combinations instead.
+"""
+from bisect import insort
+from itertools import combinations
+from math import comb
+
+import numpy as np
+
+# Above this many combinations the branch-and-bound search is used
+EXHAUSTIVE_LIMIT = 500
+# Slack for float comparisons between bounds and scored net benefits
+EPSILON = 1e-6
+
+
+def find_top_groups(savings, fixed_benefits, group_size, score_group, top_n=5, floor=0.0,
+                    exhaustive_limit=EXHAUSTIVE_LIMIT, stats=None):
+    """
+    Returns up to top_n distinct group results, best net benefit first (ties broken by card order).
+
+    savings is the (cards, spends) matrix, fixed_benefits the per-card net benefit
+    excluding cashback (welcome, milestone and other benefits minus the fee).
+    score_group(members) receives sorted row indices and returns
+    (contributing_rows, result) or None, result carrying a 'netBenefit'.
+    Groups whose net benefit is not above zero or is below floor are dropped.
+    When a stats dict is given, the number of groups scored and branches pruned is added to it.
+    """
+    card_count = savings.shape[0]
+    if stats is None:
+        stats = {}
+    stats.setdefault('scored', 0)
+    stats.setdefault('pruned', 0)
+    if group_size < 2 or card_count < group_size:
+        return []
+    if comb(card_count, group_size) <= exhaustive_limit:
+        scored = _exhaustive_search(card_count, group_size, score_group, stats)
+    else:
+        scored = _branch_and_bound(savings, np.asarray(fixed_benefits, dtype=float), group_size,
+                                   score_group, top_n, floor, stats)
+    scored = [entry for entry in scored if entry[2]['netBenefit'] > 0 and entry[2]['netBenefit'] >= floor]
+    scored.sort(key=lambda entry: _rank(entry[0], entry[1]))
+    return [result for _, _, result in scored[:top_n]]
+
+
+def _rank(net_benefit, members):
+    # Sort key of a scored group: best net benefit first, ties broken by card order
+    return (-net_benefit, members)
+
+
+def _exhaustive_search(card_count, group_size, score_group, stats):
+    scored = {}
+    for members in combinations(range(card_count), group_size):
+        stats['scored'] += 1
+        outcome = score_group(members)
+        if outcome is None:
+            continue
+        contributing, result = outcome
+        key = tuple(contributing)
+        if key not in scored:
+            scored[key] = (result['netBenefit'], key, result)
+    return list(scored.values())
+
+
+def _branch_and_bound(savings, fixed_benefits, group_size, score_group, top_n, floor, stats):
+    card_count, spend_count = savings.shape
+    rows = np.arange(card_count)
+    # Cards that save nothing anywhere never contribute; they can only fill empty slots
+    candidates = np.flatnonzero(savings.max(axis=1) > 0)
+    # Explore the most promising cards first so good groups are found early
+    potential = savings[candidates].sum(axis=1) + fixed_benefits[candidates]
+    candidates = candidates[np.argsort(-potential, kind='stable')]
+
+    top = []  # _rank keys of the best top_n groups so far, best first
+    results = {}
+
+    def threshold():
+        if len(top) < top_n:
+            return max(floor, 0.0)
+        return max(floor, -top[-1][0])
+
+    def owners(best, members):
+        # Row index of the first (lowest-index) member holding each spend's best saving, -1 when none
+        owner = np.full(spend_count, -1)
+        for row in sorted(members, reverse=True):
+            owner = np.where((savings[row] == best) & (best > 0), row, owner)
+        return owner
+
+    def steals(best, owner, row_indices):
+        # Whether each card would win at least one spend if added to the current members
+        block = savings[row_indices]
+        ties = (block == best) & (best > 0) & (row_indices[:, None] < owner)
+        return ((block > best) | ties).any(axis=1)
+
+    def visit(members, best, owner, fixed, remaining):
+        slots = group_size - len(members)
+        base = best.sum() + fixed
+        if members and base + EPSILON >= threshold():
+            fillers = 0
+            if slots:
+                others = np.setdiff1d(rows, members, assume_unique=True)
+                fillers = int((~steals(best, owner, others)).sum())
+            if fillers >= slots:
+                record(members)
+        if not slots or not len(remaining):
+            return
+        stealing = remaining[steals(best, owner, remaining)]
+        if not len(stealing):
+            return
+        gains = np.maximum(savings[stealing] - best, 0).sum(axis=1) + fixed_benefits[stealing]
+        upper_bound = base + np.sort(np.maximum(gains, 0))[::-1][:slots].sum()
+        if upper_bound + EPSILON < threshold():
+            stats['pruned'] += 1
+            return
+        for position, row in enumerate(stealing):
+            child = members + (row,)
+            child_best = np.maximum(best, savings[row])
+            child_owner = owners(child_best, child)
+            # Every member must keep winning a spend; once one stops, no superset is self-contributing
+            if not np.isin(child, child_owner).all():
+                stats['pruned'] += 1
+                continue
+            visit(child, child_best, child_owner, fixed + fixed_benefits[row], stealing[position + 1:])
+
+    def record(members):
+        ordered = tuple(sorted(int(row) for row in members))
+        if ordered in results:
+            return
+        stats['scored'] += 1
+        outcome = score_group(ordered)
+        if outcome is None:
+            return
+        contributing, result = outcome
+        if tuple(contributing) != ordered:
+            return
+        net_benefit = result['netBenefit']
+        results[ordered] = (net_benefit, ordered, result)
+        rank = _rank(net_benefit, ordered)
+        if len(top) < top_n or rank < top[-1]:
+            insort(top, rank)
+            del top[top_n:]
+
+    visit((), np.zeros(spend_count), np.full(spend_count, -1), 0.0, candidates)
+    kept = {members for _, members in top}
+    return [entry for entry in results.values() if entry[1] in kept]
@@ -0,0 +1,464 @@
+"""
+Bulk, incremental catalog import for the import_cards_v2 JSON format.
+
+Import runs in two passes over each batch of entries. First every entry is
+parsed and validated into unsaved model instances, without touching the
+database; entries that fail are reported with their error and left out as a
+whole. Then the valid cards are synced into the database with bulk writes.
+The import command runs all batches in one transaction, so a failed run
+leaves no partial cards behind.
+
+Cards are identified by bank and card name. Each card stores a fingerprint
+of the normalized JSON it was written from: cards whose fingerprint matches
+are skipped, changed cards are updated in place (child rows are diffed by
+their natural key, so ids that users' cards point at survive), new cards are
+bulk-inserted and, on a full sync, cards missing from the file are marked
+discontinued. Writes bypass the model signals, so value summaries are refreshed
+per batch and the catalog version is bumped once per transaction (through
+signals.schedule_catalog_change), and only when something changed.
+
+card_ids_by_name() resolves the card names of files that attach data to
+existing cards (highlights, fee waivers) in bulk.
+"""
+import hashlib
+import json
+import re
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    CardImportFingerprint, CardTag, CashbackRule, CreditCard, DefaultCashback, RewardPointConversion, Tag
+)
+from .signals import schedule_catalog_change
+from .valuation import refresh_card_value_summaries
+
+# Rows per INSERT statement
+BATCH_SIZE = 500
+
+# A validated card entry: the unsaved card, its unsaved child rows, its tag names
+# and the fingerprint of the entry's JSON
+ParsedCard = namedtuple('ParsedCard', ['card', 'children', 'tags', 'digest'])
+
+# What a sync did: lists of created, updated and unchanged cards, and of the extra
+# rows of duplicated card names that were discontinued
+SyncResult = namedtuple('SyncResult', ['created', 'updated', 'unchanged', 'duplicates'])
+
+# Card fields written by the import
+CARD_FIELDS = ('card_type', 'variant', 'network', 'status', 'annual_fee', 'waiver_on_spend', 'effective_annual_fee',
+               'image_url', 'apply_url', 'summary')
+
+# Child rows a card may have, with the fields that identify a row among its card's rows.
+# One-to-one rows have no key: a card has at most one.
+CHILD_KEYS = {
+    RewardPointConversion: (),
+    DefaultCashback: (),
+    CashbackRule: ('category', 'subcategory', 'platform', 'brand', 'spending_type', 'platform_type', 'payment_app'),
+}
+
+
+class CardImportError(ValueError):
+    pass
+
+
+def parse_card_v2(card_data, bank):
+    """
+    Builds and validates the unsaved rows of one import_cards_v2 entry.
+    Raises CardImportError describing the first problem found.
+    """
+    if not isinstance(card_data, dict):
+        raise CardImportError('Expected a JSON object.')
+    try:
+        card_name = card_data['card_name']
+        card_type = card_data['card_type']
+    except KeyError as exc:
+        raise CardImportError(f'Missing field {exc.args[0]!r}.')
+
+    # Handle waiver_on_spend which can be a dictionary
+    waiver_on_spend = card_data.get('waiver_on_spend')
+    if isinstance(waiver_on_spend, dict):
+        # Use renewal amount if available, otherwise first_year
+        waiver_on_spend = waiver_on_spend.get('renewal') or waiver_on_spend.get('first_year', 0)
+
+    annual_fee = card_data.get('annual_fee')
+    if annual_fee is None:
+        annual_fee = 0
+    effective_annual_fee = card_data.get('effective_annual_fee')
+    if effective_annual_fee is None:
+        effective_annual_fee = annual_fee
+
+    card = CreditCard(
+        card_name=card_name,
+        bank=bank,
+        card_type=card_type,
+        variant=card_data.get('variant'),
+        network=card_data.get('network', []),
+        status=card_data.get('status', 1),
+        annual_fee=annual_fee,
+        waiver_on_spend=waiver_on_spend,
+        effective_annual_fee=effective_annual_fee,
+        image_url=card_data.get('image_url'),
+        apply_url=card_data.get('apply_url'),
+        summary=card_data.get('summary')
+    )
+    children = {model: [] for model in CHILD_KEYS}
+
+    rpc_data = _expect(card_data.get('reward_point_conversion'), dict, 'reward_point_conversion')
+    if rpc_data:
+        conversion_rate = rpc_data.get('conversion_rate')
+        # Handle both number and dictionary conversion rates
+        if not isinstance(conversion_rate, dict):
+            conversion_rate = {'Cashback': conversion_rate or 0}
+        min_points_required = rpc_data.get('min_points_required')
+        if min_points_required is None:
+            min_points_required = 0
+        conversion_description = rpc_data.get('conversion_description')
+        if conversion_description is None:
+            # Generate a default description based on conversion rate
+            conversion_description = '; '.join(
+                f'1 Point = ₹{value} for {key}' for key, value in conversion_rate.items()
+            )
+        children[RewardPointConversion].append(RewardPointConversion(
+            conversion_rate=conversion_rate,
+            min_points_required=min_points_required,
+            conversion_description=conversion_description
+        ))
+
+    dc_data = _expect(card_data.get('default_cashback'), dict, 'default_cashback') or {}
+    # Only create a default cashback if cashback_percent has a value
+    if dc_data.get('cashback_percent') is not None:
+        children[DefaultCashback].append(DefaultCashback(
+            cashback_percent=dc_data['cashback_percent'],
+            monthly_cap=dc_data.get('monthly_cap'),
+            min_transaction_amount=dc_data.get('min_transaction_amount', 0)
+        ))
+
+    for rule_data in _expect(card_data.get('cashback_rules'), list, 'cashback_rules') or []:
+        rule = _parse_cashback_rule(_expect(rule_data, dict, 'Each cashback rule'), dc_data)
+        if rule is not None:
+            children[CashbackRule].append(rule)
+
+    tags = card_data.get('tags', [])
+    if not isinstance(tags, list) or not all(isinstance(tag, str) and tag for tag in tags):
+        raise CardImportError('tags must be a list of names.')
+
+    for instance in [card] + [row for rows in children.values() for row in rows]:
+        try:
+            instance.clean_fields(exclude=['bank', 'card'])
+        except ValidationError as exc:
+            # Empty values are accepted as before (e.g. "network": []); only real errors reject the card
+            problems = [
+                f'{field}: {" ".join(error.messages[0] for error in errors)}'
+                for field, errors in exc.error_dict.items()
+                if any(error.code != 'blank' for error in errors)
+            ]
+            if problems:
+                raise CardImportError(f'{type(instance).__name__} {" ".join(problems)}')
+    return ParsedCard(card, children, list(dict.fromkeys(tags)), card_digest(card_data))
+
+
+def _parse_cashback_rule(rule_data, dc_data):
+    # Returns the unsaved rule, or None for rules without a usable cashback percent
+    conditions = _expect(rule_data.get('additional_conditions'), str, 'additional_conditions') or ''
+    if 'discount' in conditions.lower() or 'cashback' in conditions.lower():
+        # EazyDiner style rules keep the percent in additional_conditions
+        match = re.search(r'(\d+)%', conditions)
+        if not match:
+            return None
+        cashback_percent = float(match.group(1))
+    else:
+        cashback_percent = _expect_number(rule_data.get('cashback_percent'), 'cashback_percent')
+    if not cashback_percent or cashback_percent <= 0:
+        return None
+
+    # platform, payment_app and platform_type can each be a list or a string
+    platform = rule_data.get('platform')
+    if isinstance(platform, list):
+        platform = platform[0] if platform else None
+    payment_app = rule_data.get('payment_app')
+    if isinstance(payment_app, list):
+        payment_app = payment_app[0] if payment_app else None
+    platform_type = rule_data.get('platform_type')
+    if isinstance(platform_type, list):
+        platform_type = platform_type[0] if platform_type else None
+
+    min_transaction_amount = rule_data.get('min_transaction_amount')
+    if min_transaction_amount is None:
+        # If not specified, use the default cashback's minimum
+        min_transaction_amount = dc_data.get('min_transaction_amount', 0)
+    monthly_cap = rule_data.get('monthly_cap')
+    if monthly_cap is None:
+        monthly_cap = 0
+    max_cashback_per_transaction = rule_data.get('max_cashback_per_transaction')
+    if max_cashback_per_transaction is None:
+        max_cashback_per_transaction = monthly_cap
+
+    return CashbackRule(
+        category=rule_data.get('category'),
+        subcategory=rule_data.get('subcategory'),
+        platform=platform,
+        brand=rule_data.get('brand'),
+        spending_type=rule_data.get('spending_type'),
+        platform_type=platform_type,
+        payment_app=payment_app,
+        cashback_percent=cashback_percent,
+        monthly_cap=monthly_cap,
+        min_transaction_amount=min_transaction_amount,
+        max_cashback_per_transaction=max_cashback_per_transaction,
+        additional_conditions=rule_data.get('additional_conditions')
+    )
+
+
+def _expect(value, kind, name):
+    # Returns value if it is None or of the expected JSON type, else raises CardImportError
+    if value is not None and not isinstance(value, kind):
+        expected = {dict: 'an object', list: 'a list', str: 'a string'}[kind]
+        raise CardImportError(f'{name} must be {expected}.')
+    return value
+
+
+def _expect_number(value, name):
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+        raise CardImportError(f'{name} must be a number.')
+    return value
+
+
+def card_digest(card_data):
+    """
+    Fingerprint of an import entry: a hash of its JSON with sorted keys.
+    """
+    normalized = json.dumps(card_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def parse_cards_v2(entries, bank, start=0, seen=None):
+    """
+    Parses every entry. Returns (parsed cards, [(index, card name, error message)]),
+    numbering entries from `start`. A card name already in `seen` (the names parsed
+    so far, updated in place) is an error, so repeated names are caught across batches.
+    """
+    parsed, errors = [], []
+    seen = set() if seen is None else seen
+    for index, card_data in enumerate(entries, start):
+        try:
+            entry = parse_card_v2(card_data, bank)
+            if entry.card.card_name in seen:
+                raise CardImportError('Duplicate card_name in the file.')
+            seen.add(entry.card.card_name)
+            parsed.append(entry)
+        except (CardImportError, AttributeError, TypeError, ValueError) as exc:
+            # Shapes the parser does not check for still fail only their own entry
+            name = card_data.get('card_name') if isinstance(card_data, dict) else None
+            message = str(exc) if isinstance(exc, CardImportError) else f'Malformed entry: {exc}'
+            errors.append((index, name, message))
+    return parsed, errors
+
+
+def sync_cards(parsed_cards, bank):
+    """
+    Writes parsed cards of one bank in one transaction: new cards are inserted,
+    changed cards updated in place and unchanged cards skipped. Where earlier imports
+    left several rows with one name, the oldest is kept and the other active ones are
+    discontinued. Returns a SyncResult.
+    """
+    with transaction.atomic():
+        existing = {}
+        duplicates = []
+        names = [entry.card.card_name for entry in parsed_cards]
+        for offset in range(0, len(names), BATCH_SIZE):
+            cards = CreditCard.objects.filter(bank=bank, card_name__in=names[offset:offset + BATCH_SIZE])
+            for card in cards.select_related('import_fingerprint').order_by('id'):
+                if card.card_name not in existing:
+                    existing[card.card_name] = card
+                elif card.status != 0:
+                    duplicates.append(card)
+        _discontinue(duplicates)
+        new, changed, unchanged = [], [], []
+        for entry in parsed_cards:
+            card = existing.get(entry.card.card_name)
+            if card is None:
+                new.append(entry)
+            elif _fingerprint(card) == entry.digest:
+                unchanged.append(card)
+            else:
+                changed.append((card, entry))
+
+        created = _insert_cards(new)
+        updated = _update_cards(changed)
+        _save_fingerprints(
+            [(card, entry.digest) for card, entry in zip(created, new)]
+            + [(card, entry.digest) for card, entry in changed]
+        )
+        if created or updated:
+            refresh_card_value_summaries([card.id for card in created + updated])
+        if created or updated or duplicates:
+            schedule_catalog_change()
+    return SyncResult(created, updated, unchanged, duplicates)
+
+
+def discontinue_missing_cards(bank, imported_names):
+    """
+    Marks the bank's active cards whose names are not in imported_names as
+    discontinued. Returns those cards.
+    """
+    with transaction.atomic():
+        cards = CreditCard.objects.filter(bank=bank).exclude(status=0).only('id', 'card_name', 'status')
+        discontinued = [card for card in cards if card.card_name not in imported_names]
+        _discontinue(discontinued)
+        if discontinued:
+            schedule_catalog_change()
+    return discontinued
+
+
+def _discontinue(cards):
+    for card in cards:
+        card.status = 0
+    CreditCard.objects.bulk_update(cards, ['status'], batch_size=BATCH_SIZE)
+    # A discontinued card that comes back must be written again, even if its JSON did not change
+    for offset in range(0, len(cards), BATCH_SIZE):
+        CardImportFingerprint.objects.filter(card__in=cards[offset:offset + BATCH_SIZE]).update(digest='')
+
+
+def _fingerprint(card):
+    try:
+        return card.import_fingerprint.digest
+    except CardImportFingerprint.DoesNotExist:
+        return None
+
+
+def _insert_cards(parsed_cards):
+    # Bulk-inserts new cards with their child rows and tags; returns the saved cards
+    if not parsed_cards:
+        return []
+    cards = CreditCard.objects.bulk_create([entry.card for entry in parsed_cards], batch_size=BATCH_SIZE)
+    for model in CHILD_KEYS:
+        rows = []
+        for card, entry in zip(cards, parsed_cards):
+            for row in entry.children[model]:
+                row.card = card
+                rows.append(row)
+        model.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    tags = get_or_create_tags({name for entry in parsed_cards for name in entry.tags})
+    CardTag.objects.bulk_create(
+        [CardTag(card=card, tag=tags[name]) for card, entry in zip(cards, parsed_cards) for name in entry.tags],
+        batch_size=BATCH_SIZE,
+    )
+    return cards
+
+
+def _update_cards(changed):
+    # Updates changed cards in place from their parsed entries; returns the cards.
+    # Child rows are matched by natural key, so only rows that differ are written.
+    if not changed:
+        return []
+    cards = []
+    for card, entry in changed:
+        for field in CARD_FIELDS:
+            setattr(card, field, getattr(entry.card, field))
+        cards.append(card)
+    CreditCard.objects.bulk_update(cards, CARD_FIELDS, batch_size=BATCH_SIZE)
+    card_ids = [card.id for card in cards]
+
+    for model, key_fields in CHILD_KEYS.items():
+        value_fields = [
+            field.attname for field in model._meta.concrete_fields
+            if not field.primary_key and field.name != 'card' and field.name not in key_fields
+        ]
+        current = {}
+        for row in model.objects.filter(card_id__in=card_ids).order_by('id'):
+            current.setdefault((row.card_id, _row_key(row, key_fields)), []).append(row)
+        to_create, to_update = [], []
+        for card, entry in changed:
+            for row in entry.children[model]:
+                matches = current.get((card.id, _row_key(row, key_fields)))
+                if not matches:
+                    row.card = card
+                    to_create.append(row)
+                    continue
+                existing_row = matches.pop(0)
+                if any(getattr(existing_row, field) != getattr(row, field) for field in value_fields):
+                    for field in value_fields:
+                        setattr(existing_row, field, getattr(row, field))
+                    to_update.append(existing_row)
+        stale = [row.id for rows in current.values() for row in rows]
+        if stale:
+            model.objects.filter(id__in=stale).delete()
+        model.objects.bulk_update(to_update, value_fields, batch_size=BATCH_SIZE)
+        model.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+
+    current_tags = {}
+    for card_tag in CardTag.objects.filter(card_id__in=card_ids).select_related('tag'):
+        current_tags.setdefault(card_tag.card_id, {})[card_tag.tag.name] = card_tag.id
+    tags = get_or_create_tags({name for _, entry in changed for name in entry.tags})
+    stale_tags, new_tags = [], []
+    for card, entry in changed:
+        names = current_tags.get(card.id, {})
+        stale_tags.extend(card_tag_id for name, card_tag_id in names.items() if name not in entry.tags)
+        new_tags.extend(CardTag(card=card, tag=tags[name]) for name in entry.tags if name not in names)
+    if stale_tags:
+        CardTag.objects.filter(id__in=stale_tags).delete()
+    CardTag.objects.bulk_create(new_tags, batch_size=BATCH_SIZE)
+    return cards
+
+
+def _row_key(row, key_fields):
+    # JSON key fields (brand lists) are compared by their canonical JSON
+    return tuple(json.dumps(getattr(row, field), sort_keys=True) for field in key_fields)
+
+
+def _save_fingerprints(pairs):
+    if not pairs:
+        return
+    existing = {
+        fingerprint.card_id: fingerprint
+        for fingerprint in CardImportFingerprint.objects.filter(card__in=[card for card, _ in pairs])
+    }
+    to_create, to_update = [], []
+    now = timezone.now()
+    for card, digest in pairs:
+        fingerprint = existing.get(card.id)
+        if fingerprint is None:
+            to_create.append(CardImportFingerprint(card=card, digest=digest))
+        else:
+            # bulk_update does not apply auto_now
+            fingerprint.digest, fingerprint.updated_at = digest, now
+            to_update.append(fingerprint)
+    CardImportFingerprint.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+    CardImportFingerprint.objects.bulk_update(to_update, ['digest', 'updated_at'], batch_size=BATCH_SIZE)
+
+
+def get_or_create_tags(names):
+    """
+    Returns {name: Tag} for the given tag names, creating the missing ones.
+    """
+    names = set(names)
+    if not names:
+        return {}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    return {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+
+
+def card_ids_by_name(card_names):
+    """
+    Returns {card_name: {bank name: [card ids]}} for the cards with the given names,
+    reading them in one query per BATCH_SIZE names.
+    """
+    names = list(set(card_names))
+    index = {}
+    for offset in range(0, len(names), BATCH_SIZE):
+        rows = CreditCard.objects.filter(card_name__in=names[offset:offset + BATCH_SIZE]).order_by('id')
+        for card_id, card_name, bank_name in rows.values_list('id', 'card_name', 'bank__name'):
+            index.setdefault(card_name, {}).setdefault(bank_name, []).append(card_id)
+    return index
+
+
+def find_card_ids(index, card_name, bank_name=None):
+    """
+    Ids of the cards in a card_ids_by_name() index with this name, and bank when given.
+    """
+    banks = index.get(card_name, {})
+    if bank_name:
+        return banks.get(bank_name, [])
+    return [card_id for card_ids in banks.values() for card_id in card_ids]
@@ -0,0 +1,131 @@
+"""
+Incremental JSON input for the import commands.
+
+Catalog and highlight dumps are either one JSON array of records or JSON Lines
+(one record per line). Records are decoded one at a time with
+JSONDecoder.raw_decode from a buffer that is refilled in chunks, so memory
+holds the current record plus one chunk rather than the whole file. A record
+longer than MAX_RECORD_SIZE characters is reported as malformed, so a broken
+record early in a dump fails fast instead of pulling the rest of the file in.
+"""
+import json
+import time
+
+CHUNK_SIZE = 1 << 16
+MAX_RECORD_SIZE = 1 << 24
+
+
+def iter_json_records(file, chunk_size=CHUNK_SIZE, max_record_size=MAX_RECORD_SIZE):
+    """
+    Yields the records of a text file holding a JSON array or JSON Lines.
+    Raises json.JSONDecodeError for malformed input, including records longer
+    than max_record_size characters.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+
+    def fill(minimum):
+        # Drops the consumed prefix and reads at least `minimum` more characters
+        nonlocal buffer, position, eof
+        buffer = buffer[position:]
+        position = 0
+        chunk = file.read(max(minimum, chunk_size))
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
+
+    def next_char():
+        # Skips whitespace; returns the next character without consuming it, or None at the end
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if eof:
+                return None
+            fill(chunk_size)
+
+    def decode():
+        nonlocal position
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof or len(buffer) - position >= max_record_size:
+                    raise
+                # The record runs past the buffer; read as much again so long records stay linear
+                fill(len(buffer) - position)
+                continue
+            # A value ending exactly at the buffer's end (a number, say) may continue in the next chunk
+            if end == len(buffer) and not eof:
+                fill(chunk_size)
+                continue
+            position = end
+            return record
+
+    first = next_char()
+    if first is None:
+        return
+    if first != '[':
+        # JSON Lines, or any sequence of whitespace separated values
+        while next_char() is not None:
+            yield decode()
+        return
+
+    position += 1
+    if next_char() == ']':
+        position += 1
+    else:
+        while True:
+            if next_char() is None:
+                raise json.JSONDecodeError('Unterminated array', buffer, position)
+            yield decode()
+            separator = next_char()
+            if separator == ',':
+                position += 1
+            elif separator == ']':
+                position += 1
+                break
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+    if next_char() is not None:
+        raise json.JSONDecodeError('Extra data', buffer, position)
+
+
+class Progress:
+    """
+    Counts processed rows and writes the count and rate to a command's stdout
+    at most every `interval` seconds, plus a final line from done().
+    """
+
+    def __init__(self, stdout, label='rows', interval=5.0):
+        self.stdout = stdout
+        self.label = label
+        self.interval = interval
+        self.count = 0
+        self.started = self._reported = time.perf_counter()
+
+    def track(self, records):
+        """
+        Yields the records, counting each one.
+        """
+        for record in records:
+            self.advance()
+            yield record
+
+    def advance(self, rows=1):
+        self.count += rows
+        now = time.perf_counter()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            self.stdout.write(self.line(now))
+
+    def done(self):
+        self.stdout.write(self.line(time.perf_counter()))
+
+    def line(self, now):
+        elapsed = now - self.started
+        rate = self.count / elapsed if elapsed > 0 else 0
+        return f'{self.count} {self.label} read in {elapsed:.1f}s ({rate:.0f} rows/s)'
@@ -0,0 +1,144 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from cards.models import Bank
+from cards.snapshot import get_catalog_snapshot
+from cards.synthetic import generate_catalog, generate_spending_profile
+from cards.utils import get_top_card_groups
+from indiacard_backend.fastjson import ORJSONRenderer
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the recommendation engine on synthetic catalogs in a throwaway test database '
+            'and write the timings as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default='bench_recommend.json', help='Path of the JSON results file')
+        parser.add_argument('--cards', type=_int_list, default=[50, 200, 500], help='Comma-separated catalog sizes')
+        parser.add_argument('--group-sizes', type=_int_list, default=[1, 2, 3], help='Comma-separated group sizes')
+        parser.add_argument('--rules-per-card', type=int, default=6, help='Cashback rules per card on average')
+        parser.add_argument('--banks', type=int, default=20, help='Banks per catalog')
+        parser.add_argument('--profiles', type=int, default=20, help='Spending profiles timed per case')
+        parser.add_argument('--spends', type=int, default=5, help='Spending entries per profile')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the catalog and the profiles')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self.run_benchmarks(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'commit': self.git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'parameters': {key: options[key] for key in
+                           ('cards', 'group_sizes', 'rules_per_card', 'banks', 'profiles', 'spends', 'seed')},
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def run_benchmarks(self, options):
+        client = APIClient()
+        results = []
+        for card_count in options['cards']:
+            Bank.objects.all().delete()
+            generate_catalog(banks=options['banks'], cards=card_count,
+                             rules=card_count * options['rules_per_card'], seed=options['seed'])
+            snapshot = get_catalog_snapshot()
+            rng = random.Random(options['seed'])
+            profiles = [generate_spending_profile(rng, options['spends']) for _ in range(options['profiles'])]
+            card_ids = [card.id for card in snapshot.cards]
+
+            for group_size in options['group_sizes']:
+                results.append(self.measure(
+                    'get_top_card_groups', card_count, group_size, profiles,
+                    lambda spending: get_top_card_groups(snapshot.cards, spending, group_size=group_size),
+                ))
+                # Uncached requests through the full Django stack
+                results.append(self.measure(
+                    'recommend_cards', card_count, group_size, profiles,
+                    lambda spending: self.post(client, reverse('recommend-cards'), {
+                        'spending': spending, 'preferences': {'desiredCardCount': group_size},
+                    }),
+                    setup=lambda: caches[settings.RECOMMENDATION_CACHE_ALIAS].clear(),
+                ))
+                # Rendering real recommend payloads with DRF's stdlib renderer and the orjson default
+                payloads = {id(spending): self.post(client, reverse('recommend-cards'), {
+                    'spending': spending, 'preferences': {'desiredCardCount': group_size},
+                }).data for spending in profiles}
+                for name, renderer in (('render_drf_json', JSONRenderer()), ('render_orjson', ORJSONRenderer())):
+                    results.append(self.measure(
+                        name, card_count, group_size, profiles,
+                        lambda spending, renderer=renderer: renderer.render(payloads[id(spending)]),
+                    ))
+            results.append(self.measure(
+                'purchase_advisor', card_count, None, profiles,
+                lambda spending: self.post(client, reverse('purchase-advisor'), {
+                    'spending': spending[:1], 'owned_cards': card_ids,
+                }),
+            ))
+        return results
+
+    def measure(self, name, card_count, group_size, profiles, run, setup=None):
+        timings = []
+        for spending in profiles:
+            if setup:
+                setup()
+            started = time.perf_counter()
+            run(spending)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        result = {
+            'benchmark': name,
+            'cards': card_count,
+            'group_size': group_size,
+            'runs': len(timings),
+            'min_ms': round(timings[0], 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            'max_ms': round(timings[-1], 3),
+        }
+        label = name if group_size is None else f'{name} (group size {group_size})'
+        self.stdout.write(f"{label:40} {card_count:6} cards  median {result['median_ms']:9.2f} ms  "
+                          f"p95 {result['p95_ms']:9.2f} ms")
+        return result
+
+    def post(self, client, url, payload):
+        response = client.post(url, payload, format='json')
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} returned {response.status_code}: {response.content[:200]!r}')
+        return response
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
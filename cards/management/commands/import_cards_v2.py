@@ -1,20 +1,26 @@
-import json
-from django.core.management.base import BaseCommand
-from cards.models import (
-    Bank, CreditCard, FeeWaiver, RewardPointConversion, DefaultCashback,
-    CashbackRule, RewardMultiplier, WelcomeBenefit, MilestoneBonus,
-    CardBenefit, FeesAndCharges, EligibilityCriteria, Tag, CardTag
-)
+import time
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cards.importing import discontinue_missing_cards, parse_cards_v2, sync_cards
+from cards.jsonstream import Progress, iter_json_records
+from cards.models import Bank
 
 class Command(BaseCommand):
-    help = 'Import credit card data from JSON file'
+    help = 'Import credit card data from a JSON array or JSON Lines file'
 
     def add_arguments(self, parser):
         parser.add_argument('json_file', type=str, help='Path to the JSON file')
+        parser.add_argument('--strict', action='store_true',
+                            help='Import nothing if any card fails validation')
+        parser.add_argument('--sync', action='store_true',
+                            help="Mark the bank's cards that are missing from the file as discontinued")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Cards parsed and written at a time; bounds memory use')
 
     def handle(self, *args, **options):
-        with open(options['json_file'], 'r') as f:
-            data = json.load(f)
+        started = time.perf_counter()
+        batch_size = max(options['batch_size'], 1)
 
         # Create or get HDFC Bank
         bank, _ = Bank.objects.get_or_create(
@@ -25,157 +31,46 @@ class Command(BaseCommand):
             }
         )
 
-        for card_data in data:
-            try:
-                # Create credit card
-                # Handle waiver_on_spend which can be a dictionary
-                waiver_on_spend = card_data.get('waiver_on_spend')
-                if isinstance(waiver_on_spend, dict):
-                    # Use renewal amount if available, otherwise first_year
-                    waiver_on_spend = waiver_on_spend.get('renewal') or waiver_on_spend.get('first_year', 0)
-                
-                # Handle required fields
-                annual_fee = card_data.get('annual_fee')
-                if annual_fee is None:
-                    annual_fee = 0
-                
-                effective_annual_fee = card_data.get('effective_annual_fee')
-                if effective_annual_fee is None:
-                    effective_annual_fee = annual_fee
-                
-                card = CreditCard.objects.create(
-                    card_name=card_data['card_name'],
-                    bank=bank,
-                    card_type=card_data['card_type'],
-                    variant=card_data.get('variant'),
-                    network=card_data.get('network', []),
-                    status=card_data.get('status', 1),
-                    annual_fee=annual_fee,
-                    waiver_on_spend=waiver_on_spend,
-                    effective_annual_fee=effective_annual_fee,
-                    image_url=card_data.get('image_url'),
-                    apply_url=card_data.get('apply_url'),
-                    summary=card_data.get('summary')
-                )
+        created = updated = unchanged = failed = 0
+        duplicates = []
+        seen = set()
+        progress = Progress(self.stdout, label='cards')
+        # Cards are streamed and written batch by batch, all in one transaction
+        with open(options['json_file'], 'r', encoding='utf-8') as f, transaction.atomic():
+            records = progress.track(iter_json_records(f))
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                # Validate the batch before writing it; invalid cards are skipped as a whole
+                parsed, errors = parse_cards_v2(batch, bank, start=progress.count - len(batch), seen=seen)
+                for index, card_name, message in errors:
+                    self.stdout.write(self.style.ERROR(f'Error importing card {card_name or f"#{index}"}: {message}'))
+                failed += len(errors)
+                if errors and options['strict']:
+                    raise CommandError(f'Card #{errors[0][0]} failed validation; nothing was imported')
+                # Unchanged cards are skipped and changed ones updated in place, keeping their ids
+                result = sync_cards(parsed, bank)
+                for card in result.created:
+                    self.stdout.write(self.style.SUCCESS(f'Successfully imported {card.card_name}'))
+                for card in result.updated:
+                    self.stdout.write(self.style.SUCCESS(f'Updated {card.card_name}'))
+                for card in result.duplicates:
+                    self.stdout.write(self.style.WARNING(f'Discontinued duplicate {card.card_name} (id {card.id})'))
+                duplicates += result.duplicates
+                created += len(result.created)
+                updated += len(result.updated)
+                unchanged += len(result.unchanged)
 
-                # Create reward point conversion if present
-                rpc_data = card_data.get('reward_point_conversion')
-                if rpc_data:
-                    conversion_rate = rpc_data.get('conversion_rate')
-                    # Handle both number and dictionary conversion rates
-                    if not isinstance(conversion_rate, dict):
-                        conversion_rate = {'Cashback': conversion_rate or 0}
-                    
-                    min_points_required = rpc_data.get('min_points_required')
-                    if min_points_required is None:
-                        min_points_required = 0
-                    
-                    conversion_description = rpc_data.get('conversion_description')
-                    if conversion_description is None:
-                        # Generate a default description based on conversion rate
-                        if isinstance(conversion_rate, dict):
-                            descriptions = []
-                            for key, value in conversion_rate.items():
-                                descriptions.append(f'1 Point = ₹{value} for {key}')
-                            conversion_description = '; '.join(descriptions)
-                        else:
-                            conversion_description = f'1 Point = ₹{conversion_rate}'
-                    
-                    RewardPointConversion.objects.create(
-                        card=card,
-                        conversion_rate=conversion_rate,
-                        min_points_required=min_points_required,
-                        conversion_description=conversion_description
-                    )
-
-                # Create default cashback if present
-                dc_data = card_data.get('default_cashback')
-                if dc_data:
-                    # Only create if cashback_percent has a value
-                    cashback_percent = dc_data.get('cashback_percent')
-                    if cashback_percent is not None:
-                        DefaultCashback.objects.create(
-                            card=card,
-                            cashback_percent=cashback_percent,
-                            monthly_cap=dc_data.get('monthly_cap'),
-                            min_transaction_amount=dc_data.get('min_transaction_amount', 0)
-                        )
-
-                # Create cashback rules if present
-                for rule_data in card_data.get('cashback_rules', []):
-                    # Handle EazyDiner case where cashback is in additional_conditions
-                    if rule_data.get('additional_conditions') and ('discount' in rule_data.get('additional_conditions', '').lower() or 'cashback' in rule_data.get('additional_conditions', '').lower()):
-                        # Extract cashback percent from additional conditions
-                        import re
-                        match = re.search(r'(\d+)%', rule_data.get('additional_conditions', ''))
-                        if match:
-                            cashback_percent = float(match.group(1))
-                        else:
-                            continue
-                    else:
-                        # Skip rule if it has no cashback_percent or is 0
-                        cashback_percent = rule_data.get('cashback_percent')
-                        if cashback_percent is None or cashback_percent == 0:
-                            continue
-                    
-                    # Handle platform field which can be list or string
-                    platform = rule_data.get('platform')
-                    if isinstance(platform, list):
-                        platform = platform[0] if platform else None
-                    
-                    # Handle payment_app field which can be list or string
-                    payment_app = rule_data.get('payment_app')
-                    if isinstance(payment_app, list):
-                        payment_app = payment_app[0] if payment_app else None
-                    
-                    # Handle platform_type field which can be list or string
-                    platform_type = rule_data.get('platform_type')
-                    if isinstance(platform_type, list):
-                        platform_type = platform_type[0] if platform_type else None
-                    
-                    # Handle min_transaction_amount
-                    min_transaction_amount = rule_data.get('min_transaction_amount')
-                    if min_transaction_amount is None:
-                        # If not specified, use default from default_cashback if available
-                        dc_data = card_data.get('default_cashback', {})
-                        min_transaction_amount = dc_data.get('min_transaction_amount', 0)
-                    
-                    # Handle monthly_cap
-                    monthly_cap = rule_data.get('monthly_cap')
-                    if monthly_cap is None:
-                        monthly_cap = 0
-                    
-                    # Handle max_cashback_per_transaction
-                    max_cashback_per_transaction = rule_data.get('max_cashback_per_transaction')
-                    if max_cashback_per_transaction is None:
-                        max_cashback_per_transaction = monthly_cap
-                    
-                    # Skip if no valid cashback percent
-                    if not cashback_percent or cashback_percent <= 0:
-                        continue
-                        
-                    CashbackRule.objects.create(
-                        card=card,
-                        category=rule_data.get('category'),
-                        subcategory=rule_data.get('subcategory'),
-                        platform=platform,
-                        brand=rule_data.get('brand'),
-                        spending_type=rule_data.get('spending_type'),
-                        platform_type=platform_type,
-                        payment_app=payment_app,
-                        cashback_percent=cashback_percent,
-                        monthly_cap=monthly_cap,
-                        min_transaction_amount=min_transaction_amount,
-                        max_cashback_per_transaction=max_cashback_per_transaction,
-                        additional_conditions=rule_data.get('additional_conditions')
-                    )
-
-                # Create tags if present
-                for tag_name in card_data.get('tags', []):
-                    tag, _ = Tag.objects.get_or_create(name=tag_name)
-                    CardTag.objects.create(card=card, tag=tag)
-
-                self.stdout.write(self.style.SUCCESS(f'Successfully imported {card.card_name}'))
-
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error importing card {card_data["card_name"]}: {str(e)}'))
+            discontinued = []
+            if options['sync'] and failed:
+                self.stdout.write(self.style.WARNING('Some cards failed validation; not discontinuing missing cards'))
+            elif options['sync']:
+                discontinued = discontinue_missing_cards(bank, seen)
+            for card in discontinued:
+                self.stdout.write(self.style.WARNING(f'Discontinued {card.card_name}'))
+        progress.done()
+        self.stdout.write(
+            f'{created} created, {updated} updated, {unchanged} unchanged, '
+            f'{len(discontinued) + len(duplicates)} discontinued, {failed} failed, in {time.perf_counter() - started:.2f}s'
+        )
@@ -1,45 +1,84 @@
 import json
+from itertools import islice
 from django.core.management.base import BaseCommand
-from cards.models import CreditCard, Highlight
+from django.db import transaction
+from cards.importing import BATCH_SIZE, card_ids_by_name, find_card_ids
+from cards.jsonstream import Progress, iter_json_records
+from cards.models import Highlight
+from cards.snapshot import bump_catalog_version
 
 class Command(BaseCommand):
-    help = 'Import highlights from JSON file containing card_name and key_highlights'
+    help = 'Import highlights from a JSON array or JSON Lines file of card_name and key_highlights'
 
     def add_arguments(self, parser):
         parser.add_argument('file_path', type=str, help='Path to JSON file with highlights')
 
     def handle(self, *args, **options):
         file_path = options['file_path']
+        progress = Progress(self.stdout, label='highlights')
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except Exception as e:
+                # Entries are decoded one at a time, so large files are not loaded whole
+                self.import_entries(progress.track(iter_json_records(f)))
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
             self.stderr.write(self.style.ERROR(f'Error reading file: {e}'))
             return
-        for entry in data:
+        progress.done()
+        self.stdout.write(self.style.SUCCESS('Import complete.'))
+
+    def import_entries(self, entries):
+        # Entries are applied in batches, all in one transaction: one query resolves a
+        # batch's card names, one reads its existing highlights, then bulk writes
+        changed = False
+        with transaction.atomic():
+            while True:
+                batch = list(islice(entries, BATCH_SIZE))
+                if not batch:
+                    break
+                changed = self.import_batch(batch) or changed
+            if changed:
+                transaction.on_commit(bump_catalog_version)
+
+    def import_batch(self, batch):
+        index = card_ids_by_name(entry.get('card_name') for entry in batch if entry.get('card_name'))
+        # Per entry, in file order: (card id, card name, highlights), or a warning message
+        resolved = []
+        for entry in batch:
             card_name = entry.get('card_name')
             bank_name = entry.get('bank')
             if not card_name:
-                self.stdout.write(self.style.WARNING('Skipping entry without card_name'))
-                continue
-            # Filter by card_name and optional bank name to disambiguate
-            qs = CreditCard.objects.filter(card_name=card_name)
-            if bank_name:
-                qs = qs.filter(bank__name=bank_name)
-            count = qs.count()
-            if count == 1:
-                card = qs.first()
-            elif count == 0:
-                self.stdout.write(self.style.WARNING(f'Card not found: {card_name} ({bank_name})'))
+                resolved.append('Skipping entry without card_name')
                 continue
+            # Match by card_name and optional bank name to disambiguate
+            card_ids = find_card_ids(index, card_name, bank_name)
+            if len(card_ids) == 1:
+                resolved.append((card_ids[0], card_name, entry.get('key_highlights', [])))
+            elif not card_ids:
+                resolved.append(f'Card not found: {card_name} ({bank_name})')
             else:
-                self.stdout.write(self.style.WARNING(f'Multiple cards found for {card_name} ({bank_name}), skipping'))
+                resolved.append(f'Multiple cards found for {card_name} ({bank_name}), skipping')
+
+        matched = [item for item in resolved if not isinstance(item, str)]
+        existing = {
+            highlight.card_id: highlight
+            for highlight in Highlight.objects.filter(card_id__in={card_id for card_id, _, _ in matched})
+        }
+        to_create, to_update = {}, {}
+        for item in resolved:
+            if isinstance(item, str):
+                self.stdout.write(self.style.WARNING(item))
                 continue
-            highlights = entry.get('key_highlights', [])
-            obj, created = Highlight.objects.update_or_create(
-                card=card,
-                defaults={'highlight': highlights}
-            )
-            action = 'Created' if created else 'Updated'
+            card_id, card_name, highlights = item
+            highlight = existing.get(card_id) or to_create.get(card_id)
+            if highlight is None:
+                to_create[card_id] = Highlight(card_id=card_id, highlight=highlights)
+                action = 'Created'
+            else:
+                highlight.highlight = highlights
+                if card_id in existing:
+                    to_update[card_id] = highlight
+                action = 'Updated'
             self.stdout.write(f'{action} highlight for {card_name}')
-        self.stdout.write(self.style.SUCCESS('Import complete.'))
+        Highlight.objects.bulk_create(to_create.values())
+        Highlight.objects.bulk_update(to_update.values(), ['highlight'])
+        return bool(to_create or to_update)
@@ -1,5 +1,8 @@
 from django.core.management.base import BaseCommand
-from cards.models import CreditCard, FeeWaiver
+from django.db import transaction
+from cards.importing import card_ids_by_name, find_card_ids
+from cards.models import FeeWaiver
+from cards.snapshot import bump_catalog_version
 
 FEE_WAIVER_DATA = {
   "HDFC Millennia": {"joining_fee": 1000, "annual_fee": 1000, "waiver_on_spend": 100000},
@@ -45,29 +48,51 @@ FEE_WAIVER_DATA = {
   "HDFC Bank Regalia First Credit Card": {"joining_fee": 1000, "annual_fee": 1000, "waiver_on_spend": 100000}
 }
 
+WAIVER_FIELDS = ["joining_fee", "annual_fee", "waiver_on_annual_spends"]
+
 class Command(BaseCommand):
     help = "Populates FeeWaiver data for HDFC cards from a predefined JSON."
 
     def handle(self, *args, **options):
+        # One query resolves every card name and one reads the existing waivers; writes are bulk
+        index = card_ids_by_name(FEE_WAIVER_DATA)
+        resolved = []
         for card_name, waiver_data in FEE_WAIVER_DATA.items():
-            try:
-                card = CreditCard.objects.get(card_name=card_name)
-            except CreditCard.DoesNotExist:
+            card_ids = find_card_ids(index, card_name)
+            if not card_ids:
                 self.stdout.write(self.style.WARNING(f"Card not found: {card_name}"))
                 continue
+            if len(card_ids) > 1:
+                self.stdout.write(self.style.WARNING(f"Multiple cards found for {card_name}, skipping"))
+                continue
 
             joining_fee = waiver_data.get("joining_fee", 0) or 0
             annual_fee = waiver_data.get("annual_fee", 0) or 0
             waiver_on_annual_spend = waiver_data.get("waiver_on_spend")
             if isinstance(waiver_on_annual_spend, dict) or waiver_on_annual_spend is None:
                 waiver_on_annual_spend = 0
+            resolved.append((card_ids[0], card_name, {
+                "joining_fee": joining_fee,
+                "annual_fee": annual_fee,
+                "waiver_on_annual_spends": waiver_on_annual_spend,
+            }))
 
-            fw, created = FeeWaiver.objects.update_or_create(
-                card=card,
-                defaults={
-                    "joining_fee": joining_fee,
-                    "annual_fee": annual_fee,
-                    "waiver_on_annual_spends": waiver_on_annual_spend,
-                }
-            )
-            self.stdout.write(self.style.SUCCESS(f"{'Created' if created else 'Updated'} FeeWaiver for {card_name}"))
+        with transaction.atomic():
+            existing = {
+                fw.card_id: fw
+                for fw in FeeWaiver.objects.filter(card_id__in=[card_id for card_id, _, _ in resolved])
+            }
+            to_create, to_update = [], []
+            for card_id, card_name, values in resolved:
+                fw = existing.get(card_id)
+                if fw is None:
+                    to_create.append(FeeWaiver(card_id=card_id, **values))
+                else:
+                    for field, value in values.items():
+                        setattr(fw, field, value)
+                    to_update.append(fw)
+                self.stdout.write(self.style.SUCCESS(f"{'Created' if fw is None else 'Updated'} FeeWaiver for {card_name}"))
+            FeeWaiver.objects.bulk_create(to_create)
+            FeeWaiver.objects.bulk_update(to_update, WAIVER_FIELDS)
+            if to_create or to_update:
+                transaction.on_commit(bump_catalog_version)
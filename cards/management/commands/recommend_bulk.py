@@ -0,0 +1,159 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque, namedtuple
+from itertools import groupby, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.utils.encoders import JSONEncoder
+
+from cards.recommendations import build_batch_recommendations
+from cards.serializers import CardRecommendationInputSerializer
+from cards.snapshot import get_catalog_snapshot
+
+# Catalog snapshot shared with forked workers (copy-on-write)
+_snapshot = None
+
+# Stands in for the payload of an input line that is not valid JSON
+Malformed = namedtuple('Malformed', ['errors'])
+
+
+def score_profiles(batch):
+    """
+    Scores a batch of (profile_id, payload) pairs against the shared snapshot.
+    Returns one output record per profile, in order.
+    """
+    records = [None] * len(batch)
+    valid = []
+    for i, (profile_id, payload) in enumerate(batch):
+        if isinstance(payload, Malformed):
+            records[i] = {'id': profile_id, 'errors': payload.errors}
+            continue
+        serializer = CardRecommendationInputSerializer(data=payload)
+        if serializer.is_valid():
+            preferences = serializer.validated_data.get('preferences', {})
+            group_size = preferences.get('desiredCardCount', preferences.get('num_new_cards', 1))
+            valid.append((i, serializer.validated_data['spending'], group_size))
+        else:
+            records[i] = {'id': profile_id, 'errors': serializer.errors}
+    results = build_batch_recommendations(_snapshot.cards, [(spending, group_size) for _, spending, group_size in valid])
+    for (i, _, _), result in zip(valid, results):
+        records[i] = {'id': batch[i][0], **result}
+    return [json.dumps(record, cls=JSONEncoder, ensure_ascii=False) for record in records]
+
+
+class Command(BaseCommand):
+    help = 'Score spending profiles from a JSONL or CSV file and write recommendations as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input_file', type=str, help='JSONL of recommend payloads, or CSV with one spend per row')
+        parser.add_argument('output_file', type=str, help='Path of the NDJSON results file')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='Input format (default: from the file extension)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=50, help='Profiles scored per worker task')
+        parser.add_argument('--group-size', type=int, default=1, help='desiredCardCount for CSV profiles without one')
+        parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint of a previous run')
+
+    def handle(self, *args, **options):
+        global _snapshot
+        input_file, output_file = options['input_file'], options['output_file']
+        input_format = options['format'] or ('csv' if input_file.lower().endswith('.csv') else 'jsonl')
+        checkpoint_file = f'{output_file}.checkpoint'
+        if input_format == 'csv':
+            # Without it every row would be merged into a single profile
+            with open(input_file, newline='', encoding='utf-8') as f:
+                if 'profile_id' not in next(csv.reader(f), []):
+                    raise CommandError(f'{input_file} has no profile_id column')
+        processed, output_bytes = 0, 0
+        if options['resume'] and os.path.exists(checkpoint_file):
+            with open(checkpoint_file) as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('input_file') != os.path.abspath(input_file):
+                raise CommandError(f'Checkpoint {checkpoint_file} belongs to {checkpoint.get("input_file")}')
+            processed, output_bytes = checkpoint['processed'], checkpoint['output_bytes']
+            if not os.path.exists(output_file) or os.path.getsize(output_file) < output_bytes:
+                # The results the checkpoint counts are gone, so they are scored again
+                self.stdout.write(self.style.WARNING(f'{output_file} is missing or truncated; starting over'))
+                processed, output_bytes = 0, 0
+            else:
+                self.stdout.write(f'Resuming after {processed} profiles')
+
+        _snapshot = get_catalog_snapshot()
+        self.stdout.write(f'Loaded catalog version {_snapshot.version} with {len(_snapshot.cards)} cards')
+        profiles = self.read_profiles(input_file, input_format, options['group_size'])
+        batches = self.batched(islice(profiles, processed, None), options['batch_size'])
+
+        with open(output_file, 'r+b' if processed else 'wb') as output:
+            # Drop anything written after the last checkpoint
+            output.truncate(output_bytes)
+            output.seek(output_bytes)
+            started = time.monotonic()
+            scored = 0
+            for lines in self.score(batches, options['workers']):
+                output.write(''.join(f'{line}\n' for line in lines).encode('utf-8'))
+                output.flush()
+                os.fsync(output.fileno())
+                scored += len(lines)
+                processed += len(lines)
+                with open(f'{checkpoint_file}.tmp', 'w') as f:
+                    json.dump({'input_file': os.path.abspath(input_file), 'processed': processed,
+                               'output_bytes': output.tell()}, f)
+                os.replace(f'{checkpoint_file}.tmp', checkpoint_file)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{processed} profiles ({scored / elapsed:.1f} profiles/sec)')
+        elapsed = time.monotonic() - started
+        rate = scored / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {scored} profiles in {elapsed:.1f}s ({rate:.1f} profiles/sec); results in {output_file}'
+        ))
+
+    def score(self, batches, workers):
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            for batch in batches:
+                yield score_profiles(batch)
+            return
+        # Forked workers inherit the snapshot; they must not share the parent's DB connections
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            # Keep a bounded window of tasks in flight so memory stays flat on large inputs
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.apply_async(score_profiles, (batch,)))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    def read_profiles(self, input_file, input_format, group_size):
+        with open(input_file, newline='', encoding='utf-8') as f:
+            if input_format == 'jsonl':
+                for line_number, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        payload = json.loads(line)
+                    except ValueError as exc:
+                        yield line_number, Malformed({'non_field_errors': [f'Malformed JSON: {exc}']})
+                        continue
+                    # Anything but an object is reported by the serializer
+                    profile_id = payload.pop('id', line_number) if isinstance(payload, dict) else line_number
+                    yield profile_id, payload
+            else:
+                # Consecutive rows with the same profile_id form one profile
+                rows = csv.DictReader(f)
+                for profile_id, profile_rows in groupby(rows, key=lambda row: row.pop('profile_id')):
+                    spending = []
+                    desired_card_count = group_size
+                    for row in profile_rows:
+                        desired_card_count = row.pop('desiredCardCount', None) or desired_card_count
+                        spending.append({key: value for key, value in row.items() if value not in (None, '')})
+                    # Validated (and converted) by the serializer, like the spends
+                    yield profile_id, {'spending': spending, 'preferences': {'desiredCardCount': desired_card_count}}
+
+    def batched(self, iterable, size):
+        iterator = iter(iterable)
+        while batch := list(islice(iterator, size)):
+            yield batch
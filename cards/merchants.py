@@ -0,0 +1,227 @@
+"""
+Merchant classifier: maps free-text merchant strings ("SWIGGY*BANGALORE",
+"AMZN Mktp IN") onto the brand, platform and payment app vocabulary of the
+catalog's cashback rules.
+
+Every known name is split into words and stored in a token trie. A merchant
+string is classified in one left-to-right pass over its words, taking the
+longest name that starts at each word, so "amazon prime" wins over "amazon".
+Common statement abbreviations are added as aliases of the brand they stand
+for. The classifier is rebuilt whenever the catalog snapshot changes.
+"""
+import re
+import threading
+from collections import namedtuple
+
+MerchantMatch = namedtuple('MerchantMatch', ['category', 'subcategory', 'brand', 'platform', 'payment_app'])
+
+NO_MATCH = MerchantMatch(None, None, None, None, None)
+
+# Abbreviations seen on statements -> brand name, with the category and subcategory
+# used when no cashback rule names the brand
+MERCHANT_ALIASES = {
+    'amzn': ('Amazon', 'Shopping', 'Online Shopping'),
+    'amzn mktp': ('Amazon', 'Shopping', 'Online Shopping'),
+    'amazon in': ('Amazon', 'Shopping', 'Online Shopping'),
+    'fkrt': ('Flipkart', 'Shopping', 'Online Shopping'),
+    'flipkart internet': ('Flipkart', 'Shopping', 'Online Shopping'),
+    'bundl technologies': ('Swiggy', 'Food Delivery', 'Online Food Orders'),
+    'zomato ltd': ('Zomato', 'Food Delivery', 'Online Food Orders'),
+    'bigbasket': ('BigBasket', 'Groceries', 'Online Grocery'),
+    'supermarkets grocery supplies': ('BigBasket', 'Groceries', 'Online Grocery'),
+    'mmt': ('MakeMyTrip', 'Travel', 'Flights'),
+    'irctc': ('IRCTC', 'Travel', 'Train Tickets'),
+    'bms': ('BookMyShow', 'Entertainment', 'Movie Tickets'),
+    'uber india': ('Uber', 'Transport', 'Ride Hailing'),
+    'ola cabs': ('Ola', 'Transport', 'Ride Hailing'),
+    'ani technologies': ('Ola', 'Transport', 'Ride Hailing'),
+    'iocl': ('IndianOil', 'Fuel', None),
+    'indian oil': ('IndianOil', 'Fuel', None),
+    'hpcl': ('HP', 'Fuel', None),
+    'bpcl': ('BPCL', 'Fuel', None),
+}
+
+PAYMENT_APP_ALIASES = {
+    'gpay': 'Google Pay',
+    'google pay': 'Google Pay',
+    'phonepe': 'PhonePe',
+    'paytm': 'Paytm',
+    'amazon pay': 'Amazon Pay',
+    'bhim': 'BHIM',
+}
+
+# Words that place a merchant in a category when it names no known brand
+CATEGORY_KEYWORDS = {
+    'fuel': ('Fuel', None),
+    'petrol': ('Fuel', None),
+    'petroleum': ('Fuel', None),
+    'filling station': ('Fuel', None),
+    'grocery': ('Groceries', None),
+    'supermarket': ('Groceries', 'Supermarket'),
+    'restaurant': ('Dining', None),
+    'cafe': ('Dining', None),
+    'hotel': ('Travel', 'Hotels'),
+    'airlines': ('Travel', 'Flights'),
+    'railway': ('Travel', 'Train Tickets'),
+    'electricity': ('Utilities', 'Bill Payments'),
+    'recharge': ('Utilities', 'Recharge'),
+    'broadband': ('Utilities', 'Bill Payments'),
+    'pharmacy': ('Health', 'Pharmacy'),
+    'medical': ('Health', None),
+    'movie': ('Entertainment', 'Movie Tickets'),
+    'cinema': ('Entertainment', 'Movie Tickets'),
+}
+
+# Kinds of trie entries; a merchant takes the longest brand, else the first category keyword
+BRAND, PLATFORM, PAYMENT_APP, KEYWORD = range(4)
+
+_WORD = re.compile(r'[a-z0-9]+')
+# Merchant strings remembered per classifier
+MEMO_SIZE = 100000
+# Marks the end of a name in the trie; holds {kind: value}
+_END = ''
+
+
+def tokenize(value):
+    """
+    Splits a name or merchant string into lower-case alphanumeric words.
+    """
+    return _WORD.findall((value or '').lower())
+
+
+class MerchantClassifier:
+    """
+    Token trie over the catalog's brands, platforms and payment apps, plus
+    statement aliases and category keywords.
+    """
+
+    def __init__(self, cards=()):
+        self._root = {}
+        self.names = 0
+        for card in cards:
+            for rule in card.cashback_rules.all():
+                brands = rule.brand if isinstance(rule.brand, list) else [rule.brand]
+                for brand in brands:
+                    if brand:
+                        self.add(brand, BRAND, (brand, rule.category, rule.subcategory))
+                if rule.platform:
+                    self.add(rule.platform, PLATFORM, rule.platform)
+                payment_apps = rule.payment_app if isinstance(rule.payment_app, list) else [rule.payment_app]
+                for payment_app in payment_apps:
+                    if payment_app:
+                        self.add(payment_app, PAYMENT_APP, payment_app)
+        # Aliases go in last so names from the catalog keep their rule's category
+        for alias, (brand, category, subcategory) in MERCHANT_ALIASES.items():
+            self.add(alias, BRAND, self._brand_value(brand) or (brand, category, subcategory))
+        for alias, payment_app in PAYMENT_APP_ALIASES.items():
+            self.add(alias, PAYMENT_APP, payment_app)
+        for keyword, (category, subcategory) in CATEGORY_KEYWORDS.items():
+            self.add(keyword, KEYWORD, (category, subcategory))
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    def add(self, name, kind, value):
+        """
+        Adds a name to the trie; the first value added for a name and kind is kept.
+        """
+        words = tokenize(name)
+        if not words:
+            return
+        node = self._root
+        for word in words:
+            node = node.setdefault(word, {})
+        entries = node.setdefault(_END, {})
+        if kind not in entries:
+            entries[kind] = value
+            self.names += 1
+
+    def _brand_value(self, brand):
+        node = self._root
+        for word in tokenize(brand):
+            node = node.get(word)
+            if node is None:
+                return None
+        return node.get(_END, {}).get(BRAND)
+
+    def classify(self, merchant):
+        """
+        Returns the MerchantMatch of one merchant string.
+        """
+        return self.classify_many([merchant])[0]
+
+    def classify_many(self, merchants):
+        """
+        Returns the MerchantMatch of every merchant string, in order.
+        """
+        memo = self._memo
+        new = {}
+        results = []
+        append = results.append
+        find_words = _WORD.findall
+        classify = self._classify
+        for merchant in merchants:
+            result = memo.get(merchant)
+            if result is None:
+                result = new.get(merchant)
+                if result is None:
+                    result = new[merchant] = classify(find_words(merchant.lower()))
+            append(result)
+        if new:
+            with self._memo_lock:
+                # Statements repeat merchants a lot; bound the memo so odd inputs cannot grow it forever
+                if len(memo) + len(new) > MEMO_SIZE:
+                    memo.clear()
+                if len(new) <= MEMO_SIZE:
+                    memo.update(new)
+        return results
+
+    def _classify(self, words):
+        root = self._root
+        brand = platform = payment_app = keyword = None
+        brand_length = 0
+        count = len(words)
+        for start, word in enumerate(words):
+            node = root.get(word)
+            end = start
+            while node is not None:
+                end += 1
+                entries = node.get(_END)
+                if entries is not None:
+                    if BRAND in entries and end - start > brand_length:
+                        brand, brand_length = entries[BRAND], end - start
+                    if platform is None and PLATFORM in entries:
+                        platform = entries[PLATFORM]
+                    if payment_app is None and PAYMENT_APP in entries:
+                        payment_app = entries[PAYMENT_APP]
+                    if keyword is None and KEYWORD in entries:
+                        keyword = entries[KEYWORD]
+                if end == count:
+                    break
+                node = node.get(words[end])
+        if brand is not None:
+            name, category, subcategory = brand
+            return MerchantMatch(category, subcategory, name, platform, payment_app)
+        if keyword is not None:
+            return MerchantMatch(keyword[0], keyword[1], None, platform, payment_app)
+        if platform is None and payment_app is None:
+            return NO_MATCH
+        return MerchantMatch(None, None, None, platform, payment_app)
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_merchant_classifier(snapshot):
+    """
+    Returns the classifier of a catalog snapshot, built once per snapshot. It is keyed
+    on the snapshot's generation: a rebuild can keep the catalog version.
+    """
+    global _classifier
+    current = _classifier
+    if current is not None and current[0] == snapshot.generation:
+        return current[1]
+    with _classifier_lock:
+        if _classifier is None or _classifier[0] != snapshot.generation:
+            _classifier = (snapshot.generation, MerchantClassifier(snapshot.cards))
+        return _classifier[1]
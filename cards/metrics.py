@@ -0,0 +1,184 @@
+"""
+In-process counters, gauges and histograms for the recommendation engine,
+rendered in the Prometheus text format by the /api/metrics/ endpoint.
+
+Values are per worker process and reset on restart; a scraper aggregates them.
+Updates take a lock and a few additions, so they are cheap enough for the hot path.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def samples(self):
+        with self._lock:
+            return [(f'{self.name}{self._labels(key)}', value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name} {_format(value)}' for name, value in self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            states = [(key, list(state[0]), state[1], state[2]) for key, state in sorted(self._values.items())]
+        samples = []
+        for key, bucket_counts, total, count in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _format(bound)
+                samples.append((f'{self.name}_bucket{self._labels(key, [("le", le)])}', cumulative))
+            samples.append((f'{self.name}_sum{self._labels(key)}', total))
+            samples.append((f'{self.name}_count{self._labels(key)}', count))
+        return samples
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """
+    Observes the wall time of the with block, in seconds, into the histogram.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def render_metrics():
+    """
+    Returns every registered metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _format(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+phase_seconds = Histogram(
+    'recommendation_phase_seconds',
+    'Time spent in each phase of building recommendations.',
+    ['phase'],
+)
+recommendation_seconds = Histogram(
+    'recommendation_seconds',
+    'Time to score one spending profile, by group size.',
+    ['group_size'],
+)
+candidates_total = Counter(
+    'recommendation_candidates_total',
+    'Cards considered by the recommendation engine.',
+)
+groups_scored_total = Counter(
+    'recommendation_groups_scored_total',
+    'Candidate card groups fully scored by the group search.',
+)
+groups_pruned_total = Counter(
+    'recommendation_groups_pruned_total',
+    'Branches of the group search cut by its bound or dropped as not self-contributing.',
+)
+cache_requests_total = Counter(
+    'recommendation_cache_requests_total',
+    'Recommendation result cache lookups.',
+    ['result'],
+)
+card_payload_requests_total = Counter(
+    'card_payload_cache_requests_total',
+    'Serialized card payload cache lookups.',
+    ['result'],
+)
+catalog_cards = Gauge(
+    'catalog_cards',
+    'Cards in this worker\'s catalog snapshot.',
+)
+catalog_snapshot_seconds = Histogram(
+    'catalog_snapshot_build_seconds',
+    'Time to load and index the catalog snapshot.',
+)
@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-17 22:02
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The valuation as of this migration, kept here so later changes to cards.utils do not alter it
+def parse_benefit_value(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = re.search(r"[₹Rs. ]*(\d+[\.,]?\d*)", value)
+        if match:
+            return float(match.group(1).replace(",", ""))
+    return 0.0
+
+
+def create_value_summaries(apps, schema_editor):
+    CreditCard = apps.get_model('cards', 'CreditCard')
+    CardValueSummary = apps.get_model('cards', 'CardValueSummary')
+    cards = CreditCard.objects.prefetch_related('welcome_benefits', 'milestone_bonuses', 'card_benefits')
+    CardValueSummary.objects.bulk_create(
+        CardValueSummary(
+            card=card,
+            annual_fee=card.effective_annual_fee or card.annual_fee or 0,
+            welcome_benefits=sum(parse_benefit_value(benefit.value) for benefit in card.welcome_benefits.all()),
+            milestone_bonuses=sum(bonus.bonus_value for bonus in card.milestone_bonuses.all()),
+            other_benefits=sum(parse_benefit_value(benefit.value) for benefit in card.card_benefits.all()),
+        )
+        for card in cards.iterator(chunk_size=500)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0014_catalogversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardValueSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('annual_fee', models.PositiveIntegerField(default=0)),
+                ('welcome_benefits', models.FloatField(default=0)),
+                ('milestone_bonuses', models.IntegerField(default=0)),
+                ('other_benefits', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('card', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='value_summary', to='cards.creditcard')),
+            ],
+        ),
+        migrations.RunPython(create_value_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 22:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0015_cardvaluesummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardImportFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('card', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='import_fingerprint', to='cards.creditcard')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0016_cardimportfingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='creditcard',
+            index=models.Index(fields=['annual_fee', 'id'], name='card_annual_fee_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='creditcard',
+            index=models.Index(fields=['effective_annual_fee', 'id'], name='card_effective_fee_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='creditcard',
+            index=models.Index(fields=['promotional_order', 'id'], name='card_promo_order_id_idx'),
+        ),
+    ]
@@ -45,6 +45,14 @@ class CreditCard(models.Model):
     apply_url = models.URLField(null=True, blank=True)
     summary = models.TextField(null=True, blank=True)
 
+    class Meta:
+        # Keyset pagination of the card list on each of its orderings
+        indexes = [
+            models.Index(fields=['annual_fee', 'id'], name='card_annual_fee_id_idx'),
+            models.Index(fields=['effective_annual_fee', 'id'], name='card_effective_fee_id_idx'),
+            models.Index(fields=['promotional_order', 'id'], name='card_promo_order_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.bank.name} {self.card_name}"
 
@@ -176,4 +184,37 @@ class Highlight(models.Model):
     highlight = models.JSONField(help_text="Structured highlight data for the card")
 
     def __str__(self):
-        return f"Highlight for {self.card}"
\ No newline at end of file
+        return f"Highlight for {self.card}"
+
+
+class CardValueSummary(models.Model):
+    # Net-benefit components of a card, refreshed whenever the card or its benefits change,
+    # so the recommendation engine reads numbers instead of parsing benefit strings
+    card = models.OneToOneField(CreditCard, on_delete=models.CASCADE, related_name='value_summary')
+    annual_fee = models.PositiveIntegerField(default=0)
+    welcome_benefits = models.FloatField(default=0)
+    milestone_bonuses = models.IntegerField(default=0)
+    other_benefits = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Value summary for {self.card}"
+
+
+class CardImportFingerprint(models.Model):
+    # Hash of the normalized import JSON a card was last written from, so re-imports skip unchanged cards
+    card = models.OneToOneField(CreditCard, on_delete=models.CASCADE, related_name='import_fingerprint')
+    digest = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import fingerprint for {self.card}"
+
+
+class CatalogVersion(models.Model):
+    # Single row bumped whenever card data changes, so every worker can tell its catalog snapshot is stale
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
@@ -0,0 +1,47 @@
+"""
+Cache of each card's serialized CreditCardSerializer representation.
+
+A card's payload is the same wherever it is rendered (card lists, recommendation
+groups, banners, users' cards), so CreditCardSerializer builds it once and reuses
+it. Payloads are built from the snapshot's own card instances, never from the
+caller's (which may have been loaded before a change the snapshot already
+reflects), and belong to that snapshot: any catalog change, saved in this
+worker or picked up from another through the version counter, replaces the
+snapshot and so retires every entry.
+"""
+from . import metrics
+from .snapshot import get_catalog_snapshot
+
+# card id -> (snapshot generation, payload)
+_payloads = {}
+
+
+def get_card_payload(card, build):
+    """
+    Returns the payload of a saved card as of the current catalog snapshot, calling
+    build() with the snapshot's instance of the card on a miss. A card missing from
+    the snapshot is built from the given instance and not cached.
+    The cached payload is never handed out: callers get their own copy.
+    """
+    snapshot = get_catalog_snapshot()
+    entry = _payloads.get(card.pk)
+    if entry is not None and entry[0] == snapshot.generation:
+        metrics.card_payload_requests_total.inc(result='hit')
+        return _copy(entry[1])
+    metrics.card_payload_requests_total.inc(result='miss')
+    source = snapshot.all_cards_by_id.get(card.pk)
+    if source is None:
+        return build(card)
+    payload = build(source)
+    _payloads[card.pk] = (snapshot.generation, payload)
+    return _copy(payload)
+
+
+def _copy(value):
+    # Deep copy of the dicts and lists a payload is made of; the leaves (strings, numbers,
+    # dates) are immutable. Faster than copy.deepcopy.
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
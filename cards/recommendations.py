@@ -0,0 +1,205 @@
+"""
+Builds recommendation responses and caches them by spending profile.
+
+Results are cached under a hash of the validated spending list, the group size
+and the catalog version, so a catalog change never serves stale groups. The cache
+backend is the Django cache named by RECOMMENDATION_CACHE_ALIAS: locmem (LRU, with
+a TTL) for a single worker, or a file-based or database cache to share results
+between workers.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .serializers import CreditCardSerializer
+from .utils import build_savings_matrix, format_spend_label, get_rule_index, get_top_card_groups
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def build_recommendations(cards, spending, group_size, savings_matrix=None):
+    """
+    Returns the recommendation response body for a validated spending list.
+    """
+    started = time.perf_counter()
+    result = _build_recommendations(cards, spending, group_size, savings_matrix)
+    metrics.recommendation_seconds.observe(time.perf_counter() - started, group_size=group_size_label(group_size))
+    return result
+
+
+def group_size_label(group_size):
+    # Bounded metric label: '0' to '4', then '5+'
+    return str(group_size) if group_size < 5 else '5+'
+
+
+def _build_recommendations(cards, spending, group_size, savings_matrix):
+    # Generate top groups of group_size
+    group_results = get_top_card_groups(cards, spending, group_size=group_size, max_groups=10, savings_matrix=savings_matrix)
+    serialization_started = time.perf_counter()
+    groups = []
+    filtered_groups = []
+    seen_groups = set()
+    for group_result in group_results:
+        # Only include groups with strictly positive netBenefit
+        if group_result.get('netBenefit', 0) <= 0:
+            continue
+        group_cards = group_result['cards']
+        # ensure uniqueness: skip if same card ID set seen
+        card_ids = tuple(sorted(card.id for card in group_cards))
+        if card_ids in seen_groups:
+            continue
+        seen_groups.add(card_ids)
+        group_cards_serialized = []
+        for card in group_cards:
+            savings_breakdown = [
+                {
+                    'spendEntry': b['spendEntry'],
+                    'savings': b['savings'],
+                    'cashbackPercent': b['cashbackPercent'],
+                    'spendLabel': b.get('spendLabel') or format_spend_label(b['spendEntry'])
+                }
+                for b in group_result.get('breakdown', []) if b.get('bestCardId') == card.id
+            ]
+            total_spend = sum(b['spendEntry'].get('amount', 0) for b in group_result.get('breakdown', []))
+            covered_spend = sum(b['spendEntry'].get('amount', 0) for b in savings_breakdown)
+            if total_spend > 0:
+                coverage_percentage = round(covered_spend / total_spend * 100, 2)
+            else:
+                coverage_percentage = 0.0
+            group_cards_serialized.append({
+                'card': CreditCardSerializer(card).data,
+                'cardName': card.card_name,
+                'savingsBreakdown': [
+                    {
+                        **b,
+                        'category': b['spendEntry'].get('category', ''),
+                        'amount': b['spendEntry'].get('amount', 0)
+                    }
+                    for b in savings_breakdown
+                ],
+                'spendCoverage': coverage_percentage,
+                'netBenefit': group_result['cardNetBenefits'].get(card.id, {}).get('net_benefit', 0),
+                'totalMonthlySavings': sum((b['savings'] or 0) for b in savings_breakdown)
+            })
+        # Only include groups with at least one valuable card
+        if not group_cards_serialized:
+            continue
+        filtered_groups.append({
+            'cards': group_cards_serialized,
+            'totalGroupSavings': group_result.get('totalSavings', 0),
+            'spendCoverage': group_result.get('spendCoverage', 0),
+            'breakdown': group_result.get('breakdown', []),
+            'netBenefit': group_result.get('netBenefit', 0),
+            'cardNetBenefits': group_result.get('cardNetBenefits', {})
+        })
+    # Order by totalGroupSavings descending
+    groups = sorted(filtered_groups, key=lambda g: g['totalGroupSavings'], reverse=True)
+    # Do NOT pad the groups list to 10; just return as many as make sense (up to 10)
+    groups = groups[:10]
+    metrics.phase_seconds.observe(time.perf_counter() - serialization_started, phase='serialization')
+
+    # Prepare spendToCardSavings as before
+    spend_savings_started = time.perf_counter()
+    spend_to_card_savings = []
+    for idx, spend in enumerate(spending):
+        spend_entry = {
+            'spendEntryIndex': idx,
+            'category': spend.get('category', ''),
+            'amount': spend.get('amount', 0),
+            'cardSavings': []
+        }
+        category = (spend.get('category') or '').lower()
+        for card in cards:
+            rule_index = get_rule_index(card)
+            matched_rule = rule_index.by_category.get(category)
+            if matched_rule and matched_rule.cashback_percent:
+                cashback_percent = matched_rule.cashback_percent
+            elif rule_index.default_cashback:
+                cashback_percent = rule_index.default_cashback.cashback_percent
+            else:
+                cashback_percent = 0
+            savings = round(spend.get('amount', 0) * cashback_percent / 100, 2)
+            spend_entry['cardSavings'].append({
+                'cardId': card.id,
+                'cardName': card.card_name,
+                'savings': savings,
+                'cashbackPercent': cashback_percent
+            })
+        spend_to_card_savings.append(spend_entry)
+    metrics.phase_seconds.observe(time.perf_counter() - spend_savings_started, phase='spend_savings')
+    return {
+        "recommendations": groups,
+        "spendToCardSavings": spend_to_card_savings
+    }
+
+
+def build_batch_recommendations(cards, profiles):
+    """
+    Returns the response bodies for a list of (spending, group_size) profiles, in order.
+    The savings of every distinct spend entry across all profiles are computed in a
+    single matrix, which each profile then reads its own columns from.
+    """
+    columns = {}
+    distinct_spends = []
+    profile_columns = []
+    for spending, _ in profiles:
+        profile_columns.append([])
+        for spend in spending:
+            fingerprint = json.dumps(spend, sort_keys=True, default=str)
+            if fingerprint not in columns:
+                columns[fingerprint] = len(distinct_spends)
+                distinct_spends.append(spend)
+            profile_columns[-1].append(columns[fingerprint])
+    cards = list(cards)
+    with metrics.timed(metrics.phase_seconds, phase='rule_matching'):
+        savings, cashback_percents = build_savings_matrix(cards, distinct_spends)
+    return [
+        build_recommendations(
+            cards, spending, group_size,
+            savings_matrix=(savings[:, profile_columns[i]], cashback_percents[:, profile_columns[i]])
+        )
+        for i, (spending, group_size) in enumerate(profiles)
+    ]
+
+
+def recommendation_cache_key(catalog_version, spending, group_size):
+    """
+    Returns the cache key of a spending profile: a hash of the canonical JSON of the
+    spending list (entry order kept, keys sorted) and the group size, scoped to the catalog version.
+    """
+    profile = json.dumps([spending, group_size], sort_keys=True, separators=(',', ':'), default=str)
+    return f'recommend:{catalog_version}:{hashlib.sha256(profile.encode()).hexdigest()}'
+
+
+def _cache():
+    return caches[getattr(settings, 'RECOMMENDATION_CACHE_ALIAS', 'default')]
+
+
+def get_cached_recommendation(key):
+    result = _cache().get(key)
+    with _stats_lock:
+        _stats['hits' if result is not None else 'misses'] += 1
+    metrics.cache_requests_total.inc(result='hit' if result is not None else 'miss')
+    return result
+
+
+def cache_recommendation(key, result):
+    _cache().set(key, result)
+
+
+def get_recommendation_cache_stats():
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hitRate': round(hits / lookups, 4) if lookups else 0.0,
+        'backend': getattr(settings, 'RECOMMENDATION_CACHE_ALIAS', 'default'),
+    }
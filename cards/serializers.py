@@ -1,4 +1,9 @@
+from functools import cache
+from django.conf import settings
 from rest_framework import serializers
+from indiacard_backend.profiling import ProfiledSerializerMixin
+from .catalog import CARD_FIELD_RELATIONS
+from .payloads import get_card_payload
 from .models import (
     CreditCard, FeeWaiver, RewardPointConversion, DefaultCashback,
     CashbackRule, RewardMultiplier, WelcomeBenefit, MilestoneBonus,
@@ -6,6 +11,9 @@ from .models import (
     Bank, Highlight
 )
 
+# Largest number of cards per recommended group
+MAX_GROUP_SIZE = 10
+
 class BankSerializer(serializers.ModelSerializer):
     class Meta:
         model = Bank
@@ -66,7 +74,7 @@ class HighlightSerializer(serializers.ModelSerializer):
         model = Highlight
         fields = ['highlight']
 
-class CreditCardSerializer(serializers.ModelSerializer):
+class CreditCardSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     bank = BankSerializer(read_only=True)
     bank_id = serializers.PrimaryKeyRelatedField(queryset=Bank.objects.all(), source='bank', write_only=True)
     # Expose flat list of highlights instead of nested dict
@@ -91,7 +99,64 @@ class CreditCardSerializer(serializers.ModelSerializer):
         model = CreditCard
         fields = '__all__'
 
-class PromotionalBannerSerializer(serializers.ModelSerializer):
+    def get_fields(self):
+        fields = super().get_fields()
+        # A 'card_fields' set in the context (see requested_card_fields) limits the fields returned
+        requested = self.context.get('card_fields')
+        if requested is not None:
+            for name in list(fields):
+                if name not in requested and not fields[name].write_only:
+                    del fields[name]
+        return fields
+
+    def to_representation(self, instance):
+        # The representation does not depend on the caller, so each card is built once per catalog version;
+        # partial representations are cheap and built directly
+        if getattr(instance, 'pk', None) is None or self.context.get('card_fields') is not None:
+            return super().to_representation(instance)
+        return get_card_payload(instance, super().to_representation)
+
+
+# Nested relations that ?expand= can add
+EXPANDABLE_CARD_FIELDS = frozenset(name for name in CARD_FIELD_RELATIONS if name != 'issuer')
+
+
+@cache
+def _card_field_names():
+    return frozenset(name for name, field in CreditCardSerializer().fields.items() if not field.write_only)
+
+
+def requested_card_fields(query_params):
+    """
+    Returns the CreditCardSerializer fields asked for with ?fields= and ?expand=
+    (comma separated), or None when neither is given and every field is returned.
+    `fields` lists the fields to return and `expand` adds nested relations to them;
+    with `expand` alone, the relations are added to every plain field.
+    """
+    fields = _split_names(query_params.get('fields'))
+    expand = _split_names(query_params.get('expand'))
+    if fields is None and expand is None:
+        return None
+    errors = {}
+    unknown = sorted((fields or set()) - _card_field_names())
+    if unknown:
+        errors['fields'] = [f'Unknown fields: {", ".join(unknown)}.']
+    unknown = sorted((expand or set()) - EXPANDABLE_CARD_FIELDS)
+    if unknown:
+        errors['expand'] = [f'Cannot expand: {", ".join(unknown)}.']
+    if errors:
+        raise serializers.ValidationError(errors)
+    if fields is None:
+        fields = _card_field_names() - EXPANDABLE_CARD_FIELDS
+    return frozenset(fields | (expand or set()))
+
+
+def _split_names(value):
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+class PromotionalBannerSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     card = CreditCardSerializer(read_only=True)
     class Meta:
         model = PromotionalBanner
@@ -121,19 +186,47 @@ class PreferencesSerializer(serializers.Serializer):
     cards_to_compare = serializers.ListField(child=serializers.CharField(), required=False)
     cards_to_exclude = serializers.ListField(child=serializers.CharField(), required=False)
     cards_you_own = serializers.ListField(child=serializers.CharField(), required=False)
-    num_new_cards = serializers.IntegerField(required=False)
+    num_new_cards = serializers.IntegerField(required=False, min_value=0, max_value=MAX_GROUP_SIZE)
     # Desired number of cards per group from frontend
-    desiredCardCount = serializers.IntegerField(required=False)
+    desiredCardCount = serializers.IntegerField(required=False, min_value=0, max_value=MAX_GROUP_SIZE)
 
 class CardRecommendationInputSerializer(serializers.Serializer):
     spending = serializers.ListField(child=SpendingSerializer(), required=True)
     preferences = PreferencesSerializer(required=False)
 
+class BatchRecommendationInputSerializer(serializers.Serializer):
+    profiles = serializers.ListField(child=CardRecommendationInputSerializer(), allow_empty=False)
+
+    def validate_profiles(self, value):
+        max_profiles = getattr(settings, 'RECOMMEND_BATCH_MAX_PROFILES', 100)
+        if len(value) > max_profiles:
+            raise serializers.ValidationError(f"At most {max_profiles} profiles can be scored per request.")
+        return value
+
+class StatementUploadSerializer(serializers.Serializer):
+    statement = serializers.FileField()
+    desiredCardCount = serializers.IntegerField(required=False, default=1, min_value=1, max_value=MAX_GROUP_SIZE)
+
 class PurchaseAdvisorInputSerializer(serializers.Serializer):
-    amount = serializers.FloatField(required=True)
-    category = serializers.CharField(required=True)
-    platform = serializers.CharField(required=False, allow_blank=True)
-    platform_name = serializers.CharField(required=False, allow_blank=True)
-    specific_category = serializers.CharField(required=False, allow_blank=True)
-    brand = serializers.CharField(required=False, allow_blank=True)
-    owned_cards = serializers.ListField(child=serializers.IntegerField(), required=True)
\ No newline at end of file
+    purchases = serializers.ListField(child=SpendingSerializer(), allow_empty=False)
+    owned_cards = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate_purchases(self, value):
+        max_purchases = getattr(settings, 'PURCHASE_ADVISOR_MAX_PURCHASES', 50)
+        if len(value) > max_purchases:
+            raise serializers.ValidationError(f"At most {max_purchases} purchases can be checked per request.")
+        return value
+
+class MerchantClassifyInputSerializer(serializers.Serializer):
+    # A JSONField checked by hand: a ListField of CharFields costs more than classifying 100k strings
+    merchants = serializers.JSONField()
+
+    def validate_merchants(self, value):
+        if not isinstance(value, list) or not value:
+            raise serializers.ValidationError("Expected a non-empty list of merchant strings.")
+        max_items = getattr(settings, 'MERCHANT_CLASSIFY_MAX_ITEMS', 100000)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"At most {max_items} merchants can be classified per request.")
+        if not all(isinstance(merchant, str) for merchant in value):
+            raise serializers.ValidationError("Every merchant must be a string.")
+        return value
\ No newline at end of file
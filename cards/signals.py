@@ -0,0 +1,80 @@
+"""
+Keeps the in-process catalog snapshot in step with card data.
+
+Any save or delete on a cards model (and changes to card filters) marks the
+snapshot stale and, once the transaction commits, bumps the CatalogVersion
+counter so other workers reload too. Changes to a card or its welcome,
+milestone and other benefits also refresh the card's CardValueSummary, before
+the version is bumped. Both happen once per transaction, however many rows it
+changed.
+"""
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .snapshot import bump_catalog_version, invalidate_catalog_snapshot
+from .valuation import refresh_card_value_summaries
+
+# Models whose rows feed CardValueSummary
+VALUE_MODELS = ('CreditCard', 'WelcomeBenefit', 'MilestoneBonus', 'CardBenefit')
+# Derived tables, maintained alongside the card data rather than being part of it
+DERIVED_MODELS = ('CatalogVersion', 'CardValueSummary', 'CardImportFingerprint')
+
+
+class PendingCatalogChange:
+    """
+    On-commit callback of a transaction that changed card data: refreshes the value
+    summaries of the cards collected in it, then bumps the version, once per transaction.
+    """
+
+    def __init__(self):
+        self.card_ids = set()
+        self.applied = False
+
+    def __call__(self):
+        self.applied = True
+        if self.card_ids:
+            refresh_card_value_summaries(sorted(self.card_ids))
+        bump_catalog_version()
+
+
+def _pending_change(using):
+    # The change already registered in the current transaction, if any. Django drops the
+    # callbacks of rolled back savepoints, so a change made after such a rollback registers anew.
+    for _, callback, _ in transaction.get_connection(using).run_on_commit:
+        if isinstance(callback, PendingCatalogChange) and not callback.applied:
+            return callback
+    return None
+
+
+def schedule_catalog_change(card_ids=(), using=None):
+    """
+    Adds card_ids to the current transaction's PendingCatalogChange, registering one if
+    needed. Bulk writes, which send no signals, call this to share the transaction's
+    single version bump. Outside a transaction the change runs at once.
+    """
+    change = _pending_change(using)
+    registered = change is not None
+    if not registered:
+        change = PendingCatalogChange()
+    change.card_ids.update(card_ids)
+    if not registered:
+        transaction.on_commit(change, using=using)
+
+
+def catalog_changed(sender, instance=None, using=None, **kwargs):
+    invalidate_catalog_snapshot()
+    card_ids = ()
+    if sender.__name__ in VALUE_MODELS and instance is not None:
+        card_ids = (instance.pk if sender.__name__ == 'CreditCard' else instance.card_id,)
+    schedule_catalog_change(card_ids, using=using)
+
+
+def connect_catalog_signals():
+    CreditCard = apps.get_model('cards', 'CreditCard')
+    for model in apps.get_app_config('cards').get_models():
+        if model.__name__ in DERIVED_MODELS:
+            continue
+        post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_changed_save_{model.__name__}')
+        post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_changed_delete_{model.__name__}')
+    m2m_changed.connect(catalog_changed, sender=CreditCard.filters.through, dispatch_uid='catalog_changed_filters')
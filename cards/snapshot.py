@@ -0,0 +1,138 @@
+"""
+In-process, read-only snapshot of the card catalog.
+
+Each worker loads the catalog lazily on first use and keeps it until card data
+changes. Saves and deletes in this process mark it stale through signals (see
+cards.signals); changes made by other processes are picked up by comparing the
+CatalogVersion counter, which is read at most once every
+CATALOG_VERSION_CHECK_INTERVAL seconds. A stale snapshot is rebuilt and swapped
+in as a whole, so requests never see a half-updated catalog.
+"""
+import itertools
+import threading
+import time
+from types import MappingProxyType
+
+from django.conf import settings
+from django.db.models import F
+
+from . import metrics
+from .catalog import load_catalog
+from .models import CatalogVersion
+from .utils import get_card_benefit_components, get_rule_index
+
+_snapshot = None
+_stale = False
+_checked_at = 0.0
+_lock = threading.Lock()
+_generations = itertools.count(1)
+
+
+class CatalogSnapshot:
+    """
+    Cards with their compiled rule indexes and benefit values, plus the category,
+    subcategory and brand vocabularies served by the lookup endpoints.
+    `cards` holds the cards still offered; discontinued cards are only kept in
+    `all_cards_by_id`, for rendering the cards users already hold.
+    The cards are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, version, cards):
+        self.version = version
+        # Unique per snapshot, unlike version: a snapshot rebuilt inside an open transaction keeps the version
+        self.generation = next(_generations)
+        cards = tuple(cards)
+        self.all_cards_by_id = MappingProxyType({card.id: card for card in cards})
+        self.cards = tuple(card for card in cards if card.status != 0)
+        self.cards_by_id = MappingProxyType({card.id: card for card in self.cards})
+        subcategories = {}
+        brands = {}
+        for card in self.cards:
+            get_rule_index(card)
+            get_card_benefit_components(card)
+            for rule in card.cashback_rules.all():
+                if rule.category and rule.subcategory:
+                    subcategories.setdefault(rule.category, set()).add(rule.subcategory)
+                if rule.brand:
+                    rule_brands = rule.brand if isinstance(rule.brand, list) else [rule.brand]
+                    # Brands are looked up by category, subcategory, both or neither
+                    for key in {(rule.category, rule.subcategory), (rule.category, None), (None, rule.subcategory), (None, None)}:
+                        brands.setdefault(key, set()).update(rule_brands)
+        self.categories = tuple(sorted(
+            {rule.category for card in self.cards for rule in card.cashback_rules.all() if rule.category}
+        ))
+        self._subcategories = MappingProxyType({key: tuple(sorted(value)) for key, value in subcategories.items()})
+        self._brands = MappingProxyType({key: tuple(sorted(value)) for key, value in brands.items()})
+
+    def subcategories(self, category):
+        return self._subcategories.get(category, ())
+
+    def brands(self, category=None, subcategory=None):
+        return self._brands.get((category or None, subcategory or None), ())
+
+
+def get_catalog_version():
+    """
+    Returns the catalog version counter stored in the database.
+    """
+    return CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def get_catalog_stamp():
+    """
+    Returns the catalog version without loading the catalog: the snapshot's while it is
+    fresh, otherwise the counter read from the database. Catalog data read after this
+    call is never older than the returned version, so it can tag responses (ETags).
+    """
+    global _checked_at
+    interval = getattr(settings, 'CATALOG_VERSION_CHECK_INTERVAL', 5)
+    snapshot = _snapshot
+    if snapshot is not None and not _stale and time.monotonic() - _checked_at < interval:
+        return snapshot.version
+    version = get_catalog_version()
+    with _lock:
+        # An unchanged counter also confirms the snapshot, sparing get_catalog_snapshot() the same check
+        if _snapshot is not None and not _stale and _snapshot.version == version:
+            _checked_at = time.monotonic()
+    return version
+
+
+def bump_catalog_version():
+    """
+    Increments the database version counter and marks this worker's snapshot stale.
+    Called for every change to card data; bulk writes that bypass signals must call it too.
+    """
+    if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+    invalidate_catalog_snapshot()
+
+
+def invalidate_catalog_snapshot():
+    """
+    Marks this worker's snapshot stale; the next get_catalog_snapshot() call rebuilds it.
+    """
+    global _stale
+    _stale = True
+
+
+def get_catalog_snapshot():
+    """
+    Returns the current catalog snapshot, loading or refreshing it when needed.
+    """
+    global _snapshot, _stale, _checked_at
+    snapshot = _snapshot
+    interval = getattr(settings, 'CATALOG_VERSION_CHECK_INTERVAL', 5)
+    if snapshot is not None and not _stale and time.monotonic() - _checked_at < interval:
+        return snapshot
+    with _lock:
+        if _snapshot is not None and not _stale and time.monotonic() - _checked_at < interval:
+            return _snapshot
+        # Read the version before the cards, so a change landing in between triggers another reload
+        version = get_catalog_version()
+        _checked_at = time.monotonic()
+        if _snapshot is None or _stale or _snapshot.version != version:
+            _stale = False
+            with metrics.timed(metrics.catalog_snapshot_seconds):
+                _snapshot = CatalogSnapshot(version, load_catalog())
+            metrics.catalog_cards.set(len(_snapshot.cards))
+        return _snapshot
@@ -0,0 +1,130 @@
+"""
+Bank statement ingestion: turns a statement CSV into a spending list for the recommender.
+
+The file is read row by row and only per-merchant-class totals are kept, so memory
+does not grow with the number of rows. Each debit row's description is mapped to
+the category / subcategory / brand / platform vocabulary of the catalog's cashback
+rules by the merchant classifier (see cards.merchants); totals are averaged over
+the months the statement covers.
+"""
+import csv
+import io
+from datetime import datetime
+
+# Header names used by Indian bank statement exports, lower-cased
+DESCRIPTION_COLUMNS = ('description', 'narration', 'particulars', 'merchant', 'transaction details', 'details',
+                       'remarks')
+DEBIT_COLUMNS = ('debit', 'debit amount', 'withdrawal', 'withdrawal amt.', 'withdrawal amount', 'dr')
+AMOUNT_COLUMNS = ('amount', 'transaction amount', 'amount (inr)')
+TYPE_COLUMNS = ('type', 'dr/cr', 'cr/dr', 'transaction type')
+DATE_COLUMNS = ('date', 'transaction date', 'txn date', 'value date', 'posting date')
+DATE_FORMATS = ('%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d-%m-%y', '%Y-%m-%d', '%d %b %Y', '%d-%b-%Y', '%d-%b-%y')
+
+# Spending entries returned at most; smaller merchant classes are folded into OTHER_CATEGORY
+MAX_SPENDS = 20
+OTHER_CATEGORY = 'Others'
+
+
+class StatementError(ValueError):
+    pass
+
+
+def read_statement(binary_file, encoding='utf-8-sig'):
+    """
+    Yields (date or None, description, debit amount) for every debit row of a statement
+    CSV, reading the file as a stream. Credit and unparsable rows are skipped.
+    """
+    text = io.TextIOWrapper(binary_file, encoding=encoding, errors='replace', newline='')
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise StatementError('The statement is empty.')
+        columns = {name.strip().lower(): name for name in reader.fieldnames if name}
+        description_column = _find_column(columns, DESCRIPTION_COLUMNS)
+        debit_column = _find_column(columns, DEBIT_COLUMNS)
+        amount_column = _find_column(columns, AMOUNT_COLUMNS)
+        type_column = _find_column(columns, TYPE_COLUMNS)
+        date_column = _find_column(columns, DATE_COLUMNS)
+        if description_column is None or (debit_column is None and amount_column is None):
+            raise StatementError('The statement needs a description column and a debit or amount column.')
+        for row in reader:
+            if debit_column is not None:
+                amount = _parse_amount(row.get(debit_column))
+            else:
+                amount = _parse_amount(row.get(amount_column))
+                kind = (row.get(type_column) or '').strip().lower() if type_column else ''
+                if kind.startswith('c'):
+                    continue
+            if amount is None or amount <= 0:
+                continue
+            date = _parse_date(row.get(date_column)) if date_column else None
+            yield date, row.get(description_column) or '', amount
+    finally:
+        # Leave the underlying upload open for its owner to close
+        text.detach()
+
+
+def build_spending_from_statement(binary_file, classifier, max_spends=MAX_SPENDS):
+    """
+    Aggregates a statement into a spending list shaped like SpendingSerializer input,
+    with monthly amounts. Returns (spending, summary).
+    """
+    totals = {}
+    months = set()
+    rows = matched = 0
+    for date, description, amount in read_statement(binary_file):
+        rows += 1
+        if date is not None:
+            months.add((date.year, date.month))
+        category, subcategory, brand, platform, _ = classifier.classify(description)
+        if category or brand:
+            matched += 1
+        key = (category or OTHER_CATEGORY, subcategory, brand, platform)
+        totals[key] = totals.get(key, 0.0) + amount
+    month_count = max(len(months), 1)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    if len(ranked) > max_spends:
+        # Fold the smallest classes into one catch-all entry
+        other_key = (OTHER_CATEGORY, None, None, None)
+        kept = dict(ranked[:max_spends - 1])
+        kept[other_key] = kept.get(other_key, 0.0) + sum(amount for _, amount in ranked[max_spends - 1:])
+        ranked = list(kept.items())
+    spending = []
+    for (category, subcategory, brand, platform), amount in ranked:
+        spend = {'category': category, 'amount': round(amount / month_count, 2)}
+        if subcategory:
+            spend['subcategory'] = subcategory
+        if brand:
+            spend['brand'] = brand
+        if platform:
+            spend['platform'] = platform
+        spending.append(spend)
+    summary = {'rows': rows, 'matchedRows': matched, 'months': month_count}
+    return spending, summary
+
+
+def _find_column(columns, candidates):
+    for candidate in candidates:
+        if candidate in columns:
+            return columns[candidate]
+    return None
+
+
+def _parse_amount(value):
+    value = (value or '').replace(',', '').replace('₹', '').replace('INR', '').strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
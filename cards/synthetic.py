@@ -0,0 +1,150 @@
+"""
+Synthetic card catalogs and spending profiles for benchmarks and tests.
+
+The vocabulary and the mix of rule kinds follow the shape of the real catalog:
+most cashback rules target a category or a subcategory, a fair share name
+brands or a platform, and percentages cluster around 1-5%.
+"""
+import random
+
+from .models import (
+    Bank, CardBenefit, CashbackRule, CreditCard, DefaultCashback, MilestoneBonus, WelcomeBenefit
+)
+from .snapshot import bump_catalog_version
+from .valuation import refresh_card_value_summaries
+
+# category -> subcategory -> brands
+CATEGORIES = {
+    'Shopping': {
+        'Online Shopping': ['Amazon', 'Flipkart', 'Myntra', 'Ajio', 'Tata CLiQ', 'Nykaa'],
+        'Offline Shopping': ['Shoppers Stop', 'Lifestyle', 'Croma', 'Reliance Digital'],
+    },
+    'Food Delivery': {
+        'Online Food Orders': ['Swiggy', 'Zomato'],
+    },
+    'Dining': {
+        'Restaurants': ['Dineout', 'EazyDiner'],
+        'Weekends': [],
+    },
+    'Groceries': {
+        'Online Grocery': ['BigBasket', 'Blinkit', 'Zepto', 'JioMart'],
+        'Supermarket': ['DMart', 'More', 'Star Bazaar'],
+    },
+    'Travel': {
+        'Flights': ['MakeMyTrip', 'Cleartrip', 'Air India', 'IndiGo'],
+        'Hotels': ['IHCL (Taj Hotels)', 'Marriott', 'OYO'],
+        'Train Tickets': ['IRCTC'],
+    },
+    'Transport': {
+        'Ride Hailing': ['Uber', 'Ola', 'Rapido'],
+    },
+    'Entertainment': {
+        'Movie Tickets': ['BookMyShow', 'PVR INOX'],
+        'Streaming': ['Netflix', 'Prime Video', 'Hotstar'],
+    },
+    'Utilities': {
+        'Bill Payments': ['Airtel', 'Jio', 'Tata Power'],
+        'Recharge': ['Airtel', 'Jio', 'Vi'],
+    },
+    'Fuel': {
+        'Fuel Stations': ['IndianOil', 'HP', 'BPCL'],
+    },
+    'Health': {
+        'Pharmacy': ['1mg', 'PharmEasy', 'Apollo'],
+    },
+}
+PLATFORMS = ['Paytm', 'SmartBuy', 'PhonePe', 'Google Pay', 'Amazon Pay']
+NETWORKS = ['Visa', 'Mastercard', 'RuPay', 'American Express']
+ANNUAL_FEES = [0, 0, 199, 499, 500, 999, 1499, 2500, 5000, 10000]
+# Percentages weighted like the real catalog
+CASHBACK_PERCENTS = [5.0] * 6 + [3.0] * 3 + [2.0] * 3 + [1.0] * 3 + [1.5, 2.5, 7.0, 10.0, 15.0]
+# Share of rules per kind: brand, subcategory, category, platform
+RULE_KINDS = ['brand'] * 4 + ['subcategory'] * 2 + ['category'] * 3 + ['platform']
+SPEND_AMOUNTS = [500, 1000, 2000, 2500, 3000, 5000, 8000, 10000, 15000, 25000]
+
+
+def generate_catalog(banks=10, cards=100, rules=600, seed=0):
+    """
+    Creates banks, cards and cashback rules (spread over the cards) with default
+    cashback, welcome and milestone benefits, using bulk inserts.
+    Returns the created cards. The catalog version is bumped once at the end.
+    """
+    rng = random.Random(seed)
+    existing = Bank.objects.count()
+    bank_objects = Bank.objects.bulk_create(
+        Bank(name=f'Synthetic Bank {existing + i}') for i in range(banks)
+    )
+    card_objects = []
+    for i in range(cards):
+        annual_fee = rng.choice(ANNUAL_FEES)
+        card_objects.append(CreditCard(
+            card_name=f'Synthetic Card {i}',
+            bank=rng.choice(bank_objects),
+            network=[rng.choice(NETWORKS)],
+            annual_fee=annual_fee,
+            effective_annual_fee=annual_fee if rng.random() < 0.5 else 0,
+        ))
+    card_objects = CreditCard.objects.bulk_create(card_objects)
+
+    DefaultCashback.objects.bulk_create(
+        DefaultCashback(card=card, cashback_percent=rng.choice([0.5, 1.0, 1.0, 1.5]), min_transaction_amount=0)
+        for card in card_objects if rng.random() < 0.8
+    )
+    rule_objects = []
+    for i in range(rules):
+        # Every card gets at least one rule before any card gets a second
+        card = card_objects[i] if i < len(card_objects) else rng.choice(card_objects)
+        rule_objects.append(CashbackRule(card=card, cashback_percent=rng.choice(CASHBACK_PERCENTS),
+                                         **_rule_target(rng)))
+    CashbackRule.objects.bulk_create(rule_objects)
+
+    welcome, milestones, benefits = [], [], []
+    for card in card_objects:
+        if rng.random() < 0.6:
+            welcome.append(WelcomeBenefit(card=card, benefit_type='Voucher', description='Welcome voucher',
+                                          value=f'₹{rng.choice([250, 500, 1000, 2000])} voucher'))
+        if rng.random() < 0.4:
+            milestones.append(MilestoneBonus(card=card, spend_threshold=rng.choice([50000, 100000, 200000]),
+                                             bonus_type='Voucher', bonus_value=rng.choice([500, 1000, 2500])))
+        if rng.random() < 0.3:
+            benefits.append(CardBenefit(card=card, benefit_type='Lounge', description='Airport lounge access',
+                                        value=f'{rng.choice([1000, 2000, 4000])}'))
+    WelcomeBenefit.objects.bulk_create(welcome)
+    MilestoneBonus.objects.bulk_create(milestones)
+    CardBenefit.objects.bulk_create(benefits)
+
+    # Bulk inserts skip the catalog signals
+    refresh_card_value_summaries([card.id for card in card_objects])
+    bump_catalog_version()
+    return card_objects
+
+
+def _rule_target(rng):
+    kind = rng.choice(RULE_KINDS)
+    category = rng.choice(list(CATEGORIES))
+    if kind == 'platform':
+        return {'platform': rng.choice(PLATFORMS)}
+    if kind == 'category':
+        return {'category': category}
+    subcategory, brands = rng.choice(list(CATEGORIES[category].items()))
+    if kind == 'brand' and brands:
+        return {'category': category, 'subcategory': subcategory,
+                'brand': rng.sample(brands, rng.randint(1, min(3, len(brands))))}
+    return {'category': category, 'subcategory': subcategory}
+
+
+def generate_spending_profile(rng, entries=5):
+    """
+    Returns a spending list shaped like the /api/recommend/ payload, drawn with the given random.Random.
+    """
+    spending = []
+    for _ in range(entries):
+        category = rng.choice(list(CATEGORIES))
+        subcategory, brands = rng.choice(list(CATEGORIES[category].items()))
+        spend = {'category': category, 'subcategory': subcategory, 'amount': rng.choice(SPEND_AMOUNTS)}
+        if brands and rng.random() < 0.7:
+            spend['brand'] = rng.choice(brands)
+        if rng.random() < 0.2:
+            spend['platform'] = rng.choice(PLATFORMS)
+        spending.append(spend)
+    return spending
@@ -1,3 +1,1158 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import tempfile
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import caches
+from django.db import connection
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import metrics
+from .jsonstream import iter_json_records
+from .merchants import NO_MATCH, MerchantMatch, get_merchant_classifier
+from .catalog import catalog_queryset
+from .conditional import etag_salt
+from .group_search import find_top_groups
+from .recommendations import get_recommendation_cache_stats, recommendation_cache_key
+from .serializers import CreditCardSerializer
+from .snapshot import get_catalog_snapshot, get_catalog_version, invalidate_catalog_snapshot
+from .synthetic import generate_catalog, generate_spending_profile
+from .models import (
+    Bank, CardBenefit, CardFilter, CardValueSummary, CashbackRule, CatalogVersion, CreditCard, DefaultCashback, FeeWaiver,
+    FeesAndCharges, Highlight, MilestoneBonus, WelcomeBenefit
+)
+from .utils import (
+    build_savings_matrix, compute_card_benefit_components, get_best_cashback_rule, get_card_benefit_components,
+    get_rule_index, get_top_card_groups
+)
+from .valuation import refresh_card_value_summaries
+
+
+def create_card(bank, name, default_percent=None, rules=()):
+    card = CreditCard.objects.create(card_name=name, bank=bank)
+    if default_percent is not None:
+        DefaultCashback.objects.create(card=card, cashback_percent=default_percent, min_transaction_amount=0)
+    for rule in rules:
+        CashbackRule.objects.create(card=card, **rule)
+    return card
+
+
+class CompiledRuleIndexTests(TestCase):
+    def setUp(self):
+        self.bank = Bank.objects.create(name='HDFC Bank')
+        self.card = create_card(self.bank, 'Millennia', default_percent=1.0, rules=[
+            {'category': 'Shopping', 'cashback_percent': 2.0},
+            {'category': 'Food', 'subcategory': 'Delivery', 'cashback_percent': 5.0},
+            {'category': 'Food', 'subcategory': 'Delivery', 'brand': ['Swiggy', 'Zomato'], 'cashback_percent': 10.0},
+            {'platform': 'SmartBuy', 'cashback_percent': 4.0},
+            {'spending_type': 'Online', 'cashback_percent': 3.0},
+        ])
+        self.card = CreditCard.objects.prefetch_related('cashback_rules').select_related('default_cashback').get(pk=self.card.pk)
+        self.rules = list(self.card.cashback_rules.all())
+
+    def test_fallback_order(self):
+        cases = [
+            ({'brand': 'SWIGGY', 'subcategory': 'delivery'}, self.rules[2]),
+            ({'brand': 'Dominos', 'subcategory': 'Delivery'}, self.rules[1]),
+            ({'category': 'shopping', 'platform': 'SmartBuy'}, self.rules[0]),
+            ({'platform': 'smartbuy', 'channel': 'Online'}, self.rules[3]),
+            ({'spendingType': 'online'}, self.rules[4]),
+            ({'category': 'Fuel'}, self.card.default_cashback),
+        ]
+        for spend, expected in cases:
+            with self.subTest(spend=spend):
+                self.assertEqual(get_best_cashback_rule(self.card, spend), expected)
+
+    def test_first_rule_wins_within_a_level(self):
+        CashbackRule.objects.create(card=self.card, category='Shopping', cashback_percent=9.0)
+        card = CreditCard.objects.prefetch_related('cashback_rules').get(pk=self.card.pk)
+        self.assertEqual(get_best_cashback_rule(card, {'category': 'Shopping'}).cashback_percent, 2.0)
+
+    def test_no_match_without_default(self):
+        card = create_card(self.bank, 'Bare')
+        self.assertIsNone(get_best_cashback_rule(card, {'category': 'Shopping'}))
+
+    def test_index_is_built_once(self):
+        index = get_rule_index(self.card)
+        with self.assertNumQueries(0):
+            get_best_cashback_rule(self.card, {'category': 'Shopping'})
+        self.assertIs(get_rule_index(self.card), index)
+
+
+class TopCardGroupsTests(TestCase):
+    def setUp(self):
+        bank = Bank.objects.create(name='HDFC Bank')
+        self.swiggy = create_card(bank, 'Swiggy', default_percent=1.0, rules=[
+            {'category': 'Food', 'cashback_percent': 10.0},
+        ])
+        self.fuel = create_card(bank, 'IndianOil', rules=[
+            {'category': 'Fuel', 'cashback_percent': 5.0},
+        ])
+        self.spending = [
+            {'category': 'Food', 'amount': 1000},
+            {'category': 'Fuel', 'amount': 2000},
+        ]
+
+    def test_savings_matrix(self):
+        savings, cashback_percents = build_savings_matrix([self.swiggy, self.fuel], self.spending)
+        self.assertEqual(savings.tolist(), [[100.0, 20.0], [0.0, 100.0]])
+        self.assertEqual(cashback_percents.tolist(), [[10.0, 1.0], [0.0, 5.0]])
+
+    def test_group_beats_members(self):
+        results = get_top_card_groups([self.swiggy, self.fuel], self.spending, group_size=2)
+        self.assertEqual([r['type'] for r in results], ['group', 'individual', 'individual'])
+        group = results[0]
+        self.assertEqual(group['cards'], [self.swiggy, self.fuel])
+        self.assertEqual(group['totalSavings'], 200.0)
+        self.assertEqual([b['bestCardId'] for b in group['breakdown']], [self.swiggy.id, self.fuel.id])
+        self.assertEqual(group['spendCoverage'], 100.0)
+
+    def test_empty_spending(self):
+        self.assertEqual(get_top_card_groups([self.swiggy, self.fuel], [], group_size=2), [])
+
+
+class GroupSearchTests(SimpleTestCase):
+    def make_scorer(self, savings, fixed_benefits):
+        def score_group(members):
+            group_savings = savings[list(members)]
+            best = np.maximum(group_savings.max(axis=0), 0)
+            owner = group_savings.argmax(axis=0)
+            contributing = [row for k, row in enumerate(members) if ((owner == k) & (best > 0)).any()]
+            if not contributing:
+                return None
+            return contributing, {'netBenefit': best.sum() + sum(fixed_benefits[row] for row in contributing)}
+        return score_group
+
+    def test_branch_and_bound_matches_exhaustive(self):
+        rng = np.random.default_rng(7)
+        for trial in range(40):
+            cards, spends = rng.integers(4, 14), rng.integers(1, 7)
+            savings = np.round(rng.choice([0, 1], size=(cards, spends), p=[0.4, 0.6]) * rng.uniform(0, 500, size=(cards, spends)), 2)
+            fixed_benefits = rng.choice([0.0, -500.0, -1000.0, 250.0], size=cards)
+            score_group = self.make_scorer(savings, fixed_benefits)
+            for group_size in (2, 3, 4):
+                with self.subTest(trial=trial, group_size=group_size):
+                    exhaustive = find_top_groups(savings, fixed_benefits, group_size, score_group, exhaustive_limit=10 ** 9)
+                    searched = find_top_groups(savings, fixed_benefits, group_size, score_group, exhaustive_limit=0)
+                    self.assertEqual([r['netBenefit'] for r in searched], [r['netBenefit'] for r in exhaustive])
+
+    def test_ties_are_broken_like_the_exhaustive_search(self):
+        rng = np.random.default_rng(11)
+        for trial in range(40):
+            cards, spends = rng.integers(4, 10), rng.integers(1, 5)
+            # Few distinct values, so many groups tie on net benefit
+            savings = rng.choice([0.0, 100.0, 200.0], size=(cards, spends))
+            fixed_benefits = rng.choice([0.0, -100.0], size=cards)
+            score = self.make_scorer(savings, fixed_benefits)
+
+            def score_group(members):
+                outcome = score(members)
+                return outcome and (outcome[0], {**outcome[1], 'members': tuple(outcome[0])})
+            for group_size in (2, 3):
+                with self.subTest(trial=trial, group_size=group_size):
+                    exhaustive = find_top_groups(savings, fixed_benefits, group_size, score_group, top_n=2,
+                                                 exhaustive_limit=10 ** 9)
+                    searched = find_top_groups(savings, fixed_benefits, group_size, score_group, top_n=2,
+                                               exhaustive_limit=0)
+                    self.assertEqual([r['members'] for r in searched], [r['members'] for r in exhaustive])
+
+    def test_groups_larger_than_catalog(self):
+        savings = np.ones((2, 3))
+        self.assertEqual(find_top_groups(savings, [0, 0], 3, self.make_scorer(savings, [0, 0])), [])
+
+
+class RecommendCardsQueryTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        caches['recommendations'].clear()
+        # Catalog changes are applied once per transaction; each capture block stands for a commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bank = Bank.objects.create(name='HDFC Bank')
+            self.card_filter = CardFilter.objects.create(name='Cashback', slug='cashback')
+        self.payload = {
+            'spending': [
+                {'category': 'Food', 'amount': 1000},
+                {'category': 'Fuel', 'amount': 2000},
+            ],
+            'preferences': {'desiredCardCount': 2},
+        }
+
+    def add_cards(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._add_cards(count)
+
+    def _add_cards(self, count):
+        for i in range(count):
+            card = create_card(self.bank, f'Card {CreditCard.objects.count()}', default_percent=1.0, rules=[
+                {'category': 'Food', 'cashback_percent': 2.0 + i},
+                {'category': 'Fuel', 'cashback_percent': 5.0 - i % 3},
+            ])
+            card.filters.add(self.card_filter)
+            FeeWaiver.objects.create(card=card, annual_fee=500)
+            FeesAndCharges.objects.create(card=card, joining_fee=500)
+            Highlight.objects.create(card=card, highlight=['Cashback'])
+            WelcomeBenefit.objects.create(card=card, benefit_type='Voucher', description='Voucher', value='₹500 voucher')
+            MilestoneBonus.objects.create(card=card, spend_threshold=100000, bonus_type='Voucher', bonus_value=500)
+            CardBenefit.objects.create(card=card, benefit_type='Lounge', description='Lounge', value='2 visits')
+
+    def test_query_count_is_independent_of_catalog_size(self):
+        url = reverse('recommend-cards')
+        self.add_cards(2)
+        # Version check plus the catalog load, then nothing while the snapshot is fresh
+        with self.assertNumQueries(8):
+            small = self.client.post(url, self.payload, content_type='application/json')
+        with self.assertNumQueries(0):
+            self.client.post(url, self.payload, content_type='application/json')
+        self.add_cards(8)
+        with self.assertNumQueries(8):
+            large = self.client.post(url, self.payload, content_type='application/json')
+        self.assertEqual(small.status_code, 200)
+        self.assertEqual(large.status_code, 200)
+        self.assertEqual(len(large.json()['spendToCardSavings'][0]['cardSavings']), 10)
+
+    def test_repeat_profiles_are_served_from_cache(self):
+        url = reverse('recommend-cards')
+        self.add_cards(3)
+        stats = get_recommendation_cache_stats()
+        first = self.client.post(url, self.payload, content_type='application/json')
+        second = self.client.post(url, self.payload, content_type='application/json')
+        self.assertEqual(first.json(), second.json())
+        after = get_recommendation_cache_stats()
+        self.assertEqual(after['misses'] - stats['misses'], 1)
+        self.assertEqual(after['hits'] - stats['hits'], 1)
+        # A catalog change moves to a new version and a fresh result
+        self.add_cards(1)
+        third = self.client.post(url, self.payload, content_type='application/json')
+        self.assertEqual(len(third.json()['spendToCardSavings'][0]['cardSavings']), 4)
+
+    def test_batch_matches_single_requests(self):
+        self.add_cards(4)
+        profiles = [
+            self.payload,
+            {'spending': [{'category': 'Fuel', 'amount': 3000}], 'preferences': {'desiredCardCount': 1}},
+            {'spending': [{'category': 'Food', 'amount': 1000}, {'category': 'Travel', 'amount': 500}]},
+            self.payload,
+        ]
+        response = self.client.post(reverse('recommend-cards-batch'), {'profiles': profiles}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 4)
+        caches['recommendations'].clear()
+        for profile, result in zip(profiles, results):
+            single = self.client.post(reverse('recommend-cards'), profile, content_type='application/json')
+            self.assertEqual(single.json(), result)
+
+    def test_batch_size_is_limited(self):
+        with self.settings(RECOMMEND_BATCH_MAX_PROFILES=2):
+            response = self.client.post(reverse('recommend-cards-batch'), {'profiles': [self.payload] * 3}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_key_is_canonical(self):
+        spending = [{'category': 'Food', 'amount': 1000.0}, {'amount': 5.0, 'category': 'Fuel'}]
+        reordered_keys = [{'amount': 1000.0, 'category': 'Food'}, {'category': 'Fuel', 'amount': 5.0}]
+        self.assertEqual(recommendation_cache_key(1, spending, 2), recommendation_cache_key(1, reordered_keys, 2))
+        self.assertNotEqual(recommendation_cache_key(1, spending, 2), recommendation_cache_key(1, spending, 3))
+        self.assertNotEqual(recommendation_cache_key(1, spending, 2), recommendation_cache_key(2, spending, 2))
+
+
+class PurchaseAdvisorTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        bank = Bank.objects.create(name='Axis Bank')
+        self.flipkart = create_card(bank, 'Flipkart Axis', default_percent=1.0, rules=[
+            {'category': 'Shopping', 'subcategory': 'Online', 'brand': ['Flipkart'], 'cashback_percent': 5.0,
+             'min_transaction_amount': 1000, 'max_cashback_per_transaction': 100},
+            {'category': 'Shopping', 'cashback_percent': 2.0},
+        ])
+        self.ace = create_card(bank, 'Ace', default_percent=1.5, rules=[
+            {'category': 'Utilities', 'cashback_percent': 5.0, 'monthly_cap': 500},
+            {'category': 'Dining', 'additional_conditions': 'Flat 20% off on EazyDiner'},
+            {'category': 'Fuel', 'cashback_percent': 0},
+        ])
+        self.url = reverse('purchase-advisor')
+
+    def advise(self, purchases):
+        response = self.client.post(self.url, {'purchases': purchases, 'owned_cards': [self.flipkart.id, self.ace.id]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_minimum_amount_and_per_transaction_cap(self):
+        result = self.advise([
+            {'category': 'Shopping', 'subcategory': 'Online', 'brand': 'Flipkart', 'amount': 4000},
+            # Below the brand rule's minimum, so the category rule applies
+            {'category': 'Shopping', 'subcategory': 'Online', 'brand': 'Flipkart', 'amount': 500},
+        ])
+        first, second = result['purchases']
+        self.assertEqual(first['bestCardId'], self.flipkart.id)
+        self.assertEqual(first['options'][0]['cashbackAmount'], 100)
+        self.assertTrue(first['options'][0]['capped'])
+        self.assertEqual([option['cashbackAmount'] for option in second['options']], [10.0, 7.5])
+        self.assertEqual(result['totalCashback'], 110.0)
+        self.assertEqual(result['results'][0]['card']['id'], self.flipkart.id)
+
+    def test_monthly_cap_is_shared_across_purchases(self):
+        result = self.advise([{'category': 'Utilities', 'amount': amount} for amount in (8000, 6000, 6000)])
+        first, second, third = result['purchases']
+        self.assertEqual((first['bestCardId'], first['options'][0]['cashbackAmount']), (self.ace.id, 400.0))
+        # Only 100 of the 500 monthly cap is left for the second bill
+        self.assertEqual([(option['cardId'], option['cashbackAmount'], option['capped']) for option in second['options']],
+                         [(self.ace.id, 100.0, True), (self.flipkart.id, 60.0, False)])
+        # Once the cap is used up the card falls back to its default cashback
+        self.assertEqual([(option['cardId'], option['cashbackAmount'], option['capped']) for option in third['options']],
+                         [(self.ace.id, 90.0, False), (self.flipkart.id, 60.0, False)])
+
+    def test_rules_without_a_percent_fall_through(self):
+        result = self.advise([{'category': 'Dining', 'amount': 1000}, {'category': 'Fuel', 'amount': 1000}])
+        dining, fuel = result['purchases']
+        # The Dining rule only describes an offer, so the default cashback applies; Fuel is excluded outright
+        self.assertEqual([(option['cardId'], option['cashbackAmount']) for option in dining['options']],
+                         [(self.ace.id, 15.0), (self.flipkart.id, 10.0)])
+        self.assertEqual([option['cardId'] for option in fuel['options']], [self.flipkart.id])
+        # The recommender scores the same rules
+        savings, _ = build_savings_matrix([self.ace], [{'category': 'Dining', 'amount': 1000},
+                                                       {'category': 'Fuel', 'amount': 1000}])
+        self.assertEqual(savings.tolist(), [[15.0, 0.0]])
+
+    def test_legacy_flat_payload(self):
+        response = self.client.post(self.url, {'amount': 2000, 'category': 'Shopping', 'owned_cards': [self.flipkart.id]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # The category level matches the card's first Shopping rule, like the recommender does
+        self.assertEqual(response.json()['results'][0]['cashbackAmount'], 100.0)
+        # Legacy payloads may leave the amount out
+        for payload in ({'category': 'Shopping'}, {'spending': [{'category': 'Shopping'}]}):
+            response = self.client.post(self.url, {**payload, 'owned_cards': [self.flipkart.id]},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['purchases'][0]['amount'], 0)
+
+
+STATEMENT_CSV = """Txn Date,Narration,Withdrawal Amt.,Deposit Amt.
+01/03/2025,UPI-SWIGGY-BANGALORE,"1,200.00",
+04/03/2025,POS AMAZON PAY INDIA,3000.00,
+09/03/2025,INDIAN OIL PETROL PUMP,2500.00,
+15/03/2025,NEFT SALARY CREDIT,,90000.00
+02/04/2025,SWIGGY INSTAMART,800.00,
+20/04/2025,UNKNOWN MERCHANT 42,500.00,
+"""
+
+
+class StatementIngestionTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        caches['recommendations'].clear()
+        bank = Bank.objects.create(name='HDFC Bank')
+        create_card(bank, 'Swiggy HDFC', default_percent=1.0, rules=[
+            {'category': 'Food Delivery', 'subcategory': 'Online Food Orders', 'brand': ['Swiggy'],
+             'cashback_percent': 10.0},
+            {'category': 'Shopping', 'subcategory': 'Online Shopping', 'brand': ['Amazon'], 'cashback_percent': 5.0},
+            {'category': 'Fuel', 'cashback_percent': 1.0},
+        ])
+
+    def upload(self, content, **data):
+        statement = SimpleUploadedFile('statement.csv', content.encode(), content_type='text/csv')
+        return self.client.post(reverse('recommend-from-statement'), {'statement': statement, **data})
+
+    def test_statement_becomes_monthly_spending(self):
+        response = self.upload(STATEMENT_CSV, desiredCardCount=1)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['statementSummary'], {'rows': 5, 'matchedRows': 4, 'months': 2})
+        spending = {(spend['category'], spend.get('brand')): spend['amount'] for spend in body['spending']}
+        self.assertEqual(spending, {
+            ('Food Delivery', 'Swiggy'): 1000.0,
+            ('Shopping', 'Amazon'): 1500.0,
+            ('Fuel', 'IndianOil'): 1250.0,
+            ('Others', None): 250.0,
+        })
+        self.assertTrue(body['recommendations'])
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=64)
+    def test_large_uploads_are_streamed_from_disk(self):
+        rows = ''.join(f'05/03/2025,SWIGGY ORDER {i},100.00,\n' for i in range(2000))
+        response = self.upload('Txn Date,Narration,Withdrawal Amt.,Deposit Amt.\n' + rows)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['spending'], [
+            {'category': 'Food Delivery', 'subcategory': 'Online Food Orders', 'brand': 'Swiggy', 'amount': 200000.0},
+        ])
+
+    def test_unrecognised_layout(self):
+        response = self.upload('foo,bar\n1,2\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('statement', response.json())
+
+
+class MerchantClassifierTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            bank = Bank.objects.create(name='HDFC Bank')
+            create_card(bank, 'Swiggy HDFC', rules=[
+                {'category': 'Food Delivery', 'subcategory': 'Online Food Orders', 'brand': ['Swiggy'],
+                 'cashback_percent': 10.0},
+                {'category': 'Shopping', 'subcategory': 'Online Shopping', 'brand': ['Amazon'], 'cashback_percent': 5.0},
+                {'category': 'Entertainment', 'subcategory': 'OTT', 'brand': ['Amazon Prime'], 'cashback_percent': 5.0},
+                {'category': 'Travel', 'platform': 'SmartBuy', 'payment_app': ['PhonePe'], 'cashback_percent': 5.0},
+            ])
+        self.classifier = get_merchant_classifier(get_catalog_snapshot())
+
+    def test_statement_strings(self):
+        cases = {
+            'SWIGGY*BANGALORE': MerchantMatch('Food Delivery', 'Online Food Orders', 'Swiggy', None, None),
+            'AMZN Mktp IN': MerchantMatch('Shopping', 'Online Shopping', 'Amazon', None, None),
+            'AMAZON PRIME VIDEO': MerchantMatch('Entertainment', 'OTT', 'Amazon Prime', None, None),
+            'SMARTBUY FLIGHTS VIA PHONEPE': MerchantMatch(None, None, None, 'SmartBuy', 'PhonePe'),
+            'UPI/GPAY/HPCL PETROL PUMP': MerchantMatch('Fuel', None, 'HP', None, 'Google Pay'),
+            'CITY MEDICAL STORE': MerchantMatch('Health', None, None, None, None),
+            'NEFT SALARY CREDIT': NO_MATCH,
+        }
+        self.assertEqual(
+            dict(zip(cases, self.classifier.classify_many(list(cases)))),
+            cases,
+        )
+
+    def test_rebuilt_when_catalog_changes(self):
+        self.assertEqual(self.classifier.classify('BLINKIT ORDER'), NO_MATCH)
+        card = CreditCard.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            CashbackRule.objects.create(card=card, category='Groceries', brand=['Blinkit'], cashback_percent=5.0)
+        classifier = get_merchant_classifier(get_catalog_snapshot())
+        self.assertIsNot(classifier, self.classifier)
+        self.assertEqual(classifier.classify('BLINKIT ORDER').brand, 'Blinkit')
+
+    def test_rebuilt_with_the_snapshot(self):
+        # A rebuild keeps the catalog version, but may have loaded changed rows
+        version = get_catalog_snapshot().version
+        invalidate_catalog_snapshot()
+        snapshot = get_catalog_snapshot()
+        self.assertEqual(snapshot.version, version)
+        self.assertIsNot(get_merchant_classifier(snapshot), self.classifier)
+
+    def test_classify_endpoint(self):
+        url = reverse('classify-merchants')
+        response = self.client.post(url, {'merchants': ['SWIGGY*BANGALORE', '']}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'merchant': 'SWIGGY*BANGALORE', 'category': 'Food Delivery', 'subcategory': 'Online Food Orders',
+             'brand': 'Swiggy', 'platform': None, 'paymentApp': None},
+            {'merchant': '', 'category': None, 'subcategory': None, 'brand': None, 'platform': None,
+             'paymentApp': None},
+        ])
+        response = self.client.post(url, {'merchants': ['SWIGGY', 42]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTests(TestCase):
+    def test_histogram_text_format(self):
+        histogram = metrics.Histogram('test_latency_seconds', 'Test latency.', ['phase'], buckets=(0.1, 1.0))
+        try:
+            histogram.observe(0.05, phase='a')
+            histogram.observe(0.5, phase='a')
+            histogram.observe(5, phase='a')
+            lines = histogram.render()
+        finally:
+            metrics._registry.remove(histogram)
+        self.assertEqual(lines, [
+            '# HELP test_latency_seconds Test latency.',
+            '# TYPE test_latency_seconds histogram',
+            'test_latency_seconds_bucket{phase="a",le="0.1"} 1',
+            'test_latency_seconds_bucket{phase="a",le="1"} 2',
+            'test_latency_seconds_bucket{phase="a",le="+Inf"} 3',
+            'test_latency_seconds_sum{phase="a"} 5.55',
+            'test_latency_seconds_count{phase="a"} 3',
+        ])
+
+    def test_recommendations_record_phases(self):
+        invalidate_catalog_snapshot()
+        caches['recommendations'].clear()
+        bank = Bank.objects.create(name='HDFC Bank')
+        for i in range(12):
+            create_card(bank, f'Card {i}', default_percent=1.0, rules=[
+                {'category': 'Food', 'cashback_percent': 2.0 + i % 4},
+                {'category': 'Fuel', 'cashback_percent': 5.0 - i % 3},
+                {'category': 'Travel', 'cashback_percent': 1.0 + i % 5},
+            ])
+        scored = metrics.groups_scored_total.value()
+        misses = metrics.cache_requests_total.value(result='miss')
+        serialization = metrics.phase_seconds.count(phase='serialization')
+        payload = {
+            'spending': [{'category': 'Food', 'amount': 1000}, {'category': 'Fuel', 'amount': 2000},
+                         {'category': 'Travel', 'amount': 3000}],
+            'preferences': {'desiredCardCount': 3},
+        }
+        response = self.client.post(reverse('recommend-cards'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(metrics.groups_scored_total.value(), scored)
+        self.assertEqual(metrics.cache_requests_total.value(result='miss'), misses + 1)
+        self.assertEqual(metrics.phase_seconds.count(phase='serialization'), serialization + 1)
+        self.assertEqual(metrics.catalog_cards.value(), 12)
+
+    def test_group_size_is_bounded(self):
+        url = reverse('recommend-cards')
+        for size in (-1, 11, 1000):
+            response = self.client.post(url, {'spending': [{'category': 'Food', 'amount': 100}],
+                                              'preferences': {'desiredCardCount': size}}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        # 0 is still accepted, as it was before the bound, and recommends individual cards
+        count = metrics.recommendation_seconds.count(group_size='0')
+        response = self.client.post(url, {'spending': [{'category': 'Food', 'amount': 100}],
+                                          'preferences': {'desiredCardCount': 0}}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.recommendation_seconds.count(group_size='0'), count + 1)
+        count = metrics.recommendation_seconds.count(group_size='5+')
+        response = self.client.post(url, {'spending': [{'category': 'Food', 'amount': 100}],
+                                          'preferences': {'desiredCardCount': 7}}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.recommendation_seconds.count(group_size='5+'), count + 1)
+
+    def test_endpoint_is_restricted_by_address(self):
+        url = reverse('metrics')
+        response = self.client.get(url, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE recommendation_phase_seconds histogram', response.content.decode())
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.7').status_code, 403)
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        self.bank = Bank.objects.create(name='HDFC Bank')
+        self.card = create_card(self.bank, 'Millennia', default_percent=1.0, rules=[
+            {'category': 'Shopping', 'subcategory': 'Online', 'brand': ['Amazon', 'Flipkart'], 'cashback_percent': 5.0},
+            {'category': 'Food', 'brand': 'Swiggy', 'cashback_percent': 10.0},
+        ])
+
+    def test_vocabularies(self):
+        snapshot = get_catalog_snapshot()
+        self.assertEqual(snapshot.categories, ('Food', 'Shopping'))
+        self.assertEqual(snapshot.subcategories('Shopping'), ('Online',))
+        self.assertEqual(snapshot.brands(), ('Amazon', 'Flipkart', 'Swiggy'))
+        self.assertEqual(snapshot.brands('Shopping', 'Online'), ('Amazon', 'Flipkart'))
+        self.assertEqual(snapshot.brands(subcategory='Online'), ('Amazon', 'Flipkart'))
+
+    def test_saves_replace_the_snapshot(self):
+        snapshot = get_catalog_snapshot()
+        self.assertIs(get_catalog_snapshot(), snapshot)
+        CashbackRule.objects.create(card=self.card, category='Fuel', cashback_percent=1.0)
+        refreshed = get_catalog_snapshot()
+        self.assertIsNot(refreshed, snapshot)
+        self.assertIn('Fuel', refreshed.categories)
+        self.assertNotIn('Fuel', snapshot.categories)
+
+    def test_version_change_from_another_worker(self):
+        snapshot = get_catalog_snapshot()
+        CatalogVersion.objects.update_or_create(pk=1, defaults={'version': snapshot.version + 1})
+        with self.settings(CATALOG_VERSION_CHECK_INTERVAL=0):
+            self.assertEqual(get_catalog_snapshot().version, snapshot.version + 1)
+
+
+class CardPayloadCacheTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        caches['recommendations'].clear()
+        bank = Bank.objects.create(name='HDFC Bank')
+        self.cards = [
+            create_card(bank, f'Card {i}', default_percent=1.0, rules=[
+                {'category': 'Food', 'cashback_percent': 2.0 + i},
+                {'category': 'Fuel', 'cashback_percent': 5.0 - i},
+            ])
+            for i in range(4)
+        ]
+        self.highlight = Highlight.objects.create(card=self.cards[0], highlight=['Old'])
+
+    def counts(self):
+        return (metrics.card_payload_requests_total.value(result='hit'),
+                metrics.card_payload_requests_total.value(result='miss'))
+
+    def test_each_card_is_serialized_once(self):
+        hits, misses = self.counts()
+        payload = {'spending': [{'category': 'Food', 'amount': 1000}, {'category': 'Fuel', 'amount': 2000}],
+                   'preferences': {'desiredCardCount': 2}}
+        response = self.client.post(reverse('recommend-cards'), payload, content_type='application/json')
+        rendered = sum(len(group['cards']) for group in response.json()['recommendations'])
+        self.assertGreater(rendered, len(self.cards))
+        self.assertEqual(self.counts(), (hits + rendered - len(self.cards), misses + len(self.cards)))
+        # The list reuses the payloads built for the recommendation
+        self.client.get('/api/cards/')
+        self.assertEqual(self.counts()[1], misses + len(self.cards))
+
+    def test_saves_retire_payloads(self):
+        url = f'/api/cards/{self.cards[0].pk}/'
+        self.assertEqual(self.client.get(url).json()['highlight'], ['Old'])
+        self.highlight.highlight = ['New']
+        self.highlight.save()
+        self.assertEqual(self.client.get(url).json()['highlight'], ['New'])
+
+    def test_payloads_come_from_the_snapshot(self):
+        # A card loaded before a change must not be cached under the snapshot holding that change
+        stale = catalog_queryset().get(pk=self.cards[1].pk)
+        CreditCard.objects.filter(pk=stale.pk).update(annual_fee=999)
+        invalidate_catalog_snapshot()
+        self.assertEqual(CreditCardSerializer(stale).data['annual_fee'], 999)
+        fresh = catalog_queryset().get(pk=stale.pk)
+        self.assertEqual(CreditCardSerializer(fresh).data['annual_fee'], 999)
+
+    def test_callers_cannot_change_cached_payloads(self):
+        card = catalog_queryset().get(pk=self.cards[0].pk)
+        data = CreditCardSerializer(card).data
+        data['highlight'].append('Changed')
+        data['cashback_rules'][0]['category'] = 'Changed'
+        data = CreditCardSerializer(card).data
+        self.assertEqual(data['highlight'], ['Old'])
+        self.assertEqual(data['cashback_rules'][0]['category'], 'Food')
+
+
+class CardFieldSelectionTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        bank = Bank.objects.create(name='HDFC Bank')
+        for i in range(3):
+            create_card(bank, f'Card {i}', default_percent=1.0, rules=[{'category': 'Food', 'cashback_percent': 2.0}])
+        # A loaded snapshot supplies the ETag version without a query
+        get_catalog_snapshot()
+
+    def test_fields_limit_payload_and_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/cards/', {'fields': 'name,issuer,image_url,annual_fee'})
+        self.assertEqual(response.status_code, 200)
+        # The cards alone, with no relation queries
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.json()['results'][0], {'name': 'Card 0', 'issuer': 'HDFC Bank', 'image_url': None,
+                                              'annual_fee': 0})
+
+    def test_expand_adds_relations(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/cards/', {'fields': 'name', 'expand': 'cashback_rules'})
+        self.assertEqual(len(queries), 2)
+        card = response.json()['results'][0]
+        self.assertEqual(set(card), {'name', 'cashback_rules'})
+        self.assertEqual(card['cashback_rules'][0]['category'], 'Food')
+        # Without ?fields=, expand adds the relation to the plain fields
+        card = self.client.get('/api/cards/search_cards/', {'q': 'Card', 'expand': 'cashback_rules'}).json()[0]
+        self.assertIn('card_name', card)
+        self.assertIn('cashback_rules', card)
+        self.assertNotIn('fee_waiver', card)
+
+    def test_default_returns_every_field(self):
+        card = self.client.get('/api/cards/').json()['results'][0]
+        self.assertIn('cashback_rules', card)
+        self.assertIn('eligibility_criteria', card)
+
+    def test_unknown_names_are_rejected(self):
+        response = self.client.get('/api/cards/', {'fields': 'name,secret', 'expand': 'issuer'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'fields', 'expand'})
+
+
+class CatalogConditionalGetTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            bank = Bank.objects.create(name='HDFC Bank')
+            self.card = create_card(bank, 'Millennia', rules=[{'category': 'Food', 'cashback_percent': 5.0}])
+
+    def test_not_modified_before_the_view(self):
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.json(), ['Food'])
+        self.assertIn('max-age=300', response['Cache-Control'])
+        etag = response['ETag']
+        # The fresh snapshot supplies the version, so no query runs
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/api/cards/')
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/cards/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_errors_are_not_tagged_and_the_salt_changes_tags(self):
+        response = self.client.get('/api/cards/', {'fields': 'secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(self.client.get('/api/cards/0/').has_header('ETag'))
+        etag = self.client.get('/api/cards/')['ETag']
+        self.addCleanup(etag_salt.cache_clear)
+        with self.settings(CATALOG_ETAG_SALT='release-2'):
+            etag_salt.cache_clear()
+            response = self.client.get('/api/cards/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"catalog-release-2-'))
+
+    def test_catalog_changes_replace_the_etag(self):
+        etag = self.client.get('/api/cards/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.card.annual_fee = 500
+            self.card.save()
+        response = self.client.get('/api/cards/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['annual_fee'], 500)
+
+
+class CardKeysetPaginationTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        bank = Bank.objects.create(name='HDFC Bank')
+        self.cards = [CreditCard.objects.create(card_name=f'Card {i}', bank=bank, annual_fee=(i % 3) * 500)
+                      for i in range(7)]
+        get_catalog_snapshot()
+
+    def walk(self, url, key):
+        names, pages, queries = [], [], []
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                data = self.client.get(url).json()
+            queries.append(len(captured))
+            pages.append(data)
+            names += [card['name'] for card in data['results']]
+            url = data[key]
+        return names, pages, queries
+
+    def test_pages_follow_ordering_and_ties(self):
+        expected = [card.card_name for card in sorted(self.cards, key=lambda card: (-card.annual_fee, card.id))]
+        names, pages, queries = self.walk('/api/cards/?ordering=-annual_fee&page_size=2&fields=name', 'next')
+        self.assertEqual(names, expected)
+        self.assertNotIn('count', pages[0])
+        # Deep pages cost the same single query as the first
+        self.assertEqual(set(queries), {1})
+        # Walking back from the last page returns the earlier pages unchanged
+        _, back, _ = self.walk(pages[-1]['previous'], 'previous')
+        self.assertEqual([page['results'] for page in back], [page['results'] for page in reversed(pages[:-1])])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/cards/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+class CardValueSummaryTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bank = Bank.objects.create(name='SBI Card')
+            self.card = CreditCard.objects.create(card_name='SimplyCLICK', bank=self.bank, annual_fee=499)
+            WelcomeBenefit.objects.create(card=self.card, benefit_type='Voucher', description='Voucher', value='Rs. 500')
+            MilestoneBonus.objects.create(card=self.card, spend_threshold=100000, bonus_type='Voucher', bonus_value=2000)
+
+    def test_summary_follows_benefit_changes(self):
+        summary = CardValueSummary.objects.get(card=self.card)
+        self.assertEqual((summary.annual_fee, summary.welcome_benefits, summary.milestone_bonuses, summary.other_benefits),
+                         (499, 500.0, 2000, 0.0))
+        with self.captureOnCommitCallbacks(execute=True):
+            CardBenefit.objects.create(card=self.card, benefit_type='Lounge', description='Lounge access', value='1,000')
+            self.card.welcome_benefits.all().delete()
+        summary.refresh_from_db()
+        self.assertEqual((summary.welcome_benefits, summary.other_benefits), (0.0, 1000.0))
+
+    def test_one_refresh_and_bump_per_transaction(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            for i in range(5):
+                CardBenefit.objects.create(card=self.card, benefit_type='Lounge', description='Lounge', value='100')
+            self.card.save()
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(get_catalog_version(), version + 1)
+        self.assertEqual(CardValueSummary.objects.get(card=self.card).other_benefits, 500.0)
+
+    def test_engine_reads_the_stored_summary(self):
+        card = CreditCard.objects.select_related('value_summary').prefetch_related(
+            'welcome_benefits', 'milestone_bonuses', 'card_benefits'
+        ).get(pk=self.card.pk)
+        with self.assertNumQueries(0):
+            components = get_card_benefit_components(card)
+        self.assertEqual(components, compute_card_benefit_components(card))
+
+    def test_refresh_recreates_missing_summaries(self):
+        CardValueSummary.objects.all().delete()
+        self.assertEqual(refresh_card_value_summaries(), 1)
+        self.assertEqual(CardValueSummary.objects.get(card=self.card).milestone_bonuses, 2000)
+
+
+class SyntheticCatalogTests(TestCase):
+    def test_generate_catalog(self):
+        invalidate_catalog_snapshot()
+        cards = generate_catalog(banks=3, cards=12, rules=40, seed=1)
+        self.assertEqual(Bank.objects.count(), 3)
+        self.assertEqual(len(cards), 12)
+        self.assertEqual(CashbackRule.objects.count(), 40)
+        # Every card has a rule and a stored value summary
+        self.assertFalse(CreditCard.objects.filter(cashback_rules__isnull=True).exists())
+        self.assertEqual(CardValueSummary.objects.count(), 12)
+        self.assertEqual(len(get_catalog_snapshot().cards), 12)
+
+    def test_profiles_are_reproducible(self):
+        first = generate_spending_profile(random.Random(7), entries=4)
+        self.assertEqual(first, generate_spending_profile(random.Random(7), entries=4))
+        self.assertEqual(len(first), 4)
+        self.assertTrue(all(spend['amount'] > 0 and spend['category'] for spend in first))
+
+
+class RecommendBulkCommandTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        bank = Bank.objects.create(name='HDFC Bank')
+        create_card(bank, 'Swiggy', default_percent=1.0, rules=[{'category': 'Food', 'cashback_percent': 10.0}])
+        create_card(bank, 'IndianOil', rules=[{'category': 'Fuel', 'cashback_percent': 5.0}])
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = os.path.join(self.directory.name, 'results.ndjson')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def read_results(self):
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    def test_jsonl_results_match_the_api(self):
+        payload = {'spending': [{'category': 'Food', 'amount': 1000}, {'category': 'Fuel', 'amount': 2000}],
+                   'preferences': {'desiredCardCount': 2}}
+        path = self.write('profiles.jsonl', '\n'.join([
+            json.dumps({'id': 'a', **payload}),
+            json.dumps({'id': 'b', 'spending': [{'category': 'Food'}]}),
+        ]))
+        call_command('recommend_bulk', path, self.output, workers=1, stdout=io.StringIO())
+        first, second = self.read_results()
+        api = self.client.post(reverse('recommend-cards'), payload, content_type='application/json').json()
+        self.assertEqual(first, {'id': 'a', **api})
+        self.assertEqual(second['id'], 'b')
+        self.assertIn('errors', second)
+
+    def test_csv_profiles_and_resume(self):
+        path = self.write('profiles.csv', 'profile_id,category,amount\nu1,Food,1000\nu1,Fuel,2000\nu2,Fuel,500\nu3,Food,10\n')
+        call_command('recommend_bulk', path, self.output, workers=1, batch_size=2, group_size=2, stdout=io.StringIO())
+        results = self.read_results()
+        self.assertEqual([r['id'] for r in results], ['u1', 'u2', 'u3'])
+        self.assertEqual(len(results[0]['recommendations'][0]['cards']), 2)
+        # Simulate a crash after the first batch: the checkpoint says two profiles were written
+        with open(f'{self.output}.checkpoint') as f:
+            checkpoint = json.load(f)
+        with open(self.output, 'rb') as f:
+            first_batch = len(f.readline()) + len(f.readline())
+        with open(f'{self.output}.checkpoint', 'w') as f:
+            json.dump({**checkpoint, 'processed': 2, 'output_bytes': first_batch}, f)
+        call_command('recommend_bulk', path, self.output, workers=1, batch_size=2, group_size=2, resume=True,
+                     stdout=io.StringIO())
+        self.assertEqual(self.read_results(), results)
+
+    def test_malformed_profiles_are_reported_alone(self):
+        path = self.write('profiles.jsonl', '\n'.join([
+            '{"id": "a", "spending": [{"category": "Food", "amount": 1000}]}',
+            '{"id": "b", "spending": [',
+            '[1, 2]',
+        ]))
+        call_command('recommend_bulk', path, self.output, workers=1, stdout=io.StringIO())
+        first, second, third = self.read_results()
+        self.assertEqual(first['id'], 'a')
+        self.assertIn('recommendations', first)
+        self.assertEqual(second['id'], 2)
+        self.assertTrue(second['errors']['non_field_errors'][0].startswith('Malformed JSON'))
+        self.assertEqual(third['id'], 3)
+        self.assertIn('errors', third)
+
+        path = self.write('profiles.csv', 'profile_id,category,amount,desiredCardCount\nu1,Food,1000,two\nu2,Fuel,500,\n')
+        call_command('recommend_bulk', path, self.output, workers=1, stdout=io.StringIO())
+        first, second = self.read_results()
+        self.assertIn('desiredCardCount', first['errors']['preferences'])
+        self.assertIn('recommendations', second)
+
+    def test_csv_requires_profile_id(self):
+        path = self.write('profiles.csv', 'category,amount\nFood,1000\nFuel,500\n')
+        with self.assertRaisesMessage(CommandError, 'has no profile_id column'):
+            call_command('recommend_bulk', path, self.output, workers=1, stdout=io.StringIO())
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_resume_without_output_starts_over(self):
+        path = self.write('profiles.csv', 'profile_id,category,amount\nu1,Food,1000\nu2,Fuel,500\n')
+        call_command('recommend_bulk', path, self.output, workers=1, batch_size=1, stdout=io.StringIO())
+        results = self.read_results()
+        os.remove(self.output)
+        out = io.StringIO()
+        call_command('recommend_bulk', path, self.output, workers=1, batch_size=1, resume=True, stdout=out)
+        self.assertIn('starting over', out.getvalue())
+        self.assertEqual(self.read_results(), results)
+
+
+def v2_card_entry(name, **fields):
+    entry = {
+        'card_name': name, 'card_type': 'Credit Card', 'annual_fee': 500, 'waiver_on_spend': {'renewal': 100000},
+        'default_cashback': {'cashback_percent': 1, 'min_transaction_amount': 100},
+        'reward_point_conversion': {'conversion_rate': 0.25},
+        'cashback_rules': [
+            {'category': 'Shopping', 'brand': ['Amazon'], 'cashback_percent': 5, 'monthly_cap': 500},
+            {'category': 'Dining', 'additional_conditions': 'Flat 20% discount on EazyDiner'},
+            {'category': 'Fuel', 'cashback_percent': 0},
+        ],
+        'tags': ['cashback', 'shopping'],
+    }
+    entry.update(fields)
+    return entry
+
+
+class ImportCardsV2Tests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cards.json')
+
+    def run_import(self, entries, **options):
+        with open(self.path, 'w') as f:
+            json.dump(entries, f)
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_cards_v2', self.path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_invalid_cards_leave_no_rows(self):
+        output = self.run_import([
+            v2_card_entry('Good Card'),
+            v2_card_entry('Negative Fee', annual_fee=-1),
+            v2_card_entry('Bad Rule', cashback_rules=[{'category': 'Travel', 'cashback_percent': 5,
+                                                       'monthly_cap': -10}]),
+            {'card_name': 'No Type'},
+        ])
+        self.assertIn('Error importing card Negative Fee: CreditCard annual_fee', output)
+        self.assertIn('Error importing card Bad Rule: CashbackRule monthly_cap', output)
+        self.assertIn("Error importing card No Type: Missing field 'card_type'", output)
+        card = CreditCard.objects.get()
+        self.assertEqual((card.card_name, card.waiver_on_spend, card.effective_annual_fee), ('Good Card', 100000, 500))
+        self.assertEqual(
+            sorted((rule.category, rule.cashback_percent) for rule in card.cashback_rules.all()),
+            [('Dining', 20.0), ('Shopping', 5.0)],
+        )
+        self.assertEqual(card.default_cashback.min_transaction_amount, 100)
+        self.assertEqual(card.reward_point_conversion.conversion_rate, {'Cashback': 0.25})
+        self.assertEqual(sorted(card.tags.values_list('tag__name', flat=True)), ['cashback', 'shopping'])
+        self.assertEqual(card.value_summary.annual_fee, 500)
+        self.assertEqual(get_catalog_snapshot().cards[0].card_name, 'Good Card')
+
+    def test_malformed_entries_fail_alone(self):
+        output = self.run_import([
+            v2_card_entry('Good Card'),
+            v2_card_entry('Text Rule', cashback_rules=['x']),
+            v2_card_entry('List Default', default_cashback=[1]),
+            v2_card_entry('Text Conversion', reward_point_conversion='x'),
+            v2_card_entry('Text Percent', cashback_rules=[{'category': 'Travel', 'cashback_percent': 'abc'}]),
+        ])
+        self.assertIn('Error importing card Text Rule: Each cashback rule must be an object.', output)
+        self.assertIn('Error importing card List Default: default_cashback must be an object.', output)
+        self.assertIn('Error importing card Text Conversion: reward_point_conversion must be an object.', output)
+        self.assertIn('Error importing card Text Percent: cashback_percent must be a number.', output)
+        self.assertEqual(list(CreditCard.objects.values_list('card_name', flat=True)), ['Good Card'])
+
+    def test_strict_imports_nothing_on_error(self):
+        with self.assertRaises(CommandError):
+            self.run_import([v2_card_entry('Good Card'), v2_card_entry('Bad', status=7)], strict=True)
+        self.assertFalse(CreditCard.objects.exists())
+
+    def test_query_count_does_not_grow_with_cards(self):
+        self.run_import([v2_card_entry('Warm Up')])
+        with CaptureQueriesContext(connection) as few:
+            self.run_import([v2_card_entry(f'Few {i}') for i in range(2)])
+        with CaptureQueriesContext(connection) as many:
+            self.run_import([v2_card_entry(f'Many {i}') for i in range(40)])
+        # Only SQLite's bind variable limit splits the larger INSERTs into extra batches
+        self.assertLessEqual(len(many), len(few) + 3)
+        self.assertEqual(CreditCard.objects.count(), 43)
+
+    def test_reimport_updates_in_place(self):
+        entries = [v2_card_entry('Card A'), v2_card_entry('Card B'), v2_card_entry('Card C')]
+        self.run_import(entries)
+        card_a = CreditCard.objects.get(card_name='Card A')
+        rule_ids = dict(card_a.cashback_rules.values_list('category', 'id'))
+        version = get_catalog_version()
+
+        # Unchanged file: nothing is written and the catalog version stays put
+        with CaptureQueriesContext(connection) as queries:
+            output = self.run_import(entries)
+        self.assertIn('0 created, 0 updated, 3 unchanged', output)
+        self.assertFalse([q for q in queries.captured_queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT',
+                                                                                            'RELEASE'))])
+        self.assertEqual(get_catalog_version(), version)
+
+        # Card A changes one rule and a tag, Card C is dropped from the file
+        entries[0] = v2_card_entry('Card A', annual_fee=999, tags=['cashback', 'travel'], cashback_rules=[
+            {'category': 'Shopping', 'brand': ['Amazon'], 'cashback_percent': 7, 'monthly_cap': 500},
+            {'category': 'Dining', 'additional_conditions': 'Flat 20% discount on EazyDiner'},
+        ])
+        output = self.run_import(entries[:2], sync=True)
+        self.assertIn('0 created, 1 updated, 1 unchanged, 1 discontinued', output)
+        card_a.refresh_from_db()
+        self.assertEqual(card_a.annual_fee, 999)
+        self.assertEqual(card_a.value_summary.annual_fee, 999)
+        self.assertEqual(dict(card_a.cashback_rules.values_list('category', 'id')), rule_ids)
+        self.assertEqual(card_a.cashback_rules.get(category='Shopping').cashback_percent, 7)
+        self.assertEqual(sorted(card_a.tags.values_list('tag__name', flat=True)), ['cashback', 'travel'])
+        self.assertEqual(CreditCard.objects.get(card_name='Card C').status, 0)
+        self.assertGreater(get_catalog_version(), version)
+
+        # A discontinued card that comes back unchanged is restored
+        output = self.run_import(entries[:2] + [v2_card_entry('Card C')], sync=True)
+        self.assertIn('0 created, 1 updated, 2 unchanged', output)
+        self.assertEqual(CreditCard.objects.get(card_name='Card C').status, 1)
+        self.assertEqual(CreditCard.objects.count(), 3)
+
+    def test_cards_dropped_from_the_feed_are_not_recommended(self):
+        self.run_import([v2_card_entry('Card A'), v2_card_entry('Card B', cashback_rules=[
+            {'category': 'Shopping', 'brand': ['Amazon'], 'cashback_percent': 10},
+        ])])
+        payload = {'spending': [{'category': 'Shopping', 'brand': 'Amazon', 'amount': 10000}]}
+
+        def recommended():
+            response = self.client.post(reverse('recommend-cards'), payload, content_type='application/json')
+            return {card['cardName'] for group in response.json()['recommendations'] for card in group['cards']}
+
+        def listed():
+            return {card['name'] for card in self.client.get('/api/cards/').json()['results']}
+        self.assertIn('Card B', recommended())
+        self.assertEqual(listed(), {'Card A', 'Card B'})
+        self.run_import([v2_card_entry('Card A')], sync=True)
+        card_b = CreditCard.objects.get(card_name='Card B')
+        self.assertNotIn('Card B', recommended())
+        self.assertEqual(listed(), {'Card A'})
+        self.assertEqual(self.client.get(f'/api/cards/{card_b.id}/').status_code, 200)
+
+    def test_duplicate_card_names(self):
+        output = self.run_import([v2_card_entry('Card A'), v2_card_entry('Card A', annual_fee=1)])
+        self.assertIn('Error importing card Card A: Duplicate card_name in the file.', output)
+        self.assertEqual(CreditCard.objects.get().annual_fee, 500)
+
+    def test_duplicate_rows_from_earlier_imports_are_discontinued(self):
+        self.run_import([v2_card_entry('Card A')])
+        original = CreditCard.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            extra = CreditCard.objects.create(card_name='Card A', bank=original.bank)
+        output = self.run_import([v2_card_entry('Card A', annual_fee=999)], sync=True)
+        self.assertIn(f'Discontinued duplicate Card A (id {extra.id})', output)
+        self.assertIn('0 created, 1 updated, 0 unchanged, 1 discontinued', output)
+        original.refresh_from_db()
+        extra.refresh_from_db()
+        self.assertEqual((original.annual_fee, original.status, extra.status), (999, 1, 0))
+
+    def test_json_lines_input_in_batches(self):
+        jsonl = os.path.join(os.path.dirname(self.path), 'cards.jsonl')
+        with open(jsonl, 'w') as f:
+            f.write('\n'.join(json.dumps(v2_card_entry(f'Card {i}')) for i in range(5)) + '\n')
+        out = io.StringIO()
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            call_command('import_cards_v2', jsonl, batch_size=2, stdout=out)
+        self.assertIn('5 cards read in', out.getvalue())
+        self.assertIn('5 created, 0 updated, 0 unchanged', out.getvalue())
+        self.assertEqual(CreditCard.objects.count(), 5)
+        # Three batches, one bump
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_catalog_version(), version + 1)
+
+
+class JsonStreamTests(SimpleTestCase):
+    RECORDS = [{'card_name': 'A', 'rules': [1, 2.5, None]}, {'card_name': 'B ] , {', 'fee': 123456}, [], 7, 'x']
+
+    def read(self, text, chunk_size=4):
+        return list(iter_json_records(io.StringIO(text), chunk_size=chunk_size))
+
+    def test_array_and_json_lines(self):
+        array = json.dumps(self.RECORDS, indent=2)
+        lines = '\n'.join(json.dumps(record) for record in self.RECORDS) + '\n'
+        for text in (array, lines):
+            for chunk_size in (1, 3, 4, 1024):
+                self.assertEqual(self.read(text, chunk_size), self.RECORDS)
+        self.assertEqual(self.read(' [ ] '), [])
+        self.assertEqual(self.read(''), [])
+
+    def test_malformed_input(self):
+        for text in ('[{"a": 1} {"b": 2}]', '[{"a": 1},', '[1] 2', '{"a": 1}\n{"b": '):
+            with self.subTest(text=text), self.assertRaises(json.JSONDecodeError):
+                self.read(text)
+
+    def test_long_malformed_record_fails_fast(self):
+        text = '[{"a": "' + 'x' * 100 + '\n' + ', '.join(['{"b": 1}'] * 10000) + ']'
+        file = io.StringIO(text)
+        records = iter_json_records(file, chunk_size=16, max_record_size=64)
+        with self.assertRaises(json.JSONDecodeError):
+            next(records)
+        self.assertLess(file.tell(), 256)
+
+
+class AttachCardDataCommandTests(TestCase):
+    def setUp(self):
+        hdfc = Bank.objects.create(name='HDFC Bank')
+        axis = Bank.objects.create(name='Axis Bank')
+        self.millennia = CreditCard.objects.create(card_name='HDFC Millennia', bank=hdfc)
+        self.freedom = CreditCard.objects.create(card_name='HDFC Freedom', bank=hdfc)
+        self.hdfc_ace = CreditCard.objects.create(card_name='Ace', bank=hdfc)
+        self.axis_ace = CreditCard.objects.create(card_name='Ace', bank=axis)
+        Highlight.objects.create(card=self.freedom, highlight=['old'])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'highlights.json')
+
+    def import_highlights(self, entries):
+        with open(self.path, 'w') as f:
+            json.dump(entries, f)
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_highlights', self.path, stdout=out)
+        return out.getvalue(), len(queries)
+
+    def test_import_highlights(self):
+        output, _ = self.import_highlights([
+            {'card_name': 'HDFC Millennia', 'key_highlights': ['5% cashback']},
+            {'card_name': 'HDFC Freedom', 'key_highlights': ['new']},
+            {'card_name': 'Ace', 'key_highlights': ['ambiguous']},
+            {'card_name': 'Ace', 'bank': 'Axis Bank', 'key_highlights': ['axis']},
+            {'card_name': 'Missing Card', 'key_highlights': []},
+            {'key_highlights': []},
+        ])
+        self.assertEqual(output.splitlines()[:6], [
+            'Created highlight for HDFC Millennia',
+            'Updated highlight for HDFC Freedom',
+            'Multiple cards found for Ace (None), skipping',
+            'Created highlight for Ace',
+            'Card not found: Missing Card (None)',
+            'Skipping entry without card_name',
+        ])
+        self.assertEqual(
+            dict(Highlight.objects.values_list('card_id', 'highlight')),
+            {self.millennia.id: ['5% cashback'], self.freedom.id: ['new'], self.axis_ace.id: ['axis']},
+        )
+
+    def test_unreadable_file_is_reported(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'[{"card_name": "HDFC Millennia", "key_highlights": ["\xff"]}]')
+        err = io.StringIO()
+        call_command('import_highlights', self.path, stdout=io.StringIO(), stderr=err)
+        self.assertIn('Error reading file', err.getvalue())
+        self.assertFalse(Highlight.objects.filter(card=self.millennia).exists())
+
+    def test_query_count_does_not_grow_with_entries(self):
+        entries = [{'card_name': 'HDFC Millennia', 'key_highlights': [str(i)]} for i in range(2)]
+        _, few = self.import_highlights(entries)
+        _, many = self.import_highlights(entries * 50)
+        self.assertEqual(few, many)
+        self.assertEqual(Highlight.objects.get(card=self.millennia).highlight, ['1'])
+
+    def test_populate_fee_waivers(self):
+        FeeWaiver.objects.create(card=self.freedom, annual_fee=1)
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('populate_fee_waivers', stdout=out)
+        self.assertLessEqual(len(queries), 8)
+        self.assertIn('Created FeeWaiver for HDFC Millennia', out.getvalue())
+        self.assertIn('Updated FeeWaiver for HDFC Freedom', out.getvalue())
+        self.assertIn('Card not found: HDFC Regalia Gold', out.getvalue())
+        self.assertEqual(
+            dict(FeeWaiver.objects.values_list('card_id', 'waiver_on_annual_spends')),
+            {self.millennia.id: 100000, self.freedom.id: 60000},
+        )
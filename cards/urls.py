@@ -5,12 +5,17 @@ from .views import CreditCardViewSet
 router = DefaultRouter()
 router.register(r'cards', CreditCardViewSet)
 
-from .views import form_schema, recommend_cards, all_categories, subcategories, brands, purchase_advisor
+from .views import form_schema, classify_merchants, recommend_cards, recommend_cards_batch, recommend_from_statement, recommendation_cache_stats, metrics, all_categories, subcategories, brands, purchase_advisor
 
 urlpatterns = [
     path('', include(router.urls)),
     path('form-schema/', form_schema, name='form-schema'),
     path('recommend/', recommend_cards, name='recommend-cards'),
+    path('recommend/batch/', recommend_cards_batch, name='recommend-cards-batch'),
+    path('recommend/statement/', recommend_from_statement, name='recommend-from-statement'),
+    path('recommend/cache-stats/', recommendation_cache_stats, name='recommendation-cache-stats'),
+    path('merchants/classify/', classify_merchants, name='classify-merchants'),
+    path('metrics/', metrics, name='metrics'),
     path('categories/', all_categories, name='all-categories'),
     path('subcategories/', subcategories, name='subcategories'),
     path('brands/', brands, name='brands'),
@@ -1,4 +1,10 @@
-from itertools import combinations
+import time
+
+import numpy as np
+from django.core.exceptions import ObjectDoesNotExist
+
+from . import metrics
+from .group_search import find_top_groups
 
 def parse_benefit_value(value):
     # Try to extract a numeric value from benefit (e.g., "₹500 Amazon voucher")
@@ -49,6 +55,104 @@ def format_spend_label(spend):
         return f"{base} [{', '.join(details)}]"
     return base
     
+def _normalize(value):
+    return (value or '').lower()
+
+def spend_match_key(spend):
+    """
+    Normalizes the fields of a spend entry used for rule matching, in the order
+    (brand, subcategory, category, platform, spending type).
+    """
+    return (
+        _normalize(spend.get('brand')),
+        _normalize(spend.get('subcategory')),
+        _normalize(spend.get('category')),
+        _normalize(spend.get('platform')),
+        _normalize(spend.get('channel') or spend.get('spendingType')),  # 'online'/'offline'
+    )
+
+class CompiledRuleIndex:
+    """
+    Hash maps over a card's cashback rules, one per level of the fallback hierarchy.
+    Each map keeps the first rule (in cashback_rules order) for its key, so a lookup
+    returns the same rule as scanning the rules level by level. Rules without a
+    cashback percent only describe an offer and are left out, so spends they cover
+    fall through to the next level.
+    """
+
+    def __init__(self, card):
+        self.by_brand_subcategory = {}
+        self.by_subcategory = {}
+        self.by_category = {}
+        self.by_platform = {}
+        self.by_spending_type = {}
+        # Every rule per key and level, in order, for candidates()
+        self._levels = ({}, {}, {}, {}, {})
+        for rule in card.cashback_rules.all():
+            if rule.cashback_percent is None:
+                continue
+            keys = [[], [], [], [], []]
+            subcategory = _normalize(rule.subcategory)
+            if subcategory:
+                brands = rule.brand if isinstance(rule.brand, list) else [rule.brand]
+                keys[0] = [(_normalize(brand), subcategory) for brand in brands]
+                keys[1] = [subcategory]
+            for level, key in ((2, rule.category), (3, rule.platform), (4, rule.spending_type)):
+                key = _normalize(key)
+                if key:
+                    keys[level] = [key]
+            for index, all_rules, level_keys in zip(self._maps(), self._levels, keys):
+                for key in level_keys:
+                    index.setdefault(key, rule)
+                    all_rules.setdefault(key, []).append(rule)
+        default_cashback = getattr(card, 'default_cashback', None)
+        self.default_cashback = default_cashback if default_cashback and default_cashback.cashback_percent else None
+
+    def match(self, key):
+        """
+        Returns the best rule for a key built by spend_match_key, or None.
+        """
+        brand, subcategory, category, platform, spend_type = key
+        return (
+            self.by_brand_subcategory.get((brand, subcategory))
+            or self.by_subcategory.get(subcategory)
+            or self.by_category.get(category)
+            or self.by_platform.get(platform)
+            or self.by_spending_type.get(spend_type)
+            or self.default_cashback
+        )
+
+    def candidates(self, key):
+        """
+        Yields every rule matching a key, level by level (most specific first) and in
+        rule order within a level, ending with the default cashback. The first one is
+        the rule match() returns.
+        """
+        brand, subcategory, category, platform, spend_type = key
+        seen = set()
+        level_keys = ((brand, subcategory), subcategory, category, platform, spend_type)
+        for all_rules, level_key in zip(self._levels, level_keys):
+            for rule in all_rules.get(level_key, ()):
+                if id(rule) not in seen:
+                    seen.add(id(rule))
+                    yield rule
+        if self.default_cashback:
+            yield self.default_cashback
+
+    def _maps(self):
+        return (self.by_brand_subcategory, self.by_subcategory, self.by_category, self.by_platform,
+                self.by_spending_type)
+
+def get_rule_index(card):
+    """
+    Returns the compiled rule index for a card, building it on first use.
+    The index is cached on the card instance, so it reflects the rules loaded with it.
+    """
+    index = card.__dict__.get('_rule_index')
+    if index is None:
+        index = card.__dict__['_rule_index'] = CompiledRuleIndex(card)
+    return index
+
 def get_best_cashback_rule(card, spend):
     """
     Returns the best matching cashback rule for the given card and spend entry,
@@ -60,56 +164,12 @@ def get_best_cashback_rule(card, spend):
     5. Spending Type (Online/Offline)
     6. Generic/default cashback
     """
-    spend_brand = (spend.get('brand') or '').lower()
-    spend_subcategory = (spend.get('subcategory') or '').lower()
-    spend_category = (spend.get('category') or '').lower()
-    spend_platform = (spend.get('platform') or '').lower()
-    spend_type = (spend.get('channel') or spend.get('spendingType') or '').lower()  # 'online'/'offline'
-
-    # 1. Exact brand + subcategory match
-    for rule in card.cashback_rules.all():
-        rule_brand = getattr(rule, 'brand', '')
-        rule_subcategory = (getattr(rule, 'subcategory', '') or '').lower()
-        brand_match = False
-        if isinstance(rule_brand, list):
-            brand_match = any((b or '').lower() == spend_brand for b in rule_brand)
-        else:
-            brand_match = (rule_brand or '').lower() == spend_brand
-
-        if brand_match and rule_subcategory and rule_subcategory == spend_subcategory:
-            return rule
-
-    # 2. Subcategory match
-    for rule in card.cashback_rules.all():
-        rule_subcategory = (getattr(rule, 'subcategory', '') or '').lower()
-        if rule_subcategory and rule_subcategory == spend_subcategory:
-            return rule
-
-    # 3. Category match
-    for rule in card.cashback_rules.all():
-        rule_category = (getattr(rule, 'category', '') or '').lower()
-        if rule_category and rule_category == spend_category:
-            return rule
+    return get_rule_index(card).match(spend_match_key(spend))
 
-    # 4. Platform match
-    for rule in card.cashback_rules.all():
-        rule_platform = (getattr(rule, 'platform', '') or '').lower()
-        if rule_platform and rule_platform == spend_platform:
-            return rule
-
-    # 5. Spending Type (Online/Offline)
-    for rule in card.cashback_rules.all():
-        rule_type = (getattr(rule, 'spending_type', '') or '').lower()
-        if rule_type and rule_type == spend_type:
-            return rule
-
-    # 6. Default cashback
-    if hasattr(card, 'default_cashback') and card.default_cashback and card.default_cashback.cashback_percent:
-        return card.default_cashback
-
-    return None
-
-def get_card_net_benefit(card, total_cashback):
+def compute_card_benefit_components(card):
+    """
+    Computes the fee and non-cashback benefit values of a card from its benefit rows.
+    """
     # Get effective annual fee
     fee = getattr(card, 'effective_annual_fee', None)
     if fee is None or fee == 0:
@@ -120,152 +180,220 @@ def get_card_net_benefit(card, total_cashback):
     milestone_bonuses = sum(getattr(b, 'bonus_value', 0) for b in getattr(card, 'milestone_bonuses', []).all())
     # Other card benefits
     other_benefits = sum(parse_benefit_value(b.value) for b in getattr(card, 'card_benefits', []).all())
-    # Net benefit
-    net_benefit = total_cashback + welcome_benefits + milestone_bonuses + other_benefits - (fee or 0)
     return {
         'annual_fee': fee or 0,
         'welcome_benefits': welcome_benefits,
         'milestone_bonuses': milestone_bonuses,
         'other_benefits': other_benefits,
-        'net_benefit': net_benefit
     }
 
-def get_top_card_groups(cards, spending, group_size=1, max_groups=10):
+def get_card_benefit_components(card):
+    """
+    Returns the fee and non-cashback benefit values of a card, cached on the card instance.
+    They are read from the card's stored CardValueSummary, and only computed from the
+    benefit rows when the card has none yet.
+    """
+    components = card.__dict__.get('_benefit_components')
+    if components is not None:
+        return components
+    try:
+        summary = card.value_summary
+    except ObjectDoesNotExist:
+        components = compute_card_benefit_components(card)
+    else:
+        components = {
+            'annual_fee': summary.annual_fee,
+            'welcome_benefits': summary.welcome_benefits,
+            'milestone_bonuses': summary.milestone_bonuses,
+            'other_benefits': summary.other_benefits,
+        }
+    card.__dict__['_benefit_components'] = components
+    return components
+
+def get_card_net_benefit(card, total_cashback):
+    components = get_card_benefit_components(card)
+    # Net benefit
+    net_benefit = (
+        total_cashback + components['welcome_benefits'] + components['milestone_bonuses']
+        + components['other_benefits'] - components['annual_fee']
+    )
+    return {**components, 'net_benefit': net_benefit}
+
+def build_savings_matrix(cards, spending):
+    """
+    Computes the savings of every card on every spend entry in one pass.
+    Returns (savings, cashback_percents), two float arrays of shape (cards, spends);
+    savings are rounded to paise exactly like the per-spend calculation.
+    """
+    keys = [spend_match_key(spend) for spend in spending]
+    amounts = [spend.get('amount', 0) for spend in spending]
+    savings = np.zeros((len(cards), len(spending)))
+    cashback_percents = np.zeros((len(cards), len(spending)))
+    for i, card in enumerate(cards):
+        index = get_rule_index(card)
+        for j, key in enumerate(keys):
+            matched_rule = index.match(key)
+            cashback_percent = matched_rule.cashback_percent if matched_rule else 0
+            savings[i, j] = round(amounts[j] * cashback_percent / 100, 2)
+            cashback_percents[i, j] = cashback_percent
+    return savings, cashback_percents
+
+def _running_total(values, axis=-1):
+    # cumsum accumulates left to right like the scalar loops did, so totals stay bit-identical
+    return np.take(np.cumsum(values, axis=axis), -1, axis=axis)
+
+def get_top_card_groups(cards, spending, group_size=1, max_groups=10, savings_matrix=None):
     """
     Recommend a group of cards only if the group provides higher total savings than any of its members individually.
     If two or more cards are redundant (identical benefits for all spends), recommend them individually, not as a group.
     For each group or individual card, include a 'reasoning' string explaining why it is recommended as a group or individually.
     Output is a list of dicts with keys: type ('group' or 'individual'), cards, breakdown, netBenefit, reasoning, etc.
+
+    All savings come from a single cards x spends matrix; individual totals, per-spend
+    maxima, coverage and group bests are derived from it with array operations.
+    A matrix already built by build_savings_matrix for these cards and spends can be
+    passed as savings_matrix.
     """
     card_list = list(cards)
-    group_candidates = list(combinations(card_list, group_size))
-    group_results = []
+    if not card_list or not spending:
+        return []
+    metrics.candidates_total.inc(len(card_list))
+    if savings_matrix is None:
+        with metrics.timed(metrics.phase_seconds, phase='rule_matching'):
+            savings_matrix = build_savings_matrix(card_list, spending)
+    savings, cashback_percents = savings_matrix
+    amounts = np.array([spend.get('amount', 0) for spend in spending], dtype=float)
+    spend_labels = [format_spend_label(spend) for spend in spending]
+    total_spend = float(_running_total(amounts))
+
+    # Individual cards: totals, coverage and whether the card is best (even if tied) for any spend
+    individual_started = time.perf_counter()
+    card_totals = _running_total(savings)
+    card_covered = _running_total(np.where(savings > 0, amounts, 0.0))
+    max_per_spend = np.maximum(savings.max(axis=0), 0)
+    is_best_for_any = ((savings == max_per_spend) & (max_per_spend > 0)).any(axis=1)
     individual_results = []
-    for card in card_list:
-        total_savings = 0
-        breakdown = []
-        total_spend = 0
-        covered_spend = 0
-        is_best_for_any = False
-        for spend in spending:
-            spend_amount = spend.get('amount', 0)
-            total_spend += spend_amount
-            matched_rule = get_best_cashback_rule(card, spend)
-            cashback_percent = matched_rule.cashback_percent if matched_rule and hasattr(matched_rule, 'cashback_percent') else 0
-            saving = round(spend_amount * cashback_percent / 100, 2)
-            total_savings += saving
-            if saving > 0:
-                covered_spend += spend_amount
-            breakdown.append({
+    individual_net_benefits = {}
+    for i in np.flatnonzero(is_best_for_any & (card_totals > 0)):
+        card = card_list[i]
+        total_savings = float(card_totals[i])
+        breakdown = [
+            {
                 'spendEntry': spend,
-                'spendLabel': format_spend_label(spend),
-                'bestCardId': card.id if saving > 0 else None,
-                'savings': saving,
-                'cashbackPercent': cashback_percent
-            })
-        # Determine if this card is 'best' for at least one spend (even if tied)
-        for spend_idx, spend in enumerate(spending):
-            spend_amount = spend.get('amount', 0)
-            # Find the max saving for this spend among all cards
-            max_saving = 0
-            for other_card in card_list:
-                matched_rule = get_best_cashback_rule(other_card, spend)
-                cashback_percent = matched_rule.cashback_percent if matched_rule and hasattr(matched_rule, 'cashback_percent') else 0
-                saving = round(spend_amount * cashback_percent / 100, 2)
-                if saving > max_saving:
-                    max_saving = saving
-            if breakdown[spend_idx]['savings'] == max_saving and max_saving > 0:
-                is_best_for_any = True
-                break
-        spend_coverage = round((covered_spend / total_spend) * 100, 2) if total_spend > 0 else 0.0
+                'spendLabel': spend_labels[j],
+                'bestCardId': card.id if savings[i, j] > 0 else None,
+                'savings': float(savings[i, j]),
+                'cashbackPercent': float(cashback_percents[i, j])
+            }
+            for j, spend in enumerate(spending)
+        ]
         net_benefit_info = get_card_net_benefit(card, total_savings)
-        if is_best_for_any and total_savings > 0:
-            reasoning = "This card is among the best for at least one of your spends."
-            individual_results.append({
-                'type': 'individual',
-                'cards': [card],
-                'totalSavings': total_savings,
-                'breakdown': breakdown,
-                'spendCoverage': spend_coverage,
-                'netBenefit': net_benefit_info['net_benefit'],
-                'cardNetBenefits': {card.id: net_benefit_info},
-                'reasoning': reasoning
-            })
-    # Now, compute groups
-    for group in group_candidates:
-        if len(group) < 2:
-            continue
-        if len(group) > group_size:
-            continue
-        total_savings = 0
-        breakdown = []
-        total_spend = 0
-        covered_spend = 0
-        per_card_cashback = {card.id: 0 for card in group}
-        spend_to_best_card = {}
-        for spend in spending:
-            spend_amount = spend.get('amount', 0)
-            total_spend += spend_amount
-            best_saving = 0
-            best_card = None
-            best_cashback_percent = 0
-            for card in group:
-                matched_rule = get_best_cashback_rule(card, spend)
-                cashback_percent = matched_rule.cashback_percent if matched_rule and hasattr(matched_rule, 'cashback_percent') else 0
-                saving = round(spend_amount * cashback_percent / 100, 2)
-                if saving > best_saving:
-                    best_saving = saving
-                    best_card = card
-                    best_cashback_percent = cashback_percent
-            total_savings += best_saving
-            if best_card:
-                per_card_cashback[best_card.id] += best_saving
-                spend_to_best_card.setdefault(best_card.id, []).append(spend)
-            if best_saving > 0:
-                covered_spend += spend_amount
-            breakdown.append({
-                'spendEntry': spend,
-                'spendLabel': format_spend_label(spend),
-                'bestCardId': best_card.id if best_card else None,
-                'bestCardName': best_card.card_name if best_card else None,
-                'savings': best_saving,
-                'cashbackPercent': best_cashback_percent
-            })
-        group_cards = list(group)
-        # Only keep cards in group that actually contribute savings
-        cards_with_savings = [card for card in group_cards if per_card_cashback[card.id] > 0]
-        if len(cards_with_savings) == 0:
-            continue  # No card contributes, skip
-        if len(cards_with_savings) > group_size:
-            continue  # More than allowed contributing cards
-        # Check if group provides higher net benefit than any member alone
-        group_net_benefit = 0
-        card_net_benefits = {}
-        for card in cards_with_savings:
-            net_benefit_info = get_card_net_benefit(card, per_card_cashback[card.id])
-            card_net_benefits[card.id] = net_benefit_info
-            group_net_benefit += net_benefit_info['net_benefit']
-        max_individual = max([
-            r['netBenefit'] for r in individual_results if r['cards'][0] in cards_with_savings
-        ], default=0)
-        if group_net_benefit <= max_individual:
-            continue  # Only recommend group if it's strictly better
-        # Reasoning
-        reasoning = "Group these cards: together they cover different categories for better total savings than any card alone."
-        group_results.append({
-            'type': 'group',
-            'cards': list(cards_with_savings),
+        individual_net_benefits[i] = net_benefit_info['net_benefit']
+        individual_results.append({
+            'type': 'individual',
+            'cards': [card],
             'totalSavings': total_savings,
             'breakdown': breakdown,
-            'spendCoverage': round((covered_spend / total_spend) * 100, 2) if total_spend > 0 else 0.0,
-            'netBenefit': group_net_benefit,
-            'cardNetBenefits': card_net_benefits,
-            'reasoning': reasoning
+            'spendCoverage': round((float(card_covered[i]) / total_spend) * 100, 2) if total_spend > 0 else 0.0,
+            'netBenefit': net_benefit_info['net_benefit'],
+            'cardNetBenefits': {card.id: net_benefit_info},
+            'reasoning': "This card is among the best for at least one of your spends."
         })
+    metrics.phase_seconds.observe(time.perf_counter() - individual_started, phase='individual_scoring')
+
+    # Now, compute groups
+    group_results = []
+    if group_size >= 2:
+        search_started = time.perf_counter()
+        # Net benefit of each card apart from its cashback, used to bound the group search
+        fixed_benefits = [get_card_net_benefit(card, 0)['net_benefit'] for card in card_list]
+        ranked_individuals = sorted(individual_net_benefits.values(), reverse=True)
+        scoring_time = [0.0]
+
+        def score_group(members):
+            started = time.perf_counter()
+            try:
+                return _score_group(
+                    card_list, spending, spend_labels, amounts, total_spend,
+                    savings, cashback_percents, members, individual_net_benefits
+                )
+            finally:
+                scoring_time[0] += time.perf_counter() - started
+
+        stats = {}
+        group_results = find_top_groups(
+            savings, fixed_benefits, group_size, score_group,
+            top_n=5,
+            # A group ranked below five individual cards cannot make the top 5
+            floor=ranked_individuals[4] if len(ranked_individuals) >= 5 else 0.0,
+            stats=stats,
+        )
+        metrics.groups_scored_total.inc(stats['scored'])
+        metrics.groups_pruned_total.inc(stats['pruned'])
+        # Group scoring (per-card net benefits of each candidate) is part of the group search time
+        metrics.phase_seconds.observe(scoring_time[0], phase='group_scoring')
+        metrics.phase_seconds.observe(time.perf_counter() - search_started, phase='group_search')
     # Return both group and individual recommendations, sorted by netBenefit
     all_results = group_results + individual_results
     # Only skip cards/groups with netBenefit <= 0
     all_results = [r for r in all_results if r['netBenefit'] > 0]
     all_results.sort(key=lambda g: g['netBenefit'], reverse=True)
     # Always limit to top 5 results
-    return all_results[:5]
\ No newline at end of file
+    return all_results[:5]
+
+def _score_group(card_list, spending, spend_labels, amounts, total_spend,
+                 savings, cashback_percents, members, individual_net_benefits):
+    """
+    Scores one candidate group (a tuple of row indices into the savings matrix).
+    Each spend goes to the first member with the highest positive saving. Returns
+    (contributing_rows, result), or None when the group is not strictly better than its members alone.
+    """
+    members = list(members)
+    group_savings = savings[members]
+    best_savings = np.maximum(group_savings.max(axis=0), 0)
+    best_member = group_savings.argmax(axis=0)
+    has_best = best_savings > 0
+    per_card_cashback = [
+        float(_running_total(np.where(has_best & (best_member == k), best_savings, 0.0)))
+        for k in range(len(members))
+    ]
+    # Only keep cards in group that actually contribute savings
+    contributing = [k for k in range(len(members)) if per_card_cashback[k] > 0]
+    if not contributing:
+        return None
+    # Check if group provides higher net benefit than any member alone
+    group_net_benefit = 0
+    card_net_benefits = {}
+    for k in contributing:
+        card = card_list[members[k]]
+        net_benefit_info = get_card_net_benefit(card, per_card_cashback[k])
+        card_net_benefits[card.id] = net_benefit_info
+        group_net_benefit += net_benefit_info['net_benefit']
+    max_individual = max(
+        (individual_net_benefits[members[k]] for k in contributing if members[k] in individual_net_benefits),
+        default=0
+    )
+    if group_net_benefit <= max_individual:
+        return None  # Only recommend group if it's strictly better
+    breakdown = []
+    for j, spend in enumerate(spending):
+        best_card = card_list[members[best_member[j]]] if has_best[j] else None
+        breakdown.append({
+            'spendEntry': spend,
+            'spendLabel': spend_labels[j],
+            'bestCardId': best_card.id if best_card else None,
+            'bestCardName': best_card.card_name if best_card else None,
+            'savings': float(best_savings[j]),
+            'cashbackPercent': float(cashback_percents[members[best_member[j]], j]) if best_card else 0
+        })
+    covered_spend = float(_running_total(np.where(has_best, amounts, 0.0)))
+    return [members[k] for k in contributing], {
+        'type': 'group',
+        'cards': [card_list[members[k]] for k in contributing],
+        'totalSavings': float(_running_total(best_savings)),
+        'breakdown': breakdown,
+        'spendCoverage': round((covered_spend / total_spend) * 100, 2) if total_spend > 0 else 0.0,
+        'netBenefit': group_net_benefit,
+        'cardNetBenefits': card_net_benefits,
+        'reasoning': "Group these cards: together they cover different categories for better total savings than any card alone."
+    }
@@ -0,0 +1,35 @@
+"""
+Maintenance of CardValueSummary, the stored net-benefit components of each card.
+"""
+from .models import CardValueSummary, CreditCard
+from .utils import compute_card_benefit_components
+
+SUMMARY_FIELDS = ('annual_fee', 'welcome_benefits', 'milestone_bonuses', 'other_benefits')
+
+
+def refresh_card_value_summaries(card_ids=None):
+    """
+    Recomputes the stored components of the given cards (all cards by default).
+    Ids of cards that no longer exist are ignored. Returns the number of cards refreshed.
+    """
+    cards = CreditCard.objects.prefetch_related('welcome_benefits', 'milestone_bonuses', 'card_benefits')
+    if card_ids is not None:
+        cards = cards.filter(id__in=card_ids)
+    cards = list(cards)
+    existing = {
+        summary.card_id: summary
+        for summary in CardValueSummary.objects.filter(card__in=cards)
+    }
+    to_create, to_update = [], []
+    for card in cards:
+        components = compute_card_benefit_components(card)
+        summary = existing.get(card.id)
+        if summary is None:
+            to_create.append(CardValueSummary(card=card, **components))
+        elif any(getattr(summary, field) != components[field] for field in SUMMARY_FIELDS):
+            for field in SUMMARY_FIELDS:
+                setattr(summary, field, components[field])
+            to_update.append(summary)
+    CardValueSummary.objects.bulk_create(to_create)
+    CardValueSummary.objects.bulk_update(to_update, SUMMARY_FIELDS)
+    return len(cards)
@@ -1,11 +1,32 @@
+import csv
+from functools import cached_property
+
 from rest_framework import viewsets, filters
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.decorators import action, permission_classes
 from rest_framework.response import Response
+from django.conf import settings
 from django.db.models import Q
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import method_decorator
+from indiacard_backend.pagination import KeysetPagination
+from .advisor import advise_purchases
+from .catalog import card_field_relations, catalog_lookups, catalog_queryset
+from .conditional import catalog_conditional
+from .metrics import render_metrics
 from .models import CreditCard, PromotionalBanner
-from .serializers import CreditCardSerializer, PromotionalBannerSerializer, CardRecommendationInputSerializer, PurchaseAdvisorInputSerializer
-from .utils import get_top_card_groups
+from .serializers import (
+    CreditCardSerializer, PromotionalBannerSerializer, CardRecommendationInputSerializer,
+    BatchRecommendationInputSerializer, MerchantClassifyInputSerializer, PurchaseAdvisorInputSerializer,
+    StatementUploadSerializer, requested_card_fields
+)
+from .recommendations import (
+    build_batch_recommendations, build_recommendations, cache_recommendation, get_cached_recommendation,
+    get_recommendation_cache_stats, recommendation_cache_key
+)
+from .snapshot import get_catalog_snapshot
+from .merchants import get_merchant_classifier
+from .statements import StatementError, build_spending_from_statement
 from rest_framework.decorators import api_view
 from rest_framework import status
 from .formschema import get_form_schema
@@ -21,108 +42,127 @@ def recommend_cards(request):
     serializer.is_valid(raise_exception=True)
     spending = serializer.validated_data['spending']
     preferences = serializer.validated_data.get('preferences', {})
-    # Determine group size: use desiredCardCount from frontend, fallback to num_new_cards
-    num_new_cards = preferences.get('desiredCardCount', preferences.get('num_new_cards', 1))
-    cards = list(CreditCard.objects.all())
-
-    # Generate top groups of num_new_cards
-    group_results = get_top_card_groups(cards, spending, group_size=num_new_cards, max_groups=10)
-    groups = []
-    filtered_groups = []
-    seen_groups = set()
-    for group_result in group_results:
-        # Only include groups with strictly positive netBenefit
-        if group_result.get('netBenefit', 0) <= 0:
-            continue
-        group_cards = group_result['cards']
-        # ensure uniqueness: skip if same card ID set seen
-        card_ids = tuple(sorted(card.id for card in group_cards))
-        if card_ids in seen_groups:
-            continue
-        seen_groups.add(card_ids)
-        group_cards_serialized = []
-        for card in group_cards:
-            savings_breakdown = [
-                {
-                    'spendEntry': b['spendEntry'],
-                    'savings': b['savings'],
-                    'cashbackPercent': b['cashbackPercent'],
-                    'spendLabel': b.get('spendLabel') or format_spend_label(b['spendEntry'])
-                }
-                for b in group_result.get('breakdown', []) if b.get('bestCardId') == card.id
-            ]
-            total_spend = sum(b['spendEntry'].get('amount', 0) for b in group_result.get('breakdown', []))
-            covered_spend = sum(b['spendEntry'].get('amount', 0) for b in savings_breakdown)
-            if total_spend > 0:
-                coverage_percentage = round(covered_spend / total_spend * 100, 2)
-            else:
-                coverage_percentage = 0.0
-            group_cards_serialized.append({
-                'card': CreditCardSerializer(card).data,
-                'cardName': card.card_name,
-                'savingsBreakdown': [
-                    {
-                        **b,
-                        'category': b['spendEntry'].get('category', ''),
-                        'amount': b['spendEntry'].get('amount', 0)
-                    }
-                    for b in savings_breakdown
-                ],
-                'spendCoverage': coverage_percentage,
-                'netBenefit': group_result['cardNetBenefits'].get(card.id, {}).get('net_benefit', 0),
-                'totalMonthlySavings': sum((b['savings'] or 0) for b in savings_breakdown)
-            })
-        # Only include groups with at least one valuable card
-        if not group_cards_serialized:
-            continue
-        filtered_groups.append({
-            'cards': group_cards_serialized,
-            'totalGroupSavings': group_result.get('totalSavings', 0),
-            'spendCoverage': group_result.get('spendCoverage', 0),
-            'breakdown': group_result.get('breakdown', []),
-            'netBenefit': group_result.get('netBenefit', 0),
-            'cardNetBenefits': group_result.get('cardNetBenefits', {})
-        })
-    # Order by totalGroupSavings descending
-    groups = sorted(filtered_groups, key=lambda g: g['totalGroupSavings'], reverse=True)
-    # Do NOT pad the groups list to 10; just return as many as make sense (up to 10)
-    groups = groups[:10]
-
-    # Prepare spendToCardSavings as before
-    spend_to_card_savings = []
-    for idx, spend in enumerate(spending):
-        spend_entry = {
-            'spendEntryIndex': idx,
-            'category': spend.get('category', ''),
-            'amount': spend.get('amount', 0),
-            'cardSavings': []
+    num_new_cards = _group_size(preferences)
+    result = _recommend(get_catalog_snapshot(), spending, num_new_cards)
+    return Response(result, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def recommend_from_statement(request):
+    """
+    Recommend credit cards from an uploaded bank statement CSV (multipart field
+    'statement'). Debit rows are streamed, mapped to spending categories and
+    aggregated into monthly spends, which are returned with the recommendations.
+    """
+    serializer = StatementUploadSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    snapshot = get_catalog_snapshot()
+    upload = serializer.validated_data['statement']
+    try:
+        upload.seek(0)
+        spending, summary = build_spending_from_statement(upload.file, get_merchant_classifier(snapshot))
+    except (StatementError, csv.Error) as exc:
+        return Response({'statement': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+    finally:
+        upload.close()
+    if not spending:
+        return Response({'statement': ['The statement has no debit transactions.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    spending_serializer = CardRecommendationInputSerializer(data={'spending': spending})
+    spending_serializer.is_valid(raise_exception=True)
+    spending = spending_serializer.validated_data['spending']
+    result = _recommend(snapshot, spending, serializer.validated_data['desiredCardCount'])
+    return Response({'spending': spending, 'statementSummary': summary, **result}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def classify_merchants(request):
+    """
+    Map a list of merchant strings, as they appear on statements, onto the
+    catalog's category, subcategory, brand, platform and payment app names.
+    Results are returned in request order.
+    """
+    serializer = MerchantClassifyInputSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    merchants = serializer.validated_data['merchants']
+    classifier = get_merchant_classifier(get_catalog_snapshot())
+    results = [
+        {
+            'merchant': merchant,
+            'category': match.category,
+            'subcategory': match.subcategory,
+            'brand': match.brand,
+            'platform': match.platform,
+            'paymentApp': match.payment_app,
         }
-        for card in cards:
-            matched_rule = None
-            for rule in card.cashback_rules.all():
-                if rule.category and spend.get('category') and rule.category.lower() == spend.get('category').lower():
-                    matched_rule = rule
-                    break
-            if matched_rule and matched_rule.cashback_percent:
-                cashback_percent = matched_rule.cashback_percent
-            elif hasattr(card, 'default_cashback') and card.default_cashback and card.default_cashback.cashback_percent:
-                cashback_percent = card.default_cashback.cashback_percent
-            else:
-                cashback_percent = 0
-            savings = round(spend.get('amount', 0) * cashback_percent / 100, 2)
-            spend_entry['cardSavings'].append({
-                'cardId': card.id,
-                'cardName': card.card_name,
-                'savings': savings,
-                'cashbackPercent': cashback_percent
-            })
-        spend_to_card_savings.append(spend_entry)
-    return Response({
-        "recommendations": groups,
-        "spendToCardSavings": spend_to_card_savings
-    }, status=status.HTTP_200_OK)
+        for merchant, match in zip(merchants, classifier.classify_many(merchants))
+    ]
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+def _recommend(snapshot, spending, group_size):
+    # Serve a validated spending profile from the result cache, scoring it on a miss
+    cache_key = recommendation_cache_key(snapshot.version, spending, group_size)
+    result = get_cached_recommendation(cache_key)
+    if result is None:
+        result = build_recommendations(snapshot.cards, spending, group_size)
+        cache_recommendation(cache_key, result)
+    return result
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def recommend_cards_batch(request):
+    """
+    Recommend credit cards for a list of spending profiles, each shaped like the
+    /api/recommend/ payload. All profiles are scored against one catalog snapshot
+    and one savings computation; results are returned in request order.
+    """
+    serializer = BatchRecommendationInputSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    snapshot = get_catalog_snapshot()
+    profiles = [
+        (profile['spending'], _group_size(profile.get('preferences', {})))
+        for profile in serializer.validated_data['profiles']
+    ]
+    cache_keys = [recommendation_cache_key(snapshot.version, spending, group_size) for spending, group_size in profiles]
+    results = {}
+    for cache_key in cache_keys:
+        if cache_key not in results:
+            results[cache_key] = get_cached_recommendation(cache_key)
+    # Score each distinct uncached profile once
+    missing = {cache_key: profiles[i] for i, cache_key in enumerate(cache_keys) if results[cache_key] is None}
+    for cache_key, result in zip(missing, build_batch_recommendations(snapshot.cards, list(missing.values()))):
+        results[cache_key] = result
+        cache_recommendation(cache_key, result)
+    return Response({'results': [results[cache_key] for cache_key in cache_keys]}, status=status.HTTP_200_OK)
+
+
+def _group_size(preferences):
+    # Determine group size: use desiredCardCount from frontend, fallback to num_new_cards
+    return preferences.get('desiredCardCount', preferences.get('num_new_cards', 1))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def recommendation_cache_stats(request):
+    """
+    Hit/miss counters of this worker's recommendation result cache.
+    """
+    return Response(get_recommendation_cache_stats())
 
 
+def metrics(request):
+    """
+    Engine metrics in the Prometheus text format, for scrapers on METRICS_ALLOWED_IPS.
+    The client address is taken from REMOTE_ADDR, never from forwarded headers.
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
 @api_view(['GET'])
 def form_schema(request):
@@ -132,58 +172,69 @@ def form_schema(request):
         return Response({'detail': 'Form schema not found.'}, status=status.HTTP_404_NOT_FOUND)
     return Response(schema)
 
+@catalog_conditional
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def all_categories(request):
-    from .models import CashbackRule
-    categories = CashbackRule.objects.exclude(category__isnull=True).exclude(category__exact='').values_list('category', flat=True).distinct()
-    return Response(sorted(categories))
+    return Response(list(get_catalog_snapshot().categories))
 
+@catalog_conditional
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def subcategories(request):
-    from .models import CashbackRule
     category = request.query_params.get('category')
     if not category:
         return Response([], status=400)
-    subcategories = CashbackRule.objects.filter(category=category).exclude(subcategory__isnull=True).exclude(subcategory__exact='').values_list('subcategory', flat=True).distinct()
-    return Response(sorted(subcategories))
+    return Response(list(get_catalog_snapshot().subcategories(category)))
 
+@catalog_conditional
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def brands(request):
-    from .models import CashbackRule
     category = request.query_params.get('category')
     subcategory = request.query_params.get('subcategory')
-    queryset = CashbackRule.objects.all()
-    if category:
-        queryset = queryset.filter(category=category)
-    if subcategory:
-        queryset = queryset.filter(subcategory=subcategory)
-    brands = set()
-    for rule in queryset:
-        if rule.brand:
-            if isinstance(rule.brand, list):
-                brands.update(rule.brand)
-            else:
-                brands.add(rule.brand)
-    return Response(sorted(brands))
+    return Response(list(get_catalog_snapshot().brands(category, subcategory)))
 
+@method_decorator(catalog_conditional, name='dispatch')
 class CreditCardViewSet(viewsets.ModelViewSet):
+    # Full payloads come from the catalog snapshot, so get_queryset only loads the relations a
+    # ?fields= selection reads and lists cost a fixed number of queries
     queryset = CreditCard.objects.all()
     serializer_class = CreditCardSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['card_name', 'bank', 'card_type', 'network']
+    search_fields = ['card_name', 'bank__name', 'card_type', 'network']
     ordering_fields = ['annual_fee', 'effective_annual_fee', 'promotional_order']
+    ordering = ['promotional_order']
+    # Each ordering is backed by an (<field>, id) index
+    pagination_class = KeysetPagination
     permission_classes = [AllowAny]
-    
+
+    @cached_property
+    def card_fields(self):
+        # ?fields= / ?expand= selection; only the relations it reads are loaded
+        return requested_card_fields(self.request.query_params)
+
+    def get_queryset(self):
+        queryset = CreditCard.objects.all()
+        if not self.detail:
+            # Listings leave out discontinued cards; they stay reachable by id for the users holding them
+            queryset = queryset.exclude(status=0)
+        return catalog_queryset(queryset, relations=card_field_relations(self.card_fields))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['card_fields'] = self.card_fields
+        return context
 
     @action(detail=False, methods=['get'])
     def promotional_cards(self, request):
         """
         Returns all cards marked as promotional (for homepage/banner), ordered by promotional_order.
         """
-        queryset = CreditCard.objects.filter(promotional_card=True).order_by('promotional_order')
+        queryset = catalog_queryset(
+            CreditCard.objects.filter(promotional_card=True).exclude(status=0).order_by('promotional_order'),
+            relations=card_field_relations(self.card_fields),
+        )
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
@@ -192,8 +243,11 @@ class CreditCardViewSet(viewsets.ModelViewSet):
         """
         Returns all promotional banners with card details, ordered by 'order'.
         """
-        queryset = PromotionalBanner.objects.select_related('card').all().order_by('order')
-        serializer = PromotionalBannerSerializer(queryset, many=True)
+        select_related, prefetch_related = catalog_lookups('card', relations=card_field_relations(self.card_fields))
+        queryset = PromotionalBanner.objects.exclude(card__status=0).select_related(*select_related).prefetch_related(
+            *prefetch_related
+        ).order_by('order')
+        serializer = PromotionalBannerSerializer(queryset, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -273,7 +327,7 @@ class CreditCardViewSet(viewsets.ModelViewSet):
 
         queryset = self.get_queryset().filter(
             Q(card_name__icontains=query) |
-            Q(bank__icontains=query) |
+            Q(bank__name__icontains=query) |
             Q(card_type__icontains=query) |
             Q(network__icontains=query)
         )
@@ -284,64 +338,52 @@ class CreditCardViewSet(viewsets.ModelViewSet):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def purchase_advisor(request):
-    # Accepts a spending form entry (object) or a list of entries under 'spending'.
-    # Handles both legacy and new structure for compatibility.
-    spending_entries = []
-    owned_cards = []
-    if 'spending' in request.data and isinstance(request.data['spending'], list):
-        # New structure: spending is a list of dicts
-        spending_entries = request.data['spending']
-        owned_cards = request.data.get('owned_cards', [])
+    """
+    Ranks the user's cards for one or more purchases by the cashback each card earns.
+    Accepts a list of spend entries under 'purchases' (or the older 'spending'), or the
+    legacy flat single-purchase fields, plus 'owned_cards' ids. The legacy 'results'
+    key lists the options of the first purchase. Only 'purchases' entries must give an
+    amount; the older forms treat a missing one as 0, as they always did.
+    """
+    if isinstance(request.data.get('purchases'), list):
+        purchases = request.data['purchases']
     else:
-        # Legacy structure: flat keys
-        spending_entry = {
-            'amount': request.data.get('amount'),
-            'category': request.data.get('category'),
-            'subcategory': request.data.get('subcategory'),
-            'specificCategory': request.data.get('specificCategory'),
-            'brand': request.data.get('brand'),
-            'platform': request.data.get('platform'),
-            'platformName': request.data.get('platformName'),
-            'channel': request.data.get('channel'),
-            'payment_app': request.data.get('payment_app'),
-            'store_name': request.data.get('store_name'),
-            'purpose': request.data.get('purpose'),
-            'frequency': request.data.get('frequency'),
-            'transactionType': request.data.get('transactionType'),
+        if isinstance(request.data.get('spending'), list):
+            purchases = request.data['spending']
+        else:
+            # Legacy structure: flat keys
+            purchases = [{
+                'amount': request.data.get('amount'),
+                'category': request.data.get('category') or request.data.get('specificCategory'),
+                'subcategory': request.data.get('subcategory'),
+                'brand': request.data.get('brand'),
+                'platform': request.data.get('platform'),
+                'payment_app': request.data.get('payment_app'),
+                'purpose': request.data.get('purpose'),
+                'frequency': request.data.get('frequency'),
+            }]
+        purchases = [{**purchase, 'amount': purchase.get('amount') or 0} for purchase in purchases
+                     if isinstance(purchase, dict)]
+    serializer = PurchaseAdvisorInputSerializer(data={
+        'purchases': [{key: value for key, value in purchase.items() if value is not None} for purchase in purchases
+                      if isinstance(purchase, dict)],
+        'owned_cards': request.data.get('owned_cards', []),
+    })
+    serializer.is_valid(raise_exception=True)
+
+    cards_by_id = get_catalog_snapshot().cards_by_id
+    cards = [
+        cards_by_id[card_id] for card_id in dict.fromkeys(serializer.validated_data['owned_cards'])
+        if card_id in cards_by_id
+    ]
+    result = advise_purchases(cards, serializer.validated_data['purchases'])
+    result['results'] = [
+        {
+            'card': {'id': option['cardId'], 'card_name': option['cardName'], 'bank': option['bank']},
+            'cashbackRate': option['cashbackPercent'],
+            'cashbackAmount': option['cashbackAmount'],
+            'additional_conditions': option['additionalConditions'],
         }
-        spending_entries = [spending_entry]
-        owned_cards = request.data.get('owned_cards', [])
-
-    # Only process the first spending entry for now (single-purchase advisor)
-    entry = spending_entries[0]
-    amount = float(entry.get('amount', 0) or 0)
-    category = entry.get('category', '') or entry.get('specificCategory', '')
-    subcategory = entry.get('subcategory', '')
-    brand = entry.get('brand', '')
-    platform = entry.get('platform', '')
-    platform_name = entry.get('platformName', '')
-
-    cards = CreditCard.objects.filter(id__in=owned_cards)
-    results = []
-    for card in cards:
-        # Find the matching rule (category, subcategory, brand, platform, etc.)
-        matching = None
-        for cat_rule in getattr(card, 'categories', []):
-            if (
-                (cat_rule.category and cat_rule.category.lower() == (category or '').lower()) or
-                (subcategory and hasattr(cat_rule, 'subcategory') and cat_rule.subcategory and cat_rule.subcategory.lower() == subcategory.lower()) or
-                (brand and hasattr(cat_rule, 'brand') and cat_rule.brand and cat_rule.brand.lower() == brand.lower()) or
-                (platform and hasattr(cat_rule, 'platform') and cat_rule.platform and cat_rule.platform.lower() == platform.lower())
-            ):
-                matching = cat_rule
-                break
-        cashback_rate = getattr(matching, 'cashbackRate', 0) if matching else 0
-        if cashback_rate and cashback_rate > 0:
-            cashback_amount = amount * cashback_rate / 100
-            results.append({
-                'card': CreditCardSerializer(card).data,
-                'cashbackRate': cashback_rate,
-                'cashbackAmount': cashback_amount,
-                'additional_conditions': getattr(matching, 'additional_conditions', '') if matching else '',
-            })
-    return Response({'results': results})
+        for option in result['purchases'][0]['options']
+    ]
+    return Response(result)
@@ -0,0 +1,121 @@
+"""
+Keyset (cursor) pagination for long listings.
+
+DRF's CursorPagination positions its cursor on the first ordering field only and
+skips ties with an OFFSET. KeysetPagination makes the ordering unique by
+appending the primary key and puts the whole ordering tuple of the page's edge
+row in the cursor, so each page is one indexed range query, with no COUNT(*) and
+no OFFSET: deep pages cost the same as the first. Ordering fields must be
+non-null columns, ideally covered by a composite index ending in the primary key.
+"""
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+Cursor = namedtuple('Cursor', ['reverse', 'position'])
+
+
+class KeysetPagination(CursorPagination):
+    ordering = '-id'
+    unique_field = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            try:
+                queryset = queryset.filter(position_filter(ordering, self.cursor.position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # One extra row tells whether another page follows
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not any(field.lstrip('-') in (self.unique_field, 'pk') for field in ordering):
+            ordering += (self.unique_field,)
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.position_of(self.page[-1]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.position_of(self.page[0]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(reverse=True, position=position))
+
+    def position_of(self, instance):
+        return [str(getattr(instance, field.lstrip('-'))) for field in self.ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        position = tokens.get('p', [])
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {'p': cursor.position}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens, doseq=True).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def position_filter(ordering, position):
+    """
+    Returns a Q matching the rows that come after `position` (one value per field) in `ordering`.
+    The inclusive bound on the leading field lets the database seek an index; the rest breaks ties.
+    """
+    lookups = [(field.lstrip('-'), 'lt' if field.startswith('-') else 'gt') for field in ordering]
+    after = Q()
+    equal = {}
+    for (name, operator), value in zip(lookups, position):
+        after |= Q(**equal, **{f'{name}__{operator}': value})
+        equal[name] = value
+    name, operator = lookups[0]
+    return Q(**{f'{name}__{operator}e': position[0]}) & after
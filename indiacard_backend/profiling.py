@@ -0,0 +1,207 @@
+"""
+Opt-in, sampled per-request profiling.
+
+RequestProfilingMiddleware profiles a REQUEST_PROFILING_SAMPLE_RATE fraction of
+requests (0 disables it and removes the middleware). For a sampled request it
+records the number and duration of SQL queries, the time spent in the view,
+in serializing and in rendering, and returns them in a Server-Timing header.
+Serializing is timed by the serializers that build responses, through
+ProfiledSerializerMixin (or the serializer_timing context manager). The slowest REQUEST_PROFILING_SLOW_LOG_SIZE requests of each worker are
+kept with their query fingerprints and served to admins by slow_requests.
+"""
+import heapq
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+# Query fingerprints kept per slow request, most frequent first
+FINGERPRINTS_PER_REQUEST = 10
+
+_current_profile = ContextVar('request_profile', default=None)
+_slow_log = []  # min-heap of (duration, sequence, entry)
+_slow_log_lock = threading.Lock()
+_sequence = 0
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def fingerprint(sql):
+    """
+    Returns the shape of a query: literals become ? and IN lists collapse to IN (...).
+    """
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _LITERALS.sub('?', sql)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.view_started = None
+        self.view_ended = None
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.queries = {}  # fingerprint -> [count, seconds]
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.query_count += 1
+            self.sql_time += duration
+            stats = self.queries.setdefault(fingerprint(sql), [0, 0.0])
+            stats[0] += 1
+            stats[1] += duration
+
+
+class RequestProfilingMiddleware:
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0.0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        ended = time.perf_counter()
+        total = ended - profile.started
+        view = render = 0.0
+        if profile.view_started is not None:
+            view_ended = profile.view_ended or ended
+            view = view_ended - profile.view_started
+            render = ended - view_ended if profile.view_ended else 0.0
+        timings = [
+            ('db', profile.sql_time, f'{profile.query_count} queries'),
+            ('view', view, None),
+            ('serialize', profile.serializer_time, None),
+            ('render', render, None),
+            ('total', total, None),
+        ]
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.2f}' + (f';desc="{desc}"' if desc else '')
+            for name, duration, desc in timings
+        )
+        _record_slow_request(request, response, profile, total, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this hook, so the view has returned by now
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.view_ended = time.perf_counter()
+        return response
+
+
+def _record_slow_request(request, response, profile, total, timings):
+    global _sequence
+    size = getattr(settings, 'REQUEST_PROFILING_SLOW_LOG_SIZE', 50)
+    if size <= 0:
+        return
+    with _slow_log_lock:
+        if len(_slow_log) >= size and total <= _slow_log[0][0]:
+            return
+        _sequence += 1
+        queries = sorted(profile.queries.items(), key=lambda item: (-item[1][0], -item[1][1]))
+        entry = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'timestamp': time.time(),
+            'queryCount': profile.query_count,
+            'timings': {name: round(duration * 1000, 3) for name, duration, _ in timings},
+            'queries': [
+                {'fingerprint': sql, 'count': count, 'durationMs': round(seconds * 1000, 3)}
+                for sql, (count, seconds) in queries[:FINGERPRINTS_PER_REQUEST]
+            ],
+        }
+        if len(_slow_log) >= size:
+            heapq.heapreplace(_slow_log, (total, _sequence, entry))
+        else:
+            heapq.heappush(_slow_log, (total, _sequence, entry))
+
+
+def get_slow_requests():
+    """
+    Returns this worker's slowest profiled requests, slowest first.
+    """
+    with _slow_log_lock:
+        return [entry for _, _, entry in sorted(_slow_log, reverse=True)]
+
+
+def clear_slow_requests():
+    with _slow_log_lock:
+        _slow_log.clear()
+
+
+@contextmanager
+def serializer_timing():
+    """
+    Adds the time spent in the block to the sampled request's serialize timing.
+    Nested blocks count once, as part of the outermost.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serializer_depth -= 1
+        if not profile.serializer_depth:
+            profile.serializer_time += time.perf_counter() - started
+
+
+class ProfiledSerializerMixin:
+    """
+    Serializer mixin timing to_representation with serializer_timing. With many=True
+    each item is timed by the child serializer, so lists are covered too.
+    """
+
+    def to_representation(self, instance):
+        if _current_profile.get() is None:
+            return super().to_representation(instance)
+        with serializer_timing():
+            return super().to_representation(instance)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def slow_requests(request):
+    """
+    Slowest profiled requests of this worker, with their timings and query fingerprints.
+    """
+    return Response({
+        'sampleRate': getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0.0),
+        'requests': get_slow_requests(),
+    })
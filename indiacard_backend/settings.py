@@ -63,12 +63,23 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # orjson-backed JSON (see indiacard_backend.fastjson), compatible with DRF's own
+    'DEFAULT_RENDERER_CLASSES': [
+        'indiacard_backend.fastjson.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'indiacard_backend.fastjson.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 9,
 }
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'indiacard_backend.profiling.RequestProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -157,4 +168,51 @@ CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
 ]
 
+# Caches
+# The 'recommendations' cache holds /api/recommend/ results keyed by spending profile and
+# catalog version. locmem is per worker; to share results between workers switch it to
+# 'django.core.cache.backends.filebased.FileBasedCache' (LOCATION: a directory) or
+# 'django.core.cache.backends.db.DatabaseCache' (LOCATION: a table made by createcachetable).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+RECOMMENDATION_CACHE_ALIAS = 'recommendations'
+# Largest number of spending profiles accepted by /api/recommend/batch/
+RECOMMEND_BATCH_MAX_PROFILES = 100
+# Largest number of purchases accepted by /api/purchase-advisor/
+PURCHASE_ADVISOR_MAX_PURCHASES = 50
+# Largest number of merchant strings accepted by /api/merchants/classify/
+MERCHANT_CLASSIFY_MAX_ITEMS = 100000
+
+# Seconds between checks of the catalog version counter by each worker's in-memory catalog snapshot
+CATALOG_VERSION_CHECK_INTERVAL = 5
+# Part of the catalog ETags that changes with the response format; None derives it from the code
+# (see cards.conditional.etag_salt), a release id can be set instead
+CATALOG_ETAG_SALT = None
+# Cache-Control directives of the catalog read endpoints (cards, banners, vocabularies), by URL
+# name. Their GET responses carry catalog version ETags, so clients can revalidate cheaply.
+CATALOG_CACHE_CONTROL_DEFAULT = {'public': True, 'no_cache': True}
+CATALOG_CACHE_CONTROL = {
+    'creditcard-promotional-banners': {'public': True, 'max_age': 300},
+    'all-categories': {'public': True, 'max_age': 300},
+    'subcategories': {'public': True, 'max_age': 300},
+    'brands': {'public': True, 'max_age': 300},
+}
+
+# Client addresses allowed to scrape /api/metrics/
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Fraction of requests profiled by RequestProfilingMiddleware (0 disables it, 1 profiles everything)
+REQUEST_PROFILING_SAMPLE_RATE = 0.0
+# Slowest profiled requests kept per worker for /api/profiling/slow-requests/
+REQUEST_PROFILING_SLOW_LOG_SIZE = 50
+
 # REST Framework settings
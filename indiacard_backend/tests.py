@@ -0,0 +1,283 @@
+import io
+import json
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.models import UserActivity, UserCreditCard
+from cards.models import Bank, CardFilter, CreditCard, PromotionalBanner
+from cards.snapshot import get_catalog_snapshot, invalidate_catalog_snapshot
+from cards.synthetic import generate_catalog
+
+from .fastjson import ORJSONParser, ORJSONRenderer
+from .profiling import clear_slow_requests, fingerprint, get_slow_requests
+
+SPENDING = [
+    {'category': 'Shopping', 'subcategory': 'Online Shopping', 'brand': 'Amazon', 'amount': 5000},
+    {'category': 'Food Delivery', 'amount': 2000},
+    {'category': 'Travel', 'subcategory': 'Flights', 'amount': 10000},
+    {'category': 'Fuel', 'amount': 3000},
+]
+STATEMENT_CSV = '\n'.join(
+    ['Date,Description,Debit'] + [f'0{day % 9 + 1}/03/2025,UPI SWIGGY ORDER {day},{day * 10}.00' for day in range(200)]
+) + '\n'
+
+# Query and latency budget of every route, checked against the fixture catalog below.
+# Columns: method, path (formatted with the fixture ids), payload (a '{name}' string
+# value is replaced by that fixture id), who is calling
+# (None, 'user' or 'admin'), maximum queries, expected milliseconds.
+# Query counts are upper limits; a route only fails on time when it takes LATENCY_SLACK
+# times its expected milliseconds, so slow or busy machines do not fail the suite.
+# Routes served from the catalog snapshot are measured with a warm snapshot.
+# Routes run in order against the same data, so writes come after the reads and deletes last.
+ROUTE_BUDGETS = [
+    # cards
+    ('get', '/api/cards/', None, None, 1, 1000),
+    ('get', '/api/cards/{card}/', None, None, 1, 500),
+    ('get', '/api/cards/promotional_cards/', None, None, 1, 1000),
+    ('get', '/api/cards/promotional_banners/', None, None, 1, 1000),
+    ('get', '/api/cards/filter_cards/?min_cashback=2', None, None, 1, 1000),
+    ('get', '/api/cards/compare_cards/?cards={card_name}&cards={other_card_name}', None, None, 1, 500),
+    ('get', '/api/cards/search_cards/?q=Synthetic', None, None, 1, 1000),
+    ('get', '/api/form-schema/?name=spending_form', None, 'user', 0, 200),
+    ('post', '/api/recommend/', {'spending': SPENDING, 'preferences': {'desiredCardCount': 2}}, None, 0, 3000),
+    ('post', '/api/recommend/batch/', {'profiles': [{'spending': SPENDING}, {'spending': SPENDING[:2]}]},
+     None, 0, 3000),
+    ('post', '/api/recommend/statement/', {'statement': '{statement}', 'desiredCardCount': 2}, None, 0, 3000),
+    ('post', '/api/merchants/classify/', {'merchants': ['SWIGGY*BANGALORE', 'AMZN Mktp IN', 'UPI/PAYTM/12345']},
+     None, 0, 200),
+    ('get', '/api/recommend/cache-stats/', None, 'admin', 0, 200),
+    ('get', '/api/metrics/', None, None, 0, 200),
+    ('get', '/api/categories/', None, None, 0, 200),
+    ('get', '/api/subcategories/?category=Shopping', None, None, 0, 200),
+    ('get', '/api/brands/?category=Shopping', None, None, 0, 200),
+    ('post', '/api/purchase-advisor/', {'amount': 5000, 'category': 'Shopping', 'owned_cards': '{card_ids}'},
+     None, 0, 1000),
+    ('get', '/api/profiling/slow-requests/', None, 'admin', 0, 200),
+    ('post', '/api/cards/', {'card_name': 'New Card', 'bank_id': '{bank}', 'filters': '{filters}'}, 'admin', 14, 500),
+    ('put', '/api/cards/{spare_card}/', {'card_name': 'Renamed Card', 'bank_id': '{bank}', 'filters': '{filters}'},
+     'admin', 15, 500),
+    ('patch', '/api/cards/{spare_card}/', {'annual_fee': 999}, 'admin', 10, 500),
+    # accounts
+    ('get', '/api/accounts/users/', None, 'user', 2, 300),
+    ('get', '/api/accounts/users/{user}/', None, 'user', 1, 300),
+    ('post', '/api/accounts/users/register/', {'username': 'newuser', 'email': 'new@example.com',
+                                              'password': 'Secret123!', 'confirm_password': 'Secret123!'},
+     None, 4, 2000),
+    ('get', '/api/accounts/profiles/', None, 'user', 2, 300),
+    ('get', '/api/accounts/credit-cards/', None, 'user', 2, 1000),
+    ('get', '/api/accounts/credit-cards/{user_card}/', None, 'user', 1, 500),
+    ('get', '/api/accounts/preferences/', None, 'user', 3, 300),
+    ('get', '/api/accounts/activities/', None, 'user', 1, 1000),
+    ('get', '/api/accounts/activities/{activity}/', None, 'user', 1, 500),
+    ('post', '/api/accounts/users/change_password/', {'old_password': 'secret', 'new_password': 'Secret456!',
+                                                     'confirm_new_password': 'Secret456!'}, 'user', 1, 2000),
+    ('post', '/api/accounts/credit-cards/', {'credit_card': '{spare_card}', 'joining_date': '2024-02-01'},
+     'user', 3, 500),
+    ('put', '/api/accounts/credit-cards/{user_card}/', {'credit_card': '{card}', 'joining_date': '2024-03-01'},
+     'user', 4, 500),
+    ('patch', '/api/accounts/credit-cards/{user_card}/', {'notes': 'Travel card'}, 'user', 3, 500),
+    ('put', '/api/accounts/preferences/{preferences}/', {'max_annual_fee': 5000, 'preferred_banks': '{banks}'},
+     'user', 10, 300),
+    ('patch', '/api/accounts/preferences/{preferences}/', {'monthly_spend': 40000}, 'user', 6, 300),
+    ('put', '/api/accounts/profiles/{profile}/', {'city': 'Pune'}, 'user', 3, 300),
+    ('patch', '/api/accounts/profiles/{profile}/', {'city': 'Mumbai'}, 'user', 3, 300),
+    # Deleting a card cascades to its rules, benefits and the rest of its catalog rows
+    ('delete', '/api/cards/{spare_card}/', None, 'admin', 23, 500),
+    ('delete', '/api/accounts/credit-cards/{user_card}/', None, 'user', 3, 300),
+    ('delete', '/api/accounts/preferences/{preferences}/', None, 'user', 4, 300),
+    ('delete', '/api/accounts/profiles/{profile}/', None, 'user', 2, 300),
+]
+LATENCY_SLACK = 5
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_literals_and_in_lists_are_collapsed(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t1" WHERE "id" IN (%s, %s, %s) AND "name" = \'x\' LIMIT 21'),
+            'SELECT * FROM "t1" WHERE "id" IN (...) AND "name" = ? LIMIT ?',
+        )
+
+
+class FastJSONTests(TestCase):
+    def test_renderer_matches_drf(self):
+        data = {'amount': Decimal('1.50'), 'when': datetime(2025, 3, 1, 10, 30, tzinfo=timezone.utc),
+                'day': date(2025, 3, 1), 'names': ('Café', 'line\u2028break'), 'empty': None}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render({1: 'a'}), b'{"1":"a"}')
+
+    def test_renderer_differences_and_fallbacks(self):
+        # Exponents lose their plus sign but decode to the same value
+        self.assertEqual(ORJSONRenderer().render({'big': 1e16}), b'{"big":1e16}')
+        self.assertEqual(json.loads(ORJSONRenderer().render({'big': 1e16})), {'big': 1e16})
+        # Integers orjson cannot hold and non-finite floats are rendered by DRF
+        data = {'id': 2 ** 64, 'note': None}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        for value in (float('nan'), float('inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                ORJSONRenderer().render({'rate': value})
+
+    def test_parser(self):
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(b'{"amount": 1.5}')), {'amount': 1.5})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"amount": NaN}'))
+        response = self.client.post(reverse('recommend-cards'), '{"spending": [', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_recommend_response(self):
+        generate_catalog(banks=3, cards=10, rules=40, seed=1)
+        invalidate_catalog_snapshot()
+        response = self.client.post(reverse('recommend-cards'), {'spending': SPENDING}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+
+class ActivityPaginationTests(TestCase):
+    def test_pages_are_keyed_on_created_at_and_id(self):
+        user = get_user_model().objects.create_user('member', password='secret')
+        other = get_user_model().objects.create_user('other', password='secret')
+        activities = [UserActivity.objects.create(user=user, activity_type='profile_updated', description=str(i))
+                      for i in range(5)]
+        UserActivity.objects.create(user=other, activity_type='profile_updated', description='other')
+        # Two activities in the same instant are ordered by id
+        UserActivity.objects.filter(pk=activities[1].pk).update(created_at=activities[2].created_at)
+        client = APIClient()
+        client.force_authenticate(user)
+        url, seen = '/api/accounts/activities/?page_size=2', []
+        while url:
+            data = client.get(url).json()
+            seen += [activity['id'] for activity in data['results']]
+            url = data['next']
+        expected = sorted(UserActivity.objects.filter(user=user), key=lambda activity: activity.id)
+        expected.sort(key=lambda activity: activity.created_at, reverse=True)
+        self.assertEqual(seen, [activity.id for activity in expected])
+
+
+@override_settings(REQUEST_PROFILING_SAMPLE_RATE=1.0, REQUEST_PROFILING_SLOW_LOG_SIZE=2)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        clear_slow_requests()
+        bank = Bank.objects.create(name='Axis Bank')
+        for i in range(3):
+            CreditCard.objects.create(card_name=f'Card {i}', bank=bank)
+        self.client = APIClient()
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/cards/')
+        self.assertEqual(response.status_code, 200)
+        timing = dict(
+            (part.split(';')[0], part) for part in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timing), {'db', 'view', 'serialize', 'render', 'total'})
+        self.assertRegex(timing['db'], r'^db;dur=[\d.]+;desc="\d+ queries"$')
+        self.assertGreater(float(timing['serialize'].split('dur=')[1]), 0)
+
+    def test_slow_log_keeps_the_slowest_requests(self):
+        for _ in range(3):
+            self.client.get('/api/cards/')
+        self.client.get(reverse('all-categories'))
+        entries = get_slow_requests()
+        self.assertEqual(len(entries), 2)
+        self.assertGreaterEqual(entries[0]['timings']['total'], entries[1]['timings']['total'])
+        self.assertTrue(any(entry['queries'] for entry in entries))
+
+    def test_slow_requests_endpoint_is_admin_only(self):
+        url = reverse('profiling-slow-requests')
+        self.client.get('/api/cards/')
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+        admin = get_user_model().objects.create_user('admin', password='secret', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['sampleRate'], 1.0)
+        self.assertTrue(response.json()['requests'])
+
+
+@override_settings(CATALOG_VERSION_CHECK_INTERVAL=3600)
+class RouteBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cards = generate_catalog(banks=5, cards=30, rules=150, seed=3)
+        for order, card in enumerate(cards[:5]):
+            CreditCard.objects.filter(pk=card.pk).update(promotional_card=True, promotional_order=order)
+            PromotionalBanner.objects.create(title=f'Banner {order}', color='blue', card=card, order=order)
+        User = get_user_model()
+        cls.user = User.objects.create_user('member', password='secret')
+        cls.admin = User.objects.create_user('admin', password='secret', is_staff=True)
+        cls.user.preferences.preferred_banks.set(Bank.objects.all()[:3])
+        card_filter = CardFilter.objects.create(name='Cashback', slug='cashback')
+        for i, card in enumerate(cards[:9]):
+            user_card = UserCreditCard.objects.create(user=cls.user, credit_card=card, joining_date=date(2024, 1, 1),
+                                                      card_number_last4=f'{i:04d}')
+            activity = UserActivity.objects.create(user=cls.user, activity_type='card_added', credit_card=card,
+                                                   description=f'Added {card.card_name}')
+        cls.ids = {
+            'card': cards[0].pk,
+            'card_name': cards[0].card_name,
+            'other_card_name': cards[1].card_name,
+            'card_ids': [card.pk for card in cards[:10]],
+            'spare_card': cards[-1].pk,
+            'bank': cards[0].bank_id,
+            'banks': list(Bank.objects.values_list('pk', flat=True)[:2]),
+            'filters': [card_filter.pk],
+            'user': cls.user.pk,
+            'user_card': user_card.pk,
+            'activity': activity.pk,
+            'preferences': cls.user.preferences.pk,
+            'profile': cls.user.profile.pk,
+            'statement': lambda: SimpleUploadedFile('statement.csv', STATEMENT_CSV.encode(), content_type='text/csv'),
+        }
+
+    def setUp(self):
+        invalidate_catalog_snapshot()
+        get_catalog_snapshot()
+        caches['recommendations'].clear()
+
+    def test_route_budgets(self):
+        for method, path, payload, caller, max_queries, expected_ms in ROUTE_BUDGETS:
+            path = path.format(**self.ids)
+            if payload:
+                payload = {key: self.fill(value) for key, value in payload.items()}
+            with self.subTest(route=f'{method.upper()} {path}'):
+                client = APIClient()
+                if caller:
+                    client.force_authenticate(self.user if caller == 'user' else self.admin)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(path, payload, format=self.request_format(payload))
+                    elapsed = (time.perf_counter() - started) * 1000
+                self.assertLess(response.status_code, 300, response.content[:300])
+                self.assertLessEqual(len(queries), max_queries, self.describe_queries(queries))
+                self.assertLessEqual(elapsed, expected_ms * LATENCY_SLACK, f'{elapsed:.0f} ms, expected {expected_ms} ms')
+
+    def fill(self, value):
+        if isinstance(value, str) and value.startswith('{') and value.endswith('}'):
+            value = self.ids[value[1:-1]]
+            return value() if callable(value) else value
+        return value
+
+    def request_format(self, payload):
+        if payload and any(isinstance(value, SimpleUploadedFile) for value in payload.values()):
+            return 'multipart'
+        return 'json'
+
+    def describe_queries(self, queries):
+        # Show the repeated query shapes (the N+1 culprits), or every query when nothing repeats
+        fingerprints = Counter(fingerprint(query['sql']) for query in queries.captured_queries)
+        lines = [f'{count} x {sql}' for sql, count in fingerprints.most_common() if count > 1]
+        if not lines:
+            lines = [query['sql'] for query in queries.captured_queries]
+        return f'{len(queries)} queries:\n' + '\n'.join(lines)